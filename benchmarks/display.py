@@ -0,0 +1,89 @@
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("EPD_SIMULATOR", "1")
+sys.path.insert(0, os.getcwd())
+
+from PIL import Image, ImageDraw
+from libs.waveshare_epd import epd7in5b_HD, epdconfig
+
+
+def random_frame(epd, seed):
+    rng = random.Random(seed)
+    images = []
+    for _ in range(2):
+        image = Image.new("1", (epd.width, epd.height), 255)
+        draw = ImageDraw.Draw(image)
+        for _ in range(200):
+            x, y = rng.randrange(epd.width), rng.randrange(epd.height)
+            draw.rectangle([x, y, x + rng.randrange(40), y + rng.randrange(40)], fill=0)
+        images.append(image)
+    return images
+
+
+def modified_frame(images, rectangles):
+    modified = [image.copy() for image in images]
+    for color, rectangle in rectangles:
+        ImageDraw.Draw(modified[color]).rectangle(rectangle, fill=0)
+    return modified
+
+
+def check_ram(epd, simulator, black, red):
+    ram_black = simulator.get_ram(0x24, epd7in5b_HD.RAM_Y_START, epd.height)
+    ram_red = simulator.get_ram(0x26, epd7in5b_HD.RAM_Y_START, epd.height)
+    return ram_black == bytes(black) and ram_red == bytes(~b & 0xFF for b in red)
+
+
+def measure(simulator, function, *args):
+    spi_bytes = simulator.spi_bytes
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start, simulator.spi_bytes - spi_bytes
+
+
+def main():
+    simulator = epdconfig.implementation
+    if not isinstance(simulator, epdconfig.Simulator):
+        print("Simulated backend is required, set EPD_SIMULATOR=1")
+        return 1
+
+    epd = epd7in5b_HD.EPD()
+    epd.init()
+
+    frame = random_frame(epd, 1)
+    black, red = epd.getbuffer(frame[0]), epd.getbuffer(frame[1])
+    _, full_time, full_bytes = measure(simulator, epd.display, black, red)
+    ok = check_ram(epd, simulator, black, red)
+    print("full display:    {:7.2f} ms; {:7d} SPI bytes; RAM matches: {}".format(full_time*1000, full_bytes, ok))
+
+    cases = [
+        ("one cell", [(0, (203, 100, 290, 180))]),
+        ("tasklist", [(0, (661, 180, 879, 527)), (1, (670, 190, 700, 210))]),
+        ("scattered", [(0, (3, 3, 5, 5)), (1, (877, 500, 879, 527)), (0, (400, 260, 409, 261))]),
+    ]
+    for name, rectangles in cases:
+        new_frame = modified_frame(frame, rectangles)
+        new_black, new_red = epd.getbuffer(new_frame[0]), epd.getbuffer(new_frame[1])
+        regions, partial_time, partial_bytes = measure(
+            simulator, epd.display_partial, new_black, new_red, black, red)
+        matches = check_ram(epd, simulator, new_black, new_red)
+        ok = ok and matches
+        print("partial {:9s} {:7.2f} ms; {:7d} SPI bytes; {} regions; RAM matches: {}".format(
+            name + ":", partial_time*1000, partial_bytes, len(regions), matches))
+        frame, black, red = new_frame, new_black, new_red
+
+    # Full refresh after partial ones has to start from the restored window
+    frame = random_frame(epd, 2)
+    black, red = epd.getbuffer(frame[0]), epd.getbuffer(frame[1])
+    epd.display(black, red)
+    matches = check_ram(epd, simulator, black, red)
+    ok = ok and matches
+    print("full display after partial, RAM matches: {}".format(matches))
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("EPD_SIMULATOR", "1")
+sys.path.insert(0, os.getcwd())
+
+from PIL import Image
+from libs.waveshare_epd import epd7in5b_HD
+from calendarframe.CalendarFrameDraw import EInkDraw
+
+
+def getbuffer_reference(epd, image):
+    """
+    Original per-pixel implementation of EPD.getbuffer, used as the reference output
+    """
+    buf = [0xFF] * (int(epd.width/8) * epd.height)
+    image_monocolor = image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+    if imwidth == epd.width and imheight == epd.height:
+        for y in range(imheight):
+            for x in range(imwidth):
+                if pixels[x, y] == 0:
+                    buf[int((x + y * epd.width) / 8)] &= ~(0x80 >> (x % 8))
+    elif imwidth == epd.height and imheight == epd.width:
+        for y in range(imheight):
+            for x in range(imwidth):
+                newx = y
+                newy = epd.height - x - 1
+                if pixels[x, y] == 0:
+                    buf[int((newx + newy*epd.width) / 8)] &= ~(0x80 >> (y % 8))
+    return buf
+
+
+def random_image(size, seed):
+    rng = random.Random(seed)
+    image = Image.new("1", size, 255)
+    image.putdata([rng.choice((0, 255)) for _ in range(size[0]*size[1])])
+    return image
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    epd = epd7in5b_HD.EPD()
+
+    cases = [
+        ("horizontal", random_image((epd.width, epd.height), 1)),
+        ("vertical", random_image((epd.height, epd.width), 2)),
+        ("horizontal-L", random_image((epd.width, epd.height), 3).convert("L")),
+        ("invalid-size", random_image((epd.width//2, epd.height), 4)),
+    ]
+
+    failed = False
+    for name, image in cases:
+        reference, reference_time = timed(getbuffer_reference, epd, image)
+        packed, packed_time = timed(epd.getbuffer, image)
+        identical = bytes(reference) == bytes(packed)
+        failed = failed or not identical
+        print("{:14s} reference: {:8.1f} ms; packed: {:6.2f} ms; speedup: {:7.1f}x; identical: {}".format(
+            name,
+            reference_time*1000,
+            packed_time*1000,
+            reference_time/max(packed_time, 1e-9),
+            identical))
+
+    # Planes packed by EInkDraw, ready for display_packed - red plane is inverted while packing
+    for name, size in [("packed", (epd.width, epd.height)), ("packed-vert.", (epd.height, epd.width))]:
+        draw = EInkDraw(size, [0, 0])
+        for i, image in enumerate(draw.get_images()):
+            image.paste(random_image(size, 5 + i))
+        reference, reference_time = timed(
+            lambda: [epd.getbuffer(image) for image in draw.get_images()])
+        reference[1] = bytes(reference[1]).translate(epd7in5b_HD._INVERT)
+        packed, packed_time = timed(draw.get_packed_planes, (epd.width, epd.height))
+        identical = [bytes(plane) for plane in reference] == [bytes(plane) for plane in packed]
+        failed = failed or not identical
+        print("{:14s} getbuffer: {:8.2f} ms; packed: {:6.2f} ms; speedup: {:7.1f}x; identical: {}".format(
+            name,
+            reference_time*1000,
+            packed_time*1000,
+            reference_time/max(packed_time, 1e-9),
+            identical))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+"""
+Benchmark suite for the whole refresh path: ICS preload, calendar drawing, buffer conversion and panel upload.
+
+Run from the repository root:
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --baseline results.json --threshold 0.2
+
+With baseline, benchmarks slower than baseline by more than threshold are reported, and exit code is 1.
+"""
+import datetime
+import getopt
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("EPD_SIMULATOR", "1")
+sys.path.insert(0, os.getcwd())
+
+from dateutil import tz
+from PIL import Image, ImageDraw
+import calendarframe
+from calendarframe.IEventProvider import IEventProvider
+from libs.waveshare_epd import epd7in5b_HD, epdconfig
+
+# Synthetic events are placed around the reference. It has to be today, as tasklist always ends
+# tasklist_task_days after the current date.
+REFERENCE = datetime.datetime.now(tz=tz.tzlocal()).replace(hour=12, minute=0, second=0, microsecond=0)
+
+FEED_SIZES = [100, 1000, 10000, 100000]
+DRAW_WEEKS = [(1, 3), (2, 6), (4, 12)]
+DRAW_FEED_SIZE = 1000
+# Large panel showing a quarter of a year, for drawing week rows in parallel
+TILES_SIZE = (1600, 1200)
+TILES_WEEKS = (6, 7)
+DEFAULT_THRESHOLD = 0.2
+
+
+def usage():
+    print("python -m benchmarks.suite [options]")
+    print("  --output=FILE      save results as JSON")
+    print("  --baseline=FILE    compare with results saved earlier")
+    print("  --threshold=X      allowed slowdown against baseline, as a fraction (default: {})".format(
+        DEFAULT_THRESHOLD))
+    print("  --sizes=N,N,...    number of events in synthetic ICS feeds (default: {})".format(
+        ",".join(str(size) for size in FEED_SIZES)))
+    print("  --repeat=N         runs of each benchmark (default: 5, large feeds are run less)")
+    print("  --only=PREFIX      run only benchmarks with names starting with PREFIX")
+
+
+def synthetic_ics(count, seed=0):
+    """
+    ICS feed with count events around REFERENCE - one-time, all-day, multi-day and recurring (RRULE) ones
+    """
+    rng = random.Random(seed)
+    reference = REFERENCE.replace(tzinfo=None)
+    lines = [
+        "BEGIN:VCALENDAR",
+        "PRODID:-//WaveshareEInkCalendar//Benchmark//EN",
+        "VERSION:2.0",
+    ]
+    for i in range(count):
+        start = reference + datetime.timedelta(days=rng.randint(-365, 365), hours=rng.randint(-12, 10))
+        start = start.replace(minute=rng.choice((0, 15, 30, 45)), second=0)
+        kind = rng.random()
+        lines += [
+            "BEGIN:VEVENT",
+            "UID:benchmark-{}-{}@calendar".format(seed, i),
+            "DTSTAMP:20211201T000000Z",
+            "SUMMARY:Event {}".format(i),
+        ]
+        if kind < 0.15:
+            # All day, sometimes for a few days
+            lines += [
+                "DTSTART;VALUE=DATE:{}".format(start.strftime("%Y%m%d")),
+                "DTEND;VALUE=DATE:{}".format((start + datetime.timedelta(days=rng.choice((1, 1, 2, 3)))).strftime(
+                    "%Y%m%d")),
+            ]
+        else:
+            duration = datetime.timedelta(hours=rng.choice((1, 1, 2, 26, 50)))
+            lines += [
+                "DTSTART:{}".format(start.strftime("%Y%m%dT%H%M%S")),
+                "DTEND:{}".format((start + duration).strftime("%Y%m%dT%H%M%S")),
+            ]
+        if 0.15 <= kind < 0.35:
+            lines.append(rng.choice((
+                "RRULE:FREQ=WEEKLY;COUNT={}".format(rng.randint(5, 50)),
+                "RRULE:FREQ=DAILY;INTERVAL={};COUNT={}".format(rng.randint(1, 7), rng.randint(5, 30)),
+                "RRULE:FREQ=MONTHLY;BYMONTHDAY={}".format(start.day),
+                "RRULE:FREQ=YEARLY",
+            )))
+        lines.append("END:VEVENT")
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(lines) + "\r\n"
+
+
+class PreparsedEventProvider(IEventProvider):
+    def __init__(self, events):
+        """
+        Provider with already parsed events, so drawing is measured without parsing
+        """
+        IEventProvider.__init__(self)
+        self._parsed = events
+
+    def preload(self, date_from, date_to):
+        self._events = self._parsed
+        self._build_index(date_from, date_to)
+
+
+class Benchmarks:
+    def __init__(self, sizes, repeat, only):
+        self._sizes = sizes
+        self._repeat = repeat
+        self._only = only
+        self._directory = tempfile.mkdtemp(prefix="calendar-benchmark-")
+        self.results = {}
+
+    def close(self):
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+    def measure(self, name, function, repeat=None, setup=None):
+        """
+        Runs function repeatedly, and records median and minimum of wall and CPU time
+        """
+        if self._only and not name.startswith(self._only):
+            return None
+        if repeat is None:
+            repeat = self._repeat
+
+        wall = []
+        cpu = []
+        result = None
+        for _ in range(repeat):
+            if setup is not None:
+                setup()
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            result = function()
+            wall.append(time.perf_counter() - wall_start)
+            cpu.append(time.process_time() - cpu_start)
+
+        self.results[name] = {
+            "median": statistics.median(wall),
+            "min": min(wall),
+            "cpu_median": statistics.median(cpu),
+            "runs": repeat,
+        }
+        print("{:40s} {:10.2f} ms (min {:10.2f} ms, cpu {:10.2f} ms, {} runs)".format(
+            name,
+            statistics.median(wall)*1000,
+            min(wall)*1000,
+            statistics.median(cpu)*1000,
+            repeat))
+        return result
+
+    def feed(self, count):
+        path = os.path.join(self._directory, "feed-{}.ics".format(count))
+        if not os.path.exists(path):
+            with open(path, "w") as file:
+                file.write(synthetic_ics(count, seed=count))
+        return path
+
+    def window(self, config):
+        today = REFERENCE.date()
+        monday = today - datetime.timedelta(days=today.weekday())
+        date_from = monday - datetime.timedelta(weeks=config.calendar_weeks_past)
+        date_to = max(
+            monday + datetime.timedelta(weeks=config.calendar_weeks_future),
+            today + datetime.timedelta(days=config.tasklist_task_days))
+        return date_from, date_to
+
+    def run_preload(self):
+        date_from, date_to = self.window(calendarframe.Config())
+        for count in self._sizes:
+            path = self.feed(count)
+            # Large feeds take long to parse, one run is enough
+            repeat = self._repeat if count <= 1000 else 1
+            self.measure(
+                "preload/ics/{}".format(count),
+                lambda: calendarframe.EventProviderICS(file=path).preload(date_from, date_to),
+                repeat=repeat)
+
+    def run_draw(self):
+        for weeks_past, weeks_future in DRAW_WEEKS:
+            config = calendarframe.Config()
+            config.monochrome = True
+            config.calendar_weeks_past = weeks_past
+            config.calendar_weeks_future = weeks_future
+            config.cache_dir = os.path.join(self._directory, "cache-{}-{}".format(weeks_past, weeks_future))
+
+            date_from, date_to = self.window(config)
+            parser = calendarframe.EventProviderICS(file=self.feed(DRAW_FEED_SIZE))
+            parser.preload(date_from, date_to)
+            events = parser.get_all_events()
+
+            def draw():
+                calendar_draw = calendarframe.CalendarFrameDraw(
+                    [PreparsedEventProvider(events)],
+                    config,
+                    reference=REFERENCE)
+                return calendar_draw.draw()
+
+            config.calendar_cell_cache = False
+            self.measure("draw/weeks-{}-{}".format(weeks_past, weeks_future), draw)
+            config.calendar_cell_cache = True
+            draw()
+            self.measure("draw/weeks-{}-{}/cached-cells".format(weeks_past, weeks_future), draw)
+
+    def run_tiles(self):
+        config = calendarframe.Config()
+        config.monochrome = True
+        config.size = TILES_SIZE
+        config.calendar_size = (TILES_SIZE[0]*3//4, TILES_SIZE[1])
+        config.calendar_weeks_past, config.calendar_weeks_future = TILES_WEEKS
+        config.calendar_cell_cache = False
+        config.cache_dir = os.path.join(self._directory, "cache-tiles")
+
+        date_from, date_to = self.window(config)
+        parser = calendarframe.EventProviderICS(file=self.feed(DRAW_FEED_SIZE))
+        parser.preload(date_from, date_to)
+        events = parser.get_all_events()
+
+        def draw():
+            calendar_draw = calendarframe.CalendarFrameDraw(
+                [PreparsedEventProvider(events)],
+                config,
+                reference=REFERENCE)
+            return calendar_draw.draw()
+
+        # Powers of two up to the number of cores, and the number of cores
+        cores = os.cpu_count() or 1
+        workers = sorted({1, 2, cores} | {2**i for i in range(cores.bit_length()) if 2**i <= cores})
+        for count in workers:
+            config.calendar_render_workers = count
+            # Worker processes are started by the first draw
+            draw()
+            self.measure("draw/tiles/workers-{}".format(count), draw)
+
+    def run_buffers(self, epd):
+        rng = random.Random(1)
+        for name, size in [("horizontal", (epd.width, epd.height)), ("vertical", (epd.height, epd.width))]:
+            image = Image.new("1", size, 255)
+            draw = ImageDraw.Draw(image)
+            for _ in range(500):
+                x, y = rng.randrange(size[0]), rng.randrange(size[1])
+                draw.rectangle([x, y, x + rng.randrange(60), y + rng.randrange(20)], fill=0)
+            self.measure("getbuffer/{}".format(name), lambda: epd.getbuffer(image))
+
+    def run_display(self, epd):
+        simulator = epdconfig.implementation
+        black = epd.getbuffer(Image.effect_noise((epd.width, epd.height), 64).convert("1"))
+        red = epd.getbuffer(Image.effect_noise((epd.width, epd.height), 64).convert("1"))
+
+        def spi_bytes(function):
+            sent = simulator.spi_bytes
+            function()
+            return simulator.spi_bytes - sent
+
+        self.measure("display/full", lambda: epd.display(black, red))
+        if "display/full" in self.results:
+            self.results["display/full"]["spi_bytes"] = spi_bytes(lambda: epd.display(black, red))
+
+        # One calendar cell changed
+        changed = bytearray(black)
+        linewidth = epd.width // 8
+        for y in range(100, 180):
+            changed[y*linewidth + 25:y*linewidth + 36] = b"\x00" * 11
+        self.measure(
+            "display/partial-cell",
+            lambda: epd.display_partial(changed, red, black, red),
+            setup=lambda: epd.display(black, red))
+        if "display/partial-cell" in self.results:
+            self.results["display/partial-cell"]["spi_bytes"] = spi_bytes(
+                lambda: epd.display_partial(changed, red, black, red))
+
+    def run(self):
+        # Driver has to be initialized before planes are sent to the simulated panel
+        epd = epd7in5b_HD.EPD()
+        epd.init()
+
+        self.run_preload()
+        self.run_draw()
+        self.run_tiles()
+        self.run_buffers(epd)
+        self.run_display(epd)
+        return self.results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns names of benchmarks slower than baseline by more than threshold
+    """
+    regressions = []
+    print()
+    print("{:40s} {:>12s} {:>12s} {:>8s}".format("benchmark", "baseline", "current", "change"))
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        previous = baseline[name]["median"]
+        change = result["median"] / max(previous, 1e-9) - 1
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print("{:40s} {:9.2f} ms {:9.2f} ms {:+7.1%}{}".format(
+            name,
+            previous*1000,
+            result["median"]*1000,
+            change,
+            "  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main(argv):
+    output = None
+    baseline_path = None
+    threshold = DEFAULT_THRESHOLD
+    sizes = FEED_SIZES
+    repeat = 5
+    only = None
+    try:
+        opts, args = getopt.getopt(argv, "h", ["output=", "baseline=", "threshold=", "sizes=", "repeat=", "only="])
+    except getopt.GetoptError:
+        usage()
+        return 2
+    for opt, arg in opts:
+        if opt == "-h":
+            usage()
+            return 0
+        if opt in ["--output"]:
+            output = arg
+        if opt in ["--baseline"]:
+            baseline_path = arg
+        if opt in ["--threshold"]:
+            threshold = float(arg)
+        if opt in ["--sizes"]:
+            sizes = [int(size) for size in arg.split(",")]
+        if opt in ["--repeat"]:
+            repeat = max(1, int(arg))
+        if opt in ["--only"]:
+            only = arg
+
+    if not isinstance(epdconfig.implementation, epdconfig.Simulator):
+        print("Simulated backend is required, set EPD_SIMULATOR=1")
+        return 1
+
+    benchmarks = Benchmarks(sizes, repeat, only)
+    try:
+        results = benchmarks.run()
+    finally:
+        benchmarks.close()
+
+    if output is not None:
+        with open(output, "w") as file:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "results": results,
+            }, file, indent=2)
+
+    if baseline_path is not None:
+        with open(baseline_path, "r") as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, threshold)
+        if regressions:
+            print("{} benchmarks slower than baseline by more than {:.0%}".format(len(regressions), threshold))
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,278 @@
+import concurrent.futures
+import datetime
+import io
+import json
+import logging
+import os
+import time
+from dateutil import tz
+from PIL import Image
+from .CalendarFrameDraw import CalendarFrameDraw, Config, EventProviderAggregate
+from .IEventProvider import IEventProvider
+from .Metrics import Metrics
+from .ProviderRegistry import create_provider
+
+FORMAT_PNG = "png"
+FORMAT_PLANES = "planes"  # Packed planes, as sent to the display (see EInkDraw.get_packed_planes)
+
+# Providers preloaded by the batch, available in render processes, key -> PreloadedEventProvider
+_worker_providers = {}
+
+
+class BatchProfile:
+    def __init__(self, name, output, providers, config_overrides=None, output_format=FORMAT_PNG, panel_size=None):
+        """
+        Calendar rendered by BatchRenderer
+        :param output: Path of the rendered file, None if profile is only served by RenderServer
+        :param providers: List of (registry name, arguments) of event providers, as in main.EVENT_PROVIDERS
+        :param config_overrides: Config attribute -> value, applied on top of the default Config
+        :param output_format: FORMAT_PNG or FORMAT_PLANES
+        :param panel_size: Size of the display, planes are rotated if it's rotated in relation to the image
+        """
+        if output_format not in (FORMAT_PNG, FORMAT_PLANES):
+            raise ValueError("Unknown output format \"{}\" of profile \"{}\"".format(output_format, name))
+
+        self.name = name
+        self.output = output
+        self.providers = [(provider, dict(arguments)) for provider, arguments in providers]
+        self.config_overrides = dict(config_overrides or {})
+        self.output_format = output_format
+        self.panel_size = tuple(panel_size) if panel_size is not None else None
+
+    def create_config(self, cache_dir=None):
+        """
+        Returns Config with overrides applied. Planes need monochrome images, so they're monochrome by default.
+        Sizes and positions of calendar parts are not derived from an overridden size, they have to be set too.
+        :param cache_dir: Shared cache directory - unless overridden, profile keeps its cache in a subdirectory,
+               as profiles can be drawn at the same time
+        """
+        config = Config()
+        config.monochrome = self.output_format == FORMAT_PLANES
+        config.cache_dir = None if cache_dir is None else os.path.join(cache_dir, "profiles", self.name)
+        for key, value in self.config_overrides.items():
+            if key.startswith("_") or not hasattr(config, key):
+                raise ValueError("Unknown configuration option \"{}\" in profile \"{}\"".format(key, self.name))
+            setattr(config, key, self._convert(getattr(config, key), value))
+        return config
+
+    def get_provider_keys(self):
+        """
+        Returns keys identifying profile's providers - the same for providers with the same name and arguments
+        """
+        return [(name, json.dumps(arguments, sort_keys=True)) for name, arguments in self.providers]
+
+    @staticmethod
+    def _convert(default, value):
+        # JSON has only lists, while sizes, positions and colors are tuples
+        if isinstance(default, tuple) and isinstance(value, list):
+            return tuple(value)
+        if isinstance(default, list) and isinstance(value, list):
+            return [tuple(item) if isinstance(item, list) else item for item in value]
+        return value
+
+
+class BatchRenderer:
+    def __init__(self, profiles, config: Config = None, workers=None, reference=None, metrics: Metrics = None):
+        """
+        Renders multiple calendars at once. Event providers shared by profiles are preloaded only once,
+        and calendars are drawn in parallel processes.
+        :param profiles: List of BatchProfile, with unique names
+        :param config: Configuration of preloading and caches shared by all profiles
+        :param workers: Number of render processes, by default one per CPU
+        """
+        if config is None:
+            config = Config()
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError("Number of render workers should be positive")
+        if any(profile.output is None for profile in profiles):
+            raise ValueError("Output file of each profile has to be set")
+        names = [profile.name for profile in profiles]
+        if len(set(names)) != len(names):
+            raise ValueError("Profile names should be unique")
+        if reference is None:
+            reference = datetime.datetime.now(tz=tz.tzlocal())
+        if metrics is None:
+            metrics = Metrics()
+
+        self._profiles = profiles
+        self._config = config
+        self._workers = workers
+        self._reference = reference
+        self._metrics = metrics
+        self._logger = logging.getLogger("BatchRenderer")
+
+    @staticmethod
+    def load_profiles(path):
+        """
+        Loads profiles from JSON file - list of objects with keys: "name", "providers",
+        and optionally "output", "format", "config" and "panel_size"
+        """
+        with open(path, "r") as file:
+            data = json.load(file)
+        if not isinstance(data, list):
+            raise ValueError("Profile file should contain a list of profiles")
+
+        profiles = []
+        for item in data:
+            try:
+                profiles.append(BatchProfile(
+                    item["name"],
+                    item.get("output"),
+                    item["providers"],
+                    item.get("config"),
+                    item.get("format", FORMAT_PNG),
+                    item.get("panel_size")))
+            except (KeyError, TypeError) as e:
+                raise ValueError("Invalid profile {}: {}".format(item, e))
+        return profiles
+
+    def get_metrics(self):
+        return self._metrics
+
+    def render(self):
+        """
+        Preloads events and renders all profiles. Profiles that failed are logged and left out.
+        :return: Profile name -> path of the rendered file
+        """
+        if not self._profiles:
+            return {}
+        configs = {profile.name: profile.create_config(self._config.cache_dir) for profile in self._profiles}
+        providers, profile_keys = create_shared_providers(self._profiles, self._config.cache_dir)
+        self._logger.info("Rendering {} profiles with {} event providers".format(len(self._profiles), len(providers)))
+
+        # Events are loaded for all days needed by any of the profiles
+        today = self._reference.date()
+        ranges = [CalendarFrameDraw.get_date_range(config, today) for config in configs.values()]
+        date_from = min(date_range[0] for date_range in ranges)
+        date_to = max(date_range[1] for date_range in ranges)
+
+        self._logger.info("Preloading events from {} to {}...".format(date_from, date_to))
+        aggregate = EventProviderAggregate(
+            list(providers.values()),
+            self._config.preload_workers,
+            self._config.preload_timeout,
+            self._config.preload_deadline)
+        with self._metrics.phase("preload"):
+            result = aggregate.preload(date_from, date_to)
+        self._metrics.set("events", aggregate.get_event_count())
+        self._metrics.set("providers_failed", len(result.failed) + len(result.timed_out))
+
+        # Render processes get only preloaded events, not whole providers with their caches
+        preloaded = {
+            key: PreloadedEventProvider(provider, date_from, date_to)
+            for key, provider in providers.items() if provider in result.succeeded}
+
+        rendered = {}
+        failed = 0
+        with self._metrics.phase("render"):
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=min(self._workers, max(len(self._profiles), 1)),
+                    initializer=_initialize_worker,
+                    initargs=(preloaded,)) as executor:
+                futures = {}
+                for profile in self._profiles:
+                    keys = [key for key in profile_keys[profile.name] if key in preloaded]
+                    if len(keys) < len(profile_keys[profile.name]):
+                        self._logger.warning("Events from {} of {} providers of profile \"{}\" are missing".format(
+                            len(profile_keys[profile.name]) - len(keys),
+                            len(profile_keys[profile.name]),
+                            profile.name))
+                    if profile_keys[profile.name] and not keys:
+                        self._logger.error("Couldn't preload events for profile \"{}\"".format(profile.name))
+                        failed += 1
+                        continue
+                    futures[executor.submit(
+                        _render_profile, profile, configs[profile.name], keys, self._reference)] = profile
+
+                for future in concurrent.futures.as_completed(futures):
+                    profile = futures[future]
+                    try:
+                        seconds = future.result()
+                    except Exception:
+                        self._logger.exception("Rendering profile \"{}\" failed".format(profile.name))
+                        failed += 1
+                        continue
+                    self._logger.info("Rendered profile \"{}\" to {} in {:.2f}s".format(
+                        profile.name, profile.output, seconds))
+                    self._metrics.add_phase("render_profile", seconds)
+                    rendered[profile.name] = profile.output
+
+        self._metrics.set("profiles_rendered", len(rendered))
+        self._metrics.set("profiles_failed", failed)
+        return rendered
+
+
+class PreloadedEventProvider(IEventProvider):
+    def __init__(self, event_provider: IEventProvider, date_from, date_to):
+        """
+        Events of an already preloaded provider. Unlike the provider, it's not changed by the next preload,
+        and can be sent to render processes without provider's caches.
+        :param date_from: First day the provider was preloaded for, days from date_from to date_to are indexed
+        """
+        IEventProvider.__init__(self, event_provider._is_holiday_calendar, event_provider._week_holidays)
+        self._events = event_provider.get_all_events()
+        self._build_index(date_from, date_to)
+
+    def preload(self, date_from, date_to):
+        pass
+
+
+def create_shared_providers(profiles, cache_dir=None):
+    """
+    Creates providers of profiles, once for each name and arguments
+    :param cache_dir: Given to all providers, unless set in their arguments - local ICS files keep recurring events there
+    :return: Key -> provider, and profile name -> keys of its providers
+    """
+    providers = {}
+    profile_keys = {}
+    for profile in profiles:
+        for key, (name, arguments) in zip(profile.get_provider_keys(), profile.providers):
+            if key not in providers:
+                providers[key] = create_provider(name, **{"cache_dir": cache_dir, **arguments})
+        profile_keys[profile.name] = profile.get_provider_keys()
+    return providers, profile_keys
+
+
+def _initialize_worker(providers):
+    global _worker_providers
+    _worker_providers = providers
+
+
+def _render_profile(profile: BatchProfile, config: Config, keys, reference):
+    begin = time.perf_counter()
+    # Drawing monochrome images replaces colors in the config
+    colors = list(config.colors)
+    calendar_draw = CalendarFrameDraw([_worker_providers[key] for key in keys], config, reference)
+    calendar_draw.draw(preload=False)
+
+    if profile.output_format == FORMAT_PLANES:
+        data = b"".join(bytes(plane) for plane in calendar_draw.get_packed_planes(profile.panel_size))
+    else:
+        data = encode_png(calendar_draw.get_images(), colors)
+
+    # Write and rename, so readers never see a partial file
+    directory = os.path.dirname(profile.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(profile.output + ".tmp", "wb") as file:
+        file.write(data)
+    os.replace(profile.output + ".tmp", profile.output)
+    return time.perf_counter() - begin
+
+
+def encode_png(images, colors):
+    """
+    Returns drawn images as PNG file contents. Monochrome images are joined into one, first color drawn on top.
+    :param colors: Colors of monochrome images
+    """
+    image = images[0]
+    if len(images) > 1:
+        image = Image.new("RGB", images[0].size, (255, 255, 255))
+        for plane, color in reversed(list(zip(images, colors))):
+            image.paste(color, (0, 0), plane.convert("L").point(lambda value: 255 - value))
+
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
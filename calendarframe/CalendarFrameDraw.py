@@ -1,14 +1,36 @@
+import atexit
+import concurrent.futures
+import copy
 import datetime
+import hashlib
 import logging
+import math
+import multiprocessing
 import os
+import queue
+import threading
+import time
 from dateutil import tz
-from suntime import Sun
 from PIL import Image
 from PIL import ImageDraw
-from PIL import ImageFont
 from .DrawUtils import *
 
+from .CellCache import CellCache
+from .EventSnapshot import EventSnapshot, SnapshotEventProvider
 from .IEventProvider import IEventProvider
+from .Metrics import Metrics
+from .ResourceCache import ResourceCache
+from .SunTable import SunTable
+from .TextMetrics import TextMetrics
+
+# States of calendar day cells
+CELL_PAST = 0
+CELL_TODAY = 1
+CELL_MONTH = 2   # Future day in the current month
+CELL_FUTURE = 3
+
+# Increased when drawing of calendar cells changes, so cells cached by older versions aren't used
+_CELL_VERSION = 1
 
 
 class Config:
@@ -18,6 +40,17 @@ class Config:
         self.size = (880, 528)
         self.colors = [(0, 0, 0), (255, 0, 0)]
         self.monochrome = False
+        self.cache_dir = os.path.join(os.getcwd(), 'cache')  # Persistent state between runs
+        self.metrics_json = 'metrics.json'  # Timings of the last refresh, relative to cache_dir. None to disable
+        self.metrics_prometheus = None  # File for Prometheus textfile collector, e.g. ".../textfile_collector/calendar.prom"
+
+        self.preload_workers = 4      # How many event providers are preloaded at the same time
+        self.preload_timeout = 60     # Seconds for a single provider to load events
+        self.preload_deadline = 120   # Seconds for all providers to load events
+        self.event_snapshots = True   # Save preloaded events in cache_dir, to draw them when a provider fails
+        self.offline = False          # Draw events from snapshots only, without connecting to providers
+
+        self.daemon_refresh_interval = 15  # Minutes between loading events in daemon mode, unless provider has its own
 
         self.calendar_size = (self.size[0]*3//4, self.size[1])
         self.calendar_position = (0, 0)
@@ -34,6 +67,8 @@ class Config:
         self.calendar_weeks_future = 4    # How many weeks in the future should be drawn
         self.calendar_day_margin = 1
         self.calendar_weekend_margin = 7  # Distance between week and weekend columns
+        self.calendar_cell_cache = True   # Reuse day cells drawn in previous runs
+        self.calendar_render_workers = 1  # Processes drawing week rows of the calendar, 1 to draw them in this one
 
         self.today_size = (self.size[0]*1//4, self.size[1]*1//3)
         self.today_position = (self.size[0]*3//4, 0)
@@ -61,19 +96,207 @@ class Config:
         self.tasklist_event_long_icon_to = os.path.join(resources_dir, 'event_long_to.png')
 
 
+class PreloadResult:
+    def __init__(self):
+        """
+        Outcome of preloading events from multiple providers
+        """
+        self.succeeded = []
+        self.failed = {}     # provider -> exception
+        self.timed_out = []
+        self.durations = {}  # provider -> seconds
+        self.cpu_durations = {}  # provider -> CPU seconds of the preloading thread
+        self.from_snapshot = []  # providers replaced with events from their last snapshot
+
+    def is_success(self):
+        return len(self.failed) == 0 and len(self.timed_out) == 0
+
+
 class EventProviderAggregate(IEventProvider):
-    def __init__(self, event_providers):
+    # Providers being preloaded, including ones that didn't finish in time and were left running
+    _preloading = set()
+    _preloading_lock = threading.Lock()
+
+    def __init__(self, event_providers, workers=4, timeout=None, deadline=None, snapshot_dir=None, offline=False):
+        """
+        Joins events from multiple providers. Providers are preloaded concurrently.
+        :param workers: Maximum number of providers preloaded at the same time
+        :param timeout: Time limit in seconds for each provider's preload, counted from its start
+        :param deadline: Time limit in seconds for preloading all providers
+        :param snapshot_dir: Directory for snapshots of preloaded events, see EventSnapshot.
+               Events from the last snapshot are used in place of providers that failed or didn't finish in time.
+        :param offline: Use only events from snapshots, without preloading providers
+        """
         IEventProvider.__init__(self)
+        if workers < 1:
+            raise ValueError("Number of preload workers should be positive")
+        if offline and snapshot_dir is None:
+            raise ValueError("Offline mode needs a snapshot directory")
         self._event_providers = event_providers
+        self._active_providers = list(event_providers)
+        self._workers = workers
+        self._timeout = timeout
+        self._deadline = deadline
+        self._snapshot_dir = snapshot_dir
+        self._offline = offline
+        self._logger = logging.getLogger("EventProviderAggregate")
 
     def preload(self, date_from, date_to):
+        """
+        Preloads all providers. Failures of single providers don't raise, they're recorded in the result - providers
+        that failed or didn't finish in time are replaced with their snapshots, or left out of queries if there are
+        none. Providers still preloading since a previous call are not preloaded again, and are recorded as timed out.
+        Raises RuntimeError only if there are no events from any provider.
+        :return: PreloadResult
+        """
+        result = PreloadResult()
+        if not self._offline:
+            self._preload_providers(date_from, date_to, result)
+
+        replacements = {}
         for ep in self._event_providers:
-            ep.preload(date_from, date_to)
+            if ep in result.succeeded:
+                self._save_snapshot(ep, date_from, date_to)
+            else:
+                snapshot = self._load_snapshot(ep, date_from, date_to, result)
+                if snapshot is not None:
+                    replacements[ep] = snapshot
+                    result.from_snapshot.append(ep)
+
+        # Keep the original order of providers
+        self._active_providers = [
+            replacements.get(ep, ep) for ep in self._event_providers if ep in result.succeeded or ep in replacements]
+        if self._event_providers and not self._active_providers:
+            raise RuntimeError("Couldn't preload events from any of the providers")
+        return result
+
+    def _preload_providers(self, date_from, date_to, result: PreloadResult):
+        tasks = queue.Queue()
+        finished = queue.Queue()
+        started = {}
+
+        def worker():
+            while True:
+                try:
+                    ep = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                started[ep] = time.monotonic()
+                cpu = time.thread_time()
+                error = None
+                try:
+                    ep.preload(date_from, date_to)
+                except Exception as e:
+                    error = e
+                with self._preloading_lock:
+                    self._preloading.discard(ep)
+                finished.put((ep, time.monotonic() - started[ep], time.thread_time() - cpu, error))
+
+        def start_worker():
+            # Daemon threads, so a provider that hangs doesn't keep the application running
+            threading.Thread(target=worker, daemon=True).start()
+
+        # Thread left running on a provider would change its events while it's preloaded again
+        with self._preloading_lock:
+            busy = [ep for ep in self._event_providers if ep in self._preloading]
+            ready = [ep for ep in self._event_providers if ep not in self._preloading]
+            self._preloading.update(ready)
+        for ep in busy:
+            self._logger.error("Previous preload of events from {} is still running".format(type(ep).__name__))
+            result.timed_out.append(ep)
+            result.durations[ep] = 0.0
+
+        for ep in ready:
+            tasks.put(ep)
+        for i in range(min(self._workers, len(ready))):
+            start_worker()
+
+        begin = time.monotonic()
+        pending = list(ready)
+        while pending:
+            # Wait until the nearest timeout
+            limits = []
+            if self._deadline is not None:
+                limits.append(begin + self._deadline)
+            if self._timeout is not None:
+                limits += [started[ep] + self._timeout for ep in pending if ep in started]
+            wait = max(min(limits) - time.monotonic(), 0) if limits else None
+
+            try:
+                ep, duration, cpu_duration, error = finished.get(timeout=wait)
+                if ep in pending:
+                    pending.remove(ep)
+                    result.durations[ep] = duration
+                    result.cpu_durations[ep] = cpu_duration
+                    if error is None:
+                        result.succeeded.append(ep)
+                    else:
+                        self._logger.error("Failed to preload events from {}: {}".format(type(ep).__name__, error))
+                        result.failed[ep] = error
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            for ep in list(pending):
+                deadline_passed = self._deadline is not None and now >= begin + self._deadline
+                timeout_passed = self._timeout is not None and ep in started and now >= started[ep] + self._timeout
+                if deadline_passed or timeout_passed:
+                    self._logger.error("Preloading events from {} timed out".format(type(ep).__name__))
+                    pending.remove(ep)
+                    result.timed_out.append(ep)
+                    result.durations[ep] = now - started.get(ep, begin)
+                    if timeout_passed and not tasks.empty():
+                        # Replace the worker stuck on this provider
+                        start_worker()
+
+        # Providers that weren't started after the deadline aren't preloaded by the remaining workers
+        while True:
+            try:
+                ep = tasks.get_nowait()
+            except queue.Empty:
+                break
+            with self._preloading_lock:
+                self._preloading.discard(ep)
+
+    def _get_snapshot_path(self, ep):
+        if self._snapshot_dir is None or ep.get_source() is None:
+            return None
+        key = hashlib.sha1("{}:{}".format(type(ep).__name__, ep.get_source()).encode()).hexdigest()
+        return os.path.join(self._snapshot_dir, key + ".snapshot")
+
+    def _save_snapshot(self, ep, date_from, date_to):
+        path = self._get_snapshot_path(ep)
+        if path is None:
+            return
+        try:
+            EventSnapshot.save(path, ep.get_all_events(), date_from, date_to)
+        except OSError as e:
+            self._logger.warning("Couldn't save snapshot of events from {}: {}".format(type(ep).__name__, e))
+
+    def _load_snapshot(self, ep, date_from, date_to, result: PreloadResult):
+        path = self._get_snapshot_path(ep)
+        snapshot = None
+        try:
+            if path is None:
+                raise ValueError("Provider doesn't support snapshots")
+            snapshot = SnapshotEventProvider(ep, path)
+            snapshot.preload(date_from, date_to)
+            self._logger.info("Using events from {} saved at {}".format(
+                type(ep).__name__,
+                datetime.datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds")))
+            return snapshot
+        except (OSError, ValueError) as e:
+            if self._offline:
+                self._logger.error("Couldn't load snapshot of events from {}: {}".format(type(ep).__name__, e))
+                result.failed[ep] = e
+            elif path is not None:
+                self._logger.warning("Couldn't load snapshot of events from {}: {}".format(type(ep).__name__, e))
+            return None
 
     def get_events(self, date):
         events = []
 
-        for ep in self._event_providers:
+        for ep in self._active_providers:
             events = events + ep.get_events(date)
 
         return events
@@ -81,13 +304,16 @@ class EventProviderAggregate(IEventProvider):
     def get_all_day_events(self, date):
         events = []
 
-        for ep in self._event_providers:
+        for ep in self._active_providers:
             events = events + ep.get_all_day_events(date)
 
         return events
 
+    def get_event_count(self):
+        return sum(ep.get_event_count() for ep in self._active_providers)
+
     def is_holiday(self, date):
-        for ep in self._event_providers:
+        for ep in self._active_providers:
             if ep.is_holiday(date):
                 return True
 
@@ -172,9 +398,207 @@ class EInkDraw:
         for i in range(0, len(self._canvas)):
             self._canvas[i].paste(other._canvas[i], position)
 
+    def get_packed_planes(self, panel_size=None):
+        """
+        Returns images packed as display expects them: 1 bit per pixel, MSB first, rows padded to full bytes.
+        First plane has 0 for drawn pixels, other ones are inverted (1 for drawn pixels), as in the red plane
+        sent to Waveshare's tri-color displays.
+
+        :param panel_size: Size of the display - if images are rotated by 90 degrees in relation to it,
+               planes are rotated while packing. By default images are packed as they are.
+        :return: List of memoryviews, one per color
+        """
+        if not self._monochrome:
+            raise ValueError("Packed planes can only be created from monochrome images")
+
+        rotate = False
+        if panel_size is not None and tuple(panel_size) != self.get_size():
+            if tuple(panel_size) != self.get_size()[::-1]:
+                raise ValueError("Image size {} does not match the display size {}".format(self.get_size(), panel_size))
+            rotate = True
+
+        planes = []
+        for i, canvas in enumerate(self._canvas):
+            if rotate:
+                canvas = canvas.transpose(Image.ROTATE_90)
+            planes.append(memoryview(canvas.tobytes("raw", "1" if i == 0 else "1;I")))
+        return planes
+
+    def get_region(self, position, size):
+        """
+        Returns drawing context for part of the image - drawing is offset by position, and clipped to size
+        """
+        return EInkDrawRegion(self, position, size, (0, 0) + self.get_size())
+
+
+class ClippedImageDraw:
+    def __init__(self, canvas, draw, offset, clip):
+        """
+        ImageDraw replacement, that moves everything by offset, and doesn't draw outside of clip rectangle.
+        Primitives that fit in clip rectangle are drawn directly, other ones are drawn on a copy of the clipped part.
+        """
+        self._canvas = canvas
+        self._draw = draw
+        self._offset = offset
+        self._clip = clip
+
+    @property
+    def fontmode(self):
+        return self._draw.fontmode
+
+    def text(self, xy, text, fill=None, font=None, **kwargs):
+        bbox = self._draw.textbbox(xy, text, font=font, **kwargs)
+        # Bounding box of text drawn without antialiasing can differ by a pixel
+        bbox = (bbox[0]-1, bbox[1]-1, bbox[2]+1, bbox[3]+1)
+        self._apply("text", bbox, xy, text, fill=fill, font=font, **kwargs)
+
+    def bitmap(self, xy, bitmap, fill=None):
+        bbox = (xy[0], xy[1], xy[0]+bitmap.width, xy[1]+bitmap.height)
+        self._apply("bitmap", bbox, xy, bitmap, fill=fill)
+
+    def rectangle(self, xy, fill=None, outline=None, width=1):
+        points = self._points(xy)
+        bbox = (
+            min(x for x, y in points),
+            min(y for x, y in points),
+            max(x for x, y in points)+1,
+            max(y for x, y in points)+1)
+        self._apply("rectangle", bbox, xy, fill=fill, outline=outline, width=width)
+
+    def line(self, xy, fill=None, width=0, joint=None):
+        points = self._points(xy)
+        margin = max(width, 1)
+        bbox = (
+            math.floor(min(x for x, y in points))-margin,
+            math.floor(min(y for x, y in points))-margin,
+            math.ceil(max(x for x, y in points))+margin+1,
+            math.ceil(max(y for x, y in points))+margin+1)
+        self._apply("line", bbox, xy, fill=fill, width=width, joint=joint)
+
+    def _apply(self, primitive, bbox, xy, *args, **kwargs):
+        x0, y0 = bbox[0]+self._offset[0], bbox[1]+self._offset[1]
+        x1, y1 = bbox[2]+self._offset[0], bbox[3]+self._offset[1]
+
+        if x0 >= self._clip[0] and y0 >= self._clip[1] and x1 <= self._clip[2] and y1 <= self._clip[3]:
+            getattr(self._draw, primitive)(self._translate(xy, self._offset), *args, **kwargs)
+            return
+
+        box = (max(x0, self._clip[0]), max(y0, self._clip[1]), min(x1, self._clip[2]), min(y1, self._clip[3]))
+        if box[0] >= box[2] or box[1] >= box[3]:
+            return
+
+        part = self._canvas.crop(box)
+        draw = ImageDraw.Draw(part)
+        draw.fontmode = self._draw.fontmode
+        getattr(draw, primitive)(
+            self._translate(xy, (self._offset[0]-box[0], self._offset[1]-box[1])),
+            *args,
+            **kwargs)
+        self._canvas.paste(part, box)
+
+    @staticmethod
+    def _points(xy):
+        if isinstance(xy[0], (tuple, list)):
+            return [tuple(point) for point in xy]
+        return [(xy[i], xy[i+1]) for i in range(0, len(xy), 2)]
+
+    @staticmethod
+    def _translate(xy, offset):
+        if isinstance(xy[0], (tuple, list)):
+            return [(x+offset[0], y+offset[1]) for x, y in xy]
+        return tuple(value+offset[i % 2] for i, value in enumerate(xy))
+
+
+class EInkDrawRegion:
+    def __init__(self, parent: EInkDraw, position, size, clip):
+        """
+        Part of EInkDraw's images, with the same drawing interface. Created by EInkDraw.get_region.
+
+        :param parent: Drawn images
+        :param position: Position of region on images
+        :param size: Size of region
+        :param clip: Rectangle on images (x0, y0, x1, y1), outside which nothing is drawn
+        """
+        if len(position) != 2:
+            raise ValueError("Invalid position, expected two-value tuple")
+        if len(size) != 2 or size[0] < 1 or size[1] < 1:
+            raise ValueError("Invalid region size, expected two-value tuple of positive integers")
+
+        self._parent = parent
+        self._position = tuple(position)
+        self._size = tuple(size)
+        self._clip = (
+            max(clip[0], position[0]),
+            max(clip[1], position[1]),
+            min(clip[2], position[0]+size[0]),
+            min(clip[3], position[1]+size[1]))
+        self._draw = [
+            ClippedImageDraw(canvas, parent.get_image_draw(i), self._position, self._clip)
+            for i, canvas in enumerate(parent.get_images())]
+
+    def get_image_draw(self, color_id):
+        return self._draw[min(color_id, len(self._draw)-1)]
+
+    def get_color(self, color_id):
+        return self._parent.get_color(color_id)
+
+    def get_images(self):
+        """
+        Returns copy of region's part of images
+        """
+        box = self._position + (self._position[0]+self._size[0], self._position[1]+self._size[1])
+        return [canvas.crop(box) for canvas in self._parent.get_images()]
+
+    def get_size(self):
+        return self._size
+
+    def get_background_color(self):
+        return self._parent.get_background_color()
+
+    def get_region(self, position, size):
+        return EInkDrawRegion(
+            self._parent,
+            (self._position[0]+position[0], self._position[1]+position[1]),
+            size,
+            self._clip)
+
+    def clear(self):
+        for draw in self._draw:
+            draw.rectangle([(0, 0), self._size], fill=self.get_background_color())
+
+    def paste(self, images, position=(0, 0)):
+        """
+        Pastes images (one per parent's image, as returned by get_images) on the region
+        """
+        canvases = self._parent.get_images()
+        if len(images) != len(canvases):
+            raise ValueError("Number of images does not match number of drawn images")
+
+        x, y = self._position[0]+position[0], self._position[1]+position[1]
+        box = (
+            max(x, self._clip[0]),
+            max(y, self._clip[1]),
+            min(x+images[0].width, self._clip[2]),
+            min(y+images[0].height, self._clip[3]))
+        if box[0] >= box[2] or box[1] >= box[3]:
+            return
+
+        for canvas, image in zip(canvases, images):
+            canvas.paste(image.crop((box[0]-x, box[1]-y, box[2]-x, box[3]-y)), box[:2])
+
 
 class CalendarFrameDraw:
-    def __init__(self, event_providers, config: Config = None, reference=None):
+    _tile_executor = None
+    _tile_executor_workers = None
+    _tile_executor_lock = threading.Lock()
+
+    def __init__(
+            self,
+            event_providers,
+            config: Config = None,
+            reference=None,
+            resources: ResourceCache = None,
+            metrics: Metrics = None):
         if config is None:
             self._config = Config()
         else:
@@ -184,7 +608,27 @@ class CalendarFrameDraw:
             reference = datetime.datetime.now(tz=tz.tzlocal())
         self._reference = reference
 
-        self._event_provider = EventProviderAggregate(event_providers)
+        if resources is None:
+            resources = ResourceCache.shared()
+        self._resources = resources
+        self._text_metrics = TextMetrics.shared()
+
+        if metrics is None:
+            metrics = Metrics()
+        self._metrics = metrics
+
+        self._event_providers = list(event_providers)
+        snapshot_dir = None
+        if self._config.event_snapshots and self._config.cache_dir is not None:
+            snapshot_dir = os.path.join(self._config.cache_dir, "snapshots")
+        self._event_provider = EventProviderAggregate(
+            event_providers,
+            self._config.preload_workers,
+            self._config.preload_timeout,
+            self._config.preload_deadline,
+            snapshot_dir,
+            self._config.offline)
+        self._preload_result = None
         self._logger = logging.getLogger("CalendarFrameDraw")
 
         # Check configuration
@@ -204,43 +648,127 @@ class CalendarFrameDraw:
         self._logger.debug("Creating buffer: {}".format(self._config.size))
         self._draw = EInkDraw(self._config.size, self._config.colors, self._config.monochrome)
 
-    def draw(self):
+    @staticmethod
+    def get_date_range(config: Config, today):
+        """
+        Returns first and last day of events needed to draw the calendar
+        """
+        monday = today - datetime.timedelta(days=today.weekday())  # Monday, the true first day of the week
+        date_from = monday - datetime.timedelta(weeks=config.calendar_weeks_past)
+        date_to = max(
+            monday + datetime.timedelta(weeks=config.calendar_weeks_future),
+            today + datetime.timedelta(days=config.tasklist_task_days))
+        return date_from, date_to
+
+    def draw(self, preload=True):
+        """
+        :param preload: Preload events first. Can be skipped if providers were already preloaded for the calendar's
+               date range (see get_date_range), e.g. when they're shared by multiple calendars.
+        """
         # Calculate time span and preload events
         self._logger.info("Calculating calendar event range...")
         today = self._reference.date()
-        monday = today - datetime.timedelta(days=today.weekday())  # Monday, the true first day of the week
-        date_from = monday - datetime.timedelta(weeks=self._config.calendar_weeks_past)
-        date_to = max(
-            monday + datetime.timedelta(weeks=self._config.calendar_weeks_future),
-            today + datetime.timedelta(days=self._config.tasklist_task_days))
-        self._logger.debug("  Today: {}; Monday: {}".format(today, monday))
+        date_from, date_to = self.get_date_range(self._config, today)
+        self._logger.debug("  Today: {}".format(today))
         self._logger.debug("  From:  {}; To:     {}".format(date_from, date_to))
 
-        self._logger.info("Preloading events...")
-        self._event_provider.preload(date_from, date_to)
+        if preload:
+            self._logger.info("Preloading events...")
+            with self._metrics.phase("preload"):
+                self._preload_result = self._event_provider.preload(date_from, date_to)
+            self._record_preload(self._preload_result)
 
         # Draw calendar
         self._logger.info("Drawing calendar...")
-        draw = EInkDraw(self._config.calendar_size, self._config.colors, self._config.monochrome)
-        self._draw_calendar(draw)
-        self._draw.merge(draw, self._config.calendar_position)
+        with self._metrics.phase("calendar"):
+            draw = self._draw.get_region(self._config.calendar_position, self._config.calendar_size)
+            draw.clear()
+            self._draw_calendar(draw)
 
         # Draw today's information
         self._logger.info("Drawing today's information...")
-        draw = EInkDraw(self._config.today_size, self._config.colors, self._config.monochrome)
-        self._draw_today(draw)
-        self._draw.merge(draw, self._config.today_position)
+        with self._metrics.phase("today"):
+            draw = self._draw.get_region(self._config.today_position, self._config.today_size)
+            draw.clear()
+            self._draw_today(draw)
 
         # Draw tasklist
         self._logger.info("Drawing tasklist...")
-        draw = EInkDraw(self._config.tasklist_size, self._config.colors, self._config.monochrome)
-        self._draw_tasklist(draw)
-        self._draw.merge(draw, self._config.tasklist_position)
+        with self._metrics.phase("tasklist"):
+            draw = self._draw.get_region(self._config.tasklist_position, self._config.tasklist_size)
+            draw.clear()
+            self._draw_tasklist(draw)
 
         self._logger.info("Drawing finished")
         return self._draw.get_images()
 
-    def _draw_calendar(self, draw: EInkDraw):
+    def get_images(self):
+        return self._draw.get_images()
+
+    def get_packed_planes(self, panel_size=None):
+        """
+        Returns drawn images as planes ready to be sent to the display, see EInkDraw.get_packed_planes
+        """
+        return self._draw.get_packed_planes(panel_size)
+
+    def get_preload_result(self):
+        return self._preload_result
+
+    def get_metrics(self):
+        return self._metrics
+
+    def _record_preload(self, result: PreloadResult):
+        names = {}
+        for ep in self._event_providers:
+            # Providers of the same type are numbered in the order they were given
+            name = type(ep).__name__
+            names[name] = names.get(name, -1) + 1
+            name = "{}#{}".format(name, names[name])
+
+            # Providers replaced with snapshots have failed or timed out too
+            if ep in result.from_snapshot:
+                status = "snapshot"
+            elif ep in result.failed:
+                status = "failed"
+            elif ep in result.timed_out:
+                status = "timed_out"
+            else:
+                status = "succeeded"
+            duration = result.durations.get(ep, 0.0)
+            self._logger.debug("  {}: {:.2f}s, {}".format(name, duration, status))
+            self._metrics.add_provider(name, duration, result.cpu_durations.get(ep, 0.0), status)
+
+        self._metrics.set("events", self._event_provider.get_event_count())
+        self._metrics.set("providers_failed", len([
+            ep for ep in list(result.failed) + result.timed_out if ep not in result.from_snapshot]))
+        self._metrics.set("providers_from_snapshot", len(result.from_snapshot))
+
+    def warm_up(self):
+        """
+        Loads all fonts and icons used for drawing
+        """
+        self._resources.warm_up(
+            [
+                (self._config.calendar_font_date_bold, self._config.calendar_font_size),
+                (self._config.calendar_font_date_thin, self._config.calendar_font_size),
+                (self._config.calendar_font_event_count, self._config.calendar_font_size),
+                (self._config.today_font, self._config.today_date_font_size),
+                (self._config.today_font, self._config.today_sunrise_font_size),
+                (self._config.tasklist_font_header, self._config.tasklist_font_size_header),
+                (self._config.tasklist_font_event, self._config.tasklist_font_size_event),
+            ],
+            [
+                self._config.calendar_event_icon,
+                self._config.calendar_event_allday_icon,
+                self._config.today_sunrise_icon,
+                self._config.tasklist_highlight_icon_today,
+                self._config.tasklist_highlight_icon_upcoming,
+                self._config.tasklist_event_long_icon_from,
+                self._config.tasklist_event_long_icon_through,
+                self._config.tasklist_event_long_icon_to,
+            ])
+
+    def _draw_calendar(self, draw: EInkDrawRegion):
         self._logger.info("Calculating calendar range...")
 
         today = self._reference.date()
@@ -267,46 +795,199 @@ class CalendarFrameDraw:
                 )//week_span -
                 self._config.calendar_day_margin
             )
-        # Draw each grid item on separate image to make sure there is no overflow
-        draw_day = EInkDraw(day_size, self._config.colors, self._config.monochrome)
+        font_date_bold = self._resources.get_font(self._config.calendar_font_date_bold, self._config.calendar_font_size)
+        font_date_thin = self._resources.get_font(self._config.calendar_font_date_thin, self._config.calendar_font_size)
+        font_event_count = self._resources.get_font(
+            self._config.calendar_font_event_count,
+            self._config.calendar_font_size)
+        icon_event = self._resources.get_icon(self._config.calendar_event_icon)
+        icon_event_all_day = self._resources.get_icon(self._config.calendar_event_allday_icon)
 
-        font_date_bold = ImageFont.truetype(self._config.calendar_font_date_bold, self._config.calendar_font_size)
-        font_date_thin = ImageFont.truetype(self._config.calendar_font_date_thin, self._config.calendar_font_size)
-        font_event_count = ImageFont.truetype(self._config.calendar_font_event_count, self._config.calendar_font_size)
-        icon_event = Image.open(self._config.calendar_event_icon).convert("1")
-        icon_event_all_day = Image.open(self._config.calendar_event_allday_icon).convert("1")
+        cell_cache = self._get_cell_cache(day_size)
 
+        cells = []  # (position, cell) of each day
         date = date_from
         while date < date_to:
-            for i in range(len(draw_day.get_images())):
-                draw_day.get_image_draw(i).rectangle([(0, 0), draw_day.get_size()], fill=draw.get_background_color())
+            position = (
+                self._config.calendar_padding[3] +
+                date.weekday()*(day_size[0]-1+self._config.calendar_day_margin) +
+                (self._config.calendar_weekend_margin if date.weekday() >= 5 else 0),
 
+                self._config.calendar_padding[0] +
+                (date - date_from).days // 7 * (day_size[1]+self._config.calendar_day_margin)
+            )
+            cells.append((position, self._get_calendar_day_cell(date)))
+            date = date + datetime.timedelta(days=1)
+
+        tiles = {}
+        if self._config.calendar_render_workers > 1:
+            tiles = self._draw_calendar_tiles(
+                draw.get_size()[0],
+                day_size,
+                [(position, cell) for position, cell in cells if cell_cache is None or cell not in cell_cache])
+
+        for position, cell in cells:
+            # Each grid item is drawn in its own region, to make sure there is no overflow
+            draw_day = draw.get_region(position, day_size)
+
+            images = cell_cache.get(cell) if cell_cache is not None else None
+            if images is None:
+                images = tiles.get(cell)
+                if images is not None and cell_cache is not None:
+                    cell_cache.put(cell, images)
+            if images is not None:
+                draw_day.paste(images)
+            else:
+                draw_day.clear()
+                self._draw_calendar_day(
+                    draw_day,
+                    cell,
+                    font_date_bold,
+                    font_date_thin,
+                    font_event_count,
+                    icon_event,
+                    icon_event_all_day
+                )
+                if cell_cache is not None:
+                    cell_cache.put(cell, draw_day.get_images())
+
+        if cell_cache is not None:
+            cell_cache.save()
+
+    def _draw_calendar_tiles(self, width, day_size, cells):
+        """
+        Draws cells in worker processes, each week row as a separate tile. Returns cell -> images.
+        :param cells: List of (position, cell), cells appearing more than once are drawn once
+        """
+        rows = {}  # y -> [(x, cell)]
+        drawn = set()
+        for position, cell in cells:
+            if cell not in drawn:
+                drawn.add(cell)
+                rows.setdefault(position[1], []).append((position[0], cell))
+        if len(rows) < 2:
+            return {}
+
+        # Workers draw on canvas of a single row
+        config = copy.copy(self._config)
+        config.size = (width, day_size[1])
+        executor = self._get_tile_executor(self._config.calendar_render_workers)
+        futures = [executor.submit(_draw_calendar_tile, config, day_size, row) for row in rows.values()]
+
+        tiles = {}
+        for future, row in zip(futures, rows.values()):
+            for (x, cell), images in zip(row, future.result()):
+                tiles[cell] = images
+        return tiles
+
+    def _draw_calendar_row(self, day_size, row):
+        font_date_bold = self._resources.get_font(self._config.calendar_font_date_bold, self._config.calendar_font_size)
+        font_date_thin = self._resources.get_font(self._config.calendar_font_date_thin, self._config.calendar_font_size)
+        font_event_count = self._resources.get_font(
+            self._config.calendar_font_event_count,
+            self._config.calendar_font_size)
+        icon_event = self._resources.get_icon(self._config.calendar_event_icon)
+        icon_event_all_day = self._resources.get_icon(self._config.calendar_event_allday_icon)
+
+        images = []
+        for x, cell in row:
+            draw_day = self._draw.get_region((x, 0), day_size)
+            draw_day.clear()
             self._draw_calendar_day(
                 draw_day,
-                date,
+                cell,
                 font_date_bold,
                 font_date_thin,
                 font_event_count,
                 icon_event,
                 icon_event_all_day
             )
-            draw.merge(
-                draw_day,
-                (
-                    self._config.calendar_padding[3] +
-                    date.weekday()*(day_size[0]-1+self._config.calendar_day_margin) +
-                    (self._config.calendar_weekend_margin if date.weekday() >= 5 else 0),
-
-                    self._config.calendar_padding[0] +
-                    (date - date_from).days // 7 * (day_size[1]+self._config.calendar_day_margin)
-                )
-            )
-            date = date + datetime.timedelta(days=1)
+            images.append(draw_day.get_images())
+        return images
+
+    @classmethod
+    def _get_tile_executor(cls, workers):
+        # Worker processes are kept between draws, with fonts and icons they loaded.
+        # They aren't forked from this process, which can have preloading threads still running.
+        with cls._tile_executor_lock:
+            if cls._tile_executor is None or cls._tile_executor_workers != workers:
+                if cls._tile_executor is None:
+                    atexit.register(cls._shutdown_tile_executor)
+                else:
+                    cls._tile_executor.shutdown(wait=False)
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                cls._tile_executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context(method))
+                cls._tile_executor_workers = workers
+            return cls._tile_executor
+
+    @classmethod
+    def _shutdown_tile_executor(cls):
+        with cls._tile_executor_lock:
+            if cls._tile_executor is not None:
+                cls._tile_executor.shutdown()
+                cls._tile_executor = None
+                cls._tile_executor_workers = None
+
+    def _get_calendar_day_cell(self, date):
+        """
+        Everything that affects how the day is drawn in the calendar:
+        (day of month, state - past/today/month/future, is holiday, number of all day events, number of events)
+        """
+        if date < self._reference.date():
+            state = CELL_PAST
+        elif date == self._reference.date():
+            state = CELL_TODAY
+        elif date.month == self._reference.month:
+            state = CELL_MONTH
+        else:
+            state = CELL_FUTURE
+
+        return (
+            date.day,
+            state,
+            self._event_provider.is_holiday(date),
+            len(self._event_provider.get_all_day_events(date)),
+            len(self._event_provider.get_events(date)),
+        )
+
+    def _get_cell_cache(self, day_size):
+        if not self._config.calendar_cell_cache:
+            return None
+
+        # Cached cells are valid as long as the settings and resources used to draw them are the same
+        resources = [
+            self._config.calendar_font_date_bold,
+            self._config.calendar_font_date_thin,
+            self._config.calendar_font_event_count,
+            self._config.calendar_event_icon,
+            self._config.calendar_event_allday_icon,
+        ]
+        fingerprint = (
+            _CELL_VERSION,
+            day_size,
+            len(self._config.colors),
+            tuple(self._draw.get_color(i) for i in range(len(self._config.colors))),
+            self._config.monochrome,
+            self._config.calendar_font_size,
+            self._config.calendar_date_position,
+            self._config.calendar_events_margin_left,
+            tuple((path, os.path.getmtime(path)) for path in resources),
+        )
+
+        # Each settings have their own file, so profiles drawn in turns don't discard cells of each other
+        path = None
+        if self._config.cache_dir is not None:
+            path = os.path.join(
+                self._config.cache_dir,
+                "calendar_cells.{}.pickle".format(hashlib.sha1(repr(fingerprint).encode()).hexdigest()[:16]))
+        return CellCache(path, fingerprint)
 
     def _draw_calendar_day(
             self,
-            draw: EInkDraw,
-            date,
+            draw: EInkDrawRegion,
+            cell,
             font_date_bold,
             font_date_thin,
             font_event_count,
@@ -315,22 +996,24 @@ class CalendarFrameDraw:
         #
         # Preparation
         #
+        day, state, is_holiday, events_all_day, events = cell
+
         border_width = 1
         font = font_date_thin
-        if date == self._reference.date():
+        if state == CELL_TODAY:
             border_width = 4
             font = font_date_bold
-        elif date > self._reference.date() and date.month == self._reference.month:
+        elif state == CELL_MONTH:
             border_width = 2
             font = font_date_bold
         else:
             pass
 
-        is_holiday = 1 if self._event_provider.is_holiday(date) else 0
+        is_holiday = 1 if is_holiday else 0
         #
         # Border
         #
-        if date < self._reference.date():
+        if state == CELL_PAST:
             draw_rectangle_dashed(
                 draw.get_image_draw(is_holiday),
                 [
@@ -357,8 +1040,8 @@ class CalendarFrameDraw:
         #
         # Number
         #
-        message = "{}".format(date.day)
-        size = font.getsize(message)
+        message = "{}".format(day)
+        size = self._text_metrics.get_size(font, message)
         draw.get_image_draw(is_holiday).text(
             (self._config.calendar_date_position[0]+border_width, self._config.calendar_date_position[1]),
             message,
@@ -368,14 +1051,11 @@ class CalendarFrameDraw:
         #
         # Number of events
         #
-        events = self._event_provider.get_events(date)
-        events_all_day = self._event_provider.get_all_day_events(date)
-
         y = self._config.calendar_date_position[1] + size[1]+2
 
-        if len(events_all_day) > 0:
-            message = "{}".format(len(events_all_day))
-            size = font.getsize(message)
+        if events_all_day > 0:
+            message = "{}".format(events_all_day)
+            size = self._text_metrics.get_size(font, message)
 
             draw.get_image_draw(is_holiday).bitmap(
                 (self._config.calendar_events_margin_left, y+size[1]-icon_event_all_day.height),
@@ -391,9 +1071,9 @@ class CalendarFrameDraw:
 
             y += size[1]
 
-        if len(events) > 0:
-            message = "{}".format(len(events))
-            size = font.getsize(message)
+        if events > 0:
+            message = "{}".format(events)
+            size = self._text_metrics.get_size(font, message)
 
             draw.get_image_draw(is_holiday).bitmap(
                 (self._config.calendar_events_margin_left, y+size[1]-icon_event.height),
@@ -407,7 +1087,7 @@ class CalendarFrameDraw:
                 fill=draw.get_color(is_holiday)
             )
 
-    def _draw_today(self, draw: EInkDraw):
+    def _draw_today(self, draw: EInkDrawRegion):
         self._draw_today_date(draw)
         self._draw_today_sunrise(draw)
 
@@ -419,9 +1099,9 @@ class CalendarFrameDraw:
             ],
             fill=draw.get_color(0))
 
-    def _draw_today_date(self, draw: EInkDraw):
+    def _draw_today_date(self, draw: EInkDrawRegion):
         subframe_size = draw.get_size()
-        font_date = ImageFont.truetype(self._config.today_font, self._config.today_date_font_size)
+        font_date = self._resources.get_font(self._config.today_font, self._config.today_date_font_size)
 
         today = self._reference.date()
         date_string = today.strftime("%b. %d\n%a")
@@ -443,13 +1123,13 @@ class CalendarFrameDraw:
                 fill=draw.get_color(0),
                 font=font_date)
 
-    def _draw_today_sunrise(self, draw: EInkDraw):
+    def _draw_today_sunrise(self, draw: EInkDrawRegion):
         subframe_size = draw.get_size()
-        font_sunrise = ImageFont.truetype(self._config.today_font, self._config.today_sunrise_font_size)
-        icon_sun = Image.open(self._config.today_sunrise_icon).convert("1")
+        font_sunrise = self._resources.get_font(self._config.today_font, self._config.today_sunrise_font_size)
+        icon_sun = self._resources.get_icon(self._config.today_sunrise_icon)
 
-        # Calculate sunrise and sunset
-        sun = Sun(*self._config.today_sunrise_coordinates)
+        # Sunrise and sunset times are looked up in a table computed once a year
+        sun = SunTable.shared(*self._config.today_sunrise_coordinates, cache_dir=self._config.cache_dir)
 
         now = self._reference
         today = now.date()
@@ -458,38 +1138,17 @@ class CalendarFrameDraw:
 
         order = 0
         if next_sr < now:
-            sun.get_local_sunrise_time(today+datetime.timedelta(days=1))
             order += 1
         next_ss = sun.get_local_sunset_time(today)
         if next_ss < now:
-            sun.get_local_sunset_time(today+datetime.timedelta(days=1))
             order += 1
         if order > 1:
             order = 0
 
         # Check if sunrise/set time is going up or down
         trend_days = 5
-        sr_direction = 0
-        for i in range(trend_days):
-            sr_test = sun.get_local_sunrise_time(next_sr + datetime.timedelta(days=i)) - datetime.timedelta(days=i)
-            if sr_test < next_sr:
-                sr_direction += -1
-                break
-            elif sr_test > next_sr:
-                sr_direction += 1
-                break
-        sr_direction = (sr_direction/trend_days)
-
-        ss_direction = 0
-        for i in range(trend_days):
-            ss_test = sun.get_local_sunset_time(next_ss + datetime.timedelta(days=i)) - datetime.timedelta(days=i)
-            if ss_test < next_ss:
-                ss_direction += -1
-                break
-            elif ss_test > next_ss:
-                ss_direction += 1
-                break
-        ss_direction /= trend_days
+        sr_direction = sun.get_sunrise_trend(today, trend_days) / trend_days
+        ss_direction = sun.get_sunset_trend(today, trend_days) / trend_days
 
         self._logger.debug("Next sunrise: {} (~{:.1f} min/day)".format(next_sr, sr_direction))
         self._logger.debug("Next sunset: {} (~{:.1f} min/day)".format(next_ss, ss_direction))
@@ -549,13 +1208,15 @@ class CalendarFrameDraw:
                 x = subframe_size[0] - icon_sun.width - sunrise_size[0] - self._config.today_padding[1]
 
     def _draw_tasklist(self, draw):
-        font_header = ImageFont.truetype(self._config.tasklist_font_header, self._config.tasklist_font_size_header)
-        font_event = ImageFont.truetype(self._config.tasklist_font_event, self._config.tasklist_font_size_event)
-        icon_highlight_today = Image.open(self._config.tasklist_highlight_icon_today).convert("1")
-        icon_highlight_upcoming = Image.open(self._config.tasklist_highlight_icon_upcoming).convert("1")
-        icon_event_long_from = Image.open(self._config.tasklist_event_long_icon_from).convert("1")
-        icon_event_long_through = Image.open(self._config.tasklist_event_long_icon_through).convert("1")
-        icon_event_long_to = Image.open(self._config.tasklist_event_long_icon_to).convert("1")
+        font_header = self._resources.get_font(
+            self._config.tasklist_font_header,
+            self._config.tasklist_font_size_header)
+        font_event = self._resources.get_font(self._config.tasklist_font_event, self._config.tasklist_font_size_event)
+        icon_highlight_today = self._resources.get_icon(self._config.tasklist_highlight_icon_today)
+        icon_highlight_upcoming = self._resources.get_icon(self._config.tasklist_highlight_icon_upcoming)
+        icon_event_long_from = self._resources.get_icon(self._config.tasklist_event_long_icon_from)
+        icon_event_long_through = self._resources.get_icon(self._config.tasklist_event_long_icon_through)
+        icon_event_long_to = self._resources.get_icon(self._config.tasklist_event_long_icon_to)
 
         date = self._reference.date()
         date_to = datetime.date.today() + datetime.timedelta(days=self._config.tasklist_task_days)
@@ -603,7 +1264,7 @@ class CalendarFrameDraw:
 
         # Draw header
         message = "{:2d}-{:02d}".format(date.month, date.day)
-        size = font_header.getsize(message)
+        size = self._text_metrics.get_size(font_header, message)
         draw.get_image_draw(is_holiday).text(
             (self._config.tasklist_padding[3], y),
             message,
@@ -656,7 +1317,12 @@ class CalendarFrameDraw:
                 x += icon_event_long_through.width + 4
                 message = "{}".format(event.summary)
 
-            size = font_header.getsize(message)
+            # Long summaries are shortened to fit in the tasklist
+            message = self._text_metrics.fit_to_width(
+                font_event,
+                message,
+                draw.get_size()[0] - self._config.tasklist_padding[1] - x)
+            size = self._text_metrics.get_size(font_event, message)
             draw.get_image_draw(0).text(
                 (x, y),
                 message,
@@ -665,3 +1331,12 @@ class CalendarFrameDraw:
             y += size[1]+4
 
         return y
+
+
+def _draw_calendar_tile(config: Config, day_size, row):
+    """
+    Draws cells of a calendar week row in a worker process, returns images of each cell
+    :param config: Configuration with size of the row
+    :param row: List of (x, cell)
+    """
+    return CalendarFrameDraw([], config)._draw_calendar_row(day_size, row)
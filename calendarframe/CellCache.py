@@ -0,0 +1,61 @@
+import collections
+import logging
+import os
+import pickle
+from PIL import Image
+
+
+class CellCache:
+    def __init__(self, path=None, fingerprint=None, max_entries=256):
+        """
+        Keeps rendered calendar cells (one image per color), keyed by everything that affects the cell's look
+        :param path: File for keeping cells between runs, None to keep them only in memory
+        :param fingerprint: Value describing drawing settings - cells saved with different one are discarded
+        :param max_entries: Number of cells kept, least recently used ones are dropped first
+        """
+        self._path = path
+        self._fingerprint = fingerprint
+        self._max_entries = max_entries
+        self._cells = collections.OrderedDict()  # key -> [(mode, size, raw data)]
+        self._changed = False
+        self._logger = logging.getLogger("CellCache")
+
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, "rb") as file:
+                    fingerprint, cells = pickle.load(file)
+                if fingerprint == self._fingerprint:
+                    self._cells = cells
+                else:
+                    self._logger.debug("Drawing settings changed, discarding cached cells")
+            except (OSError, pickle.UnpicklingError, EOFError, ValueError) as e:
+                self._logger.warning("Couldn't load cached cells: {}".format(e))
+
+    def __contains__(self, key):
+        return key in self._cells
+
+    def get(self, key):
+        """
+        Returns list of images for the cell, or None
+        """
+        cell = self._cells.get(key)
+        if cell is None:
+            return None
+        self._cells.move_to_end(key)
+        return [Image.frombytes(mode, size, data) for mode, size, data in cell]
+
+    def put(self, key, images):
+        self._cells[key] = [(image.mode, image.size, image.tobytes()) for image in images]
+        self._cells.move_to_end(key)
+        while len(self._cells) > self._max_entries:
+            self._cells.popitem(last=False)
+        self._changed = True
+
+    def save(self):
+        if self._path is None or not self._changed:
+            return
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        with open(self._path + ".tmp", "wb") as file:
+            pickle.dump((self._fingerprint, self._cells), file)
+        os.replace(self._path + ".tmp", self._path)
+        self._changed = False
@@ -1,3 +1,4 @@
+import functools
 import math
 
 
@@ -25,28 +26,19 @@ def draw_line_dashed(draw, xy, fill=None, width=0, dash=4, space=4, phase=0):
         xy0 = xy[i + 0]
         xy1 = xy[i + 1]
 
-        veclen = math.sqrt((xy1[0] - xy0[0]) ** 2 + (xy1[1] - xy0[1]) ** 2)
-        direction = ((xy1[0] - xy0[0]) / veclen, (xy1[1] - xy0[1]) / veclen)
-
-        drawnlen = 0
-        while drawnlen < veclen:
-            drawlen = dash if is_dash else space
-            if leftover > 0:
-                drawlen = min(leftover, drawlen)
-                leftover = leftover - drawlen
-            if drawlen + drawnlen > veclen:
-                leftover = drawlen + drawnlen - veclen
-                drawlen = veclen - drawnlen
-
-            fxy0 = (xy0[0] + direction[0] * drawnlen, xy0[1] + direction[1] * drawnlen)
-            fxy1 = (
-                xy0[0] + direction[0] * (drawnlen + drawlen - 1), xy0[1] + direction[1] * (drawnlen + drawlen - 1))
-
-            if is_dash:
-                draw.line([fxy0, fxy1], fill, width)
-            drawnlen = drawnlen + drawlen
-            if leftover == 0:
-                is_dash = not is_dash
+        dx = xy1[0] - xy0[0]
+        dy = xy1[1] - xy0[1]
+        if type(dx) is int and type(dy) is int and (dx == 0) != (dy == 0) and \
+                type(xy0[0]) is int and type(xy0[1]) is int and leftover == int(leftover):
+            # Horizontal and vertical segments are stamped from a cached mask of their dashes.
+            # Only with whole pixel coordinates, as rounding of fractional ones depends on the position.
+            mask, offset, is_dash, leftover = _get_dash_mask(dx, dy, width, dash, space, is_dash, leftover)
+            if mask is not None:
+                draw.bitmap((xy0[0] + offset[0], xy0[1] + offset[1]), mask, fill=fill)
+        else:
+            lines, is_dash, leftover = _split_dashes(xy0, xy1, dash, space, is_dash, leftover)
+            for line in lines:
+                draw.line(line, fill, width)
 
 
 def draw_rectangle_dashed(draw, xy, outline=None, width=0, dash=4, space=4, phase=0):
@@ -63,3 +55,62 @@ def draw_rectangle_dashed(draw, xy, outline=None, width=0, dash=4, space=4, phas
         (xy[0][0], xy[1][1]),
         (xy[0][0], xy[0][1]),
     ], outline, width, dash, space, phase)
+
+
+def _split_dashes(xy0, xy1, dash, space, is_dash, leftover):
+    """
+    Splits segment into dashes. Returns list of dashes (line ends), and is_dash and leftover for the next segment.
+    """
+    veclen = math.sqrt((xy1[0] - xy0[0]) ** 2 + (xy1[1] - xy0[1]) ** 2)
+    direction = ((xy1[0] - xy0[0]) / veclen, (xy1[1] - xy0[1]) / veclen)
+
+    lines = []
+    drawnlen = 0
+    while drawnlen < veclen:
+        drawlen = dash if is_dash else space
+        if leftover > 0:
+            drawlen = min(leftover, drawlen)
+            leftover = leftover - drawlen
+        if drawlen + drawnlen > veclen:
+            leftover = drawlen + drawnlen - veclen
+            drawlen = veclen - drawnlen
+
+        fxy0 = (xy0[0] + direction[0] * drawnlen, xy0[1] + direction[1] * drawnlen)
+        fxy1 = (
+            xy0[0] + direction[0] * (drawnlen + drawlen - 1), xy0[1] + direction[1] * (drawnlen + drawlen - 1))
+
+        if is_dash:
+            lines.append([fxy0, fxy1])
+        drawnlen = drawnlen + drawlen
+        if leftover == 0:
+            is_dash = not is_dash
+
+    return lines, is_dash, leftover
+
+
+@functools.lru_cache(maxsize=256)
+def _get_dash_mask(dx, dy, width, dash, space, is_dash, leftover):
+    """
+    Draws dashes of a segment from (0, 0) to (dx, dy) on a mask, the same way draw_line_dashed draws them.
+    Returns the mask (None if there are no dashes), its position relative to the segment start,
+    and is_dash and leftover for the next segment.
+    """
+    from PIL import Image, ImageDraw
+
+    lines, is_dash, leftover = _split_dashes((0, 0), (dx, dy), dash, space, is_dash, leftover)
+    if not lines:
+        return None, (0, 0), is_dash, leftover
+
+    # Wide lines extend to the sides, and dash ends can be a pixel before the segment start
+    margin = width + 2
+    x0 = min(0, dx) - margin
+    y0 = min(0, dy) - margin
+    mask = Image.new("1", (abs(dx) + 2*margin + 1, abs(dy) + 2*margin + 1), 0)
+    mask_draw = ImageDraw.Draw(mask)
+    for line in lines:
+        mask_draw.line([(x - x0, y - y0) for x, y in line], 1, width)
+
+    box = mask.getbbox()
+    if box is None:
+        return None, (0, 0), is_dash, leftover
+    return mask.crop(box), (x0 + box[0], y0 + box[1]), is_dash, leftover
@@ -1,34 +1,264 @@
+import hashlib
 import logging
+import os
+import pickle
+import urllib.parse
+import xml.etree.ElementTree as ElementTree
 import caldav
 from dateutil import tz
 import icalevents.icalparser as icalparser
 from .IEventProvider import IEventProvider
 
+_DAV = "{DAV:}"
+_CALDAV = "{urn:ietf:params:xml:ns:caldav}"
+_CALENDARSERVER = "{http://calendarserver.org/ns/}"
+
+_PROPFIND_CALENDAR = """<?xml version="1.0" encoding="utf-8"?>
+<D:propfind xmlns:D="DAV:" xmlns:CS="http://calendarserver.org/ns/">
+  <D:prop><CS:getctag/><D:sync-token/></D:prop>
+</D:propfind>"""
+
+_PROPFIND_ETAGS = """<?xml version="1.0" encoding="utf-8"?>
+<D:propfind xmlns:D="DAV:">
+  <D:prop><D:getetag/><D:resourcetype/></D:prop>
+</D:propfind>"""
+
+_REPORT_SYNC = """<?xml version="1.0" encoding="utf-8"?>
+<D:sync-collection xmlns:D="DAV:">
+  <D:sync-token>{}</D:sync-token>
+  <D:sync-level>1</D:sync-level>
+  <D:prop><D:getetag/></D:prop>
+</D:sync-collection>"""
+
+_REPORT_MULTIGET = """<?xml version="1.0" encoding="utf-8"?>
+<C:calendar-multiget xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+  <D:prop><D:getetag/><C:calendar-data/></D:prop>
+  {}
+</C:calendar-multiget>"""
+
+# Number of resources requested in a single calendar-multiget
+_MULTIGET_BATCH = 100
+
 
 class EventProviderCalDAV(IEventProvider):
-    def __init__(self, address, is_holiday_calendar=None, week_holidays=None):
+    def __init__(self, address, is_holiday_calendar=None, week_holidays=None, cache_dir=None, refresh_interval=None):
+        """
+        Events from CalDAV server
+        :param address: Address of CalDAV server, with credentials
+        :param cache_dir: Directory for keeping calendar resources between runs.
+               Only resources changed since the last run are downloaded (sync-collection, ctag and ETags).
+               Sync covers whole calendars, not only the window as the time-range query without cache does -
+               the first run downloads all resources, and events are parsed from them for the window.
+        :param refresh_interval: Minutes between loading events again in daemon mode,
+               None for config.daemon_refresh_interval
+        """
         IEventProvider.__init__(self, is_holiday_calendar, week_holidays)
+        self._refresh_interval = refresh_interval
 
         self._address = address
+        self._cache_dir = cache_dir
 
     def preload(self, date_from, date_to):
         logger = logging.getLogger("EventProviderCalDAV")
 
         logger.info("Connecting to CalDAV server...")
         cal_client = caldav.DAVClient(self._address)
+
+        if self._cache_dir is None:
+            self._events = self._load_all(cal_client, date_from, date_to)
+        else:
+            self._events = self._load_synced(cal_client, date_from, date_to, logger)
+
+        self._events.sort()
+        self._build_index(date_from, date_to)
+        logger.info("Retrieved events from CalDAV server")
+
+    def get_source(self):
+        return self._address
+
+    @staticmethod
+    def _parse(data, date_from, date_to):
+        # Synced resources can be anywhere in time, only their occurrences in the window are kept
+        events = icalparser.parse_events(data, start=date_from, end=date_to)
+        for event in events:
+            event.start = event.start.replace(tzinfo=tz.tzlocal())
+            event.end = event.end.replace(tzinfo=tz.tzlocal())
+        return [event for event in events if event.start.date() <= date_to and event.end.date() >= date_from]
+
+    def _load_all(self, cal_client, date_from, date_to):
         cal_principal = cal_client.principal()
         calendars = cal_principal.calendars()
 
-        self._events = []
-
+        events = []
         for calendar in calendars:
             results = calendar.date_search(start=date_from, end=date_to)
             for result in results:
-                events = icalparser.parse_events(result.data, start=date_from, end=date_to)
-                for event in events:
-                    event.start = event.start.replace(tzinfo=tz.tzlocal())
-                    event.end = event.end.replace(tzinfo=tz.tzlocal())
-                    self._events.append(event)
+                events += self._parse(result.data, date_from, date_to)
+        return events
 
-        self._events.sort()
-        logger.info("Retrieved events from CalDAV server")
+    def _load_synced(self, cal_client, date_from, date_to, logger):
+        os.makedirs(os.path.join(self._cache_dir, "caldav"), exist_ok=True)
+        cache_path = os.path.join(
+            self._cache_dir,
+            "caldav",
+            hashlib.sha1(self._address.encode()).hexdigest() + ".pickle")
+
+        # url -> {"ctag", "sync_token", "objects": {href: (etag, data)}, "window", "events": {href: events}}
+        cache = {}
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, "rb") as file:
+                    cache = pickle.load(file)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+                logger.warning("Couldn't load CalDAV cache: {}".format(e))
+
+        calendar_urls = list(cache.keys())
+        try:
+            synced, events = self._sync_calendars(cal_client, calendar_urls, cache, date_from, date_to, logger)
+        except Exception as e:
+            if not calendar_urls:
+                raise
+            # Calendars could have been moved or removed, find them again
+            logger.info("Sync of known calendars failed, discovering them again: {}".format(e))
+            synced, events = self._sync_calendars(cal_client, [], cache, date_from, date_to, logger)
+
+        with open(cache_path + ".tmp", "wb") as file:
+            pickle.dump(synced, file)
+        os.replace(cache_path + ".tmp", cache_path)
+
+        return events
+
+    def _sync_calendars(self, cal_client, calendar_urls, cache, date_from, date_to, logger):
+        if not calendar_urls:
+            logger.info("Discovering calendars...")
+            calendar_urls = [str(calendar.url) for calendar in cal_client.principal().calendars()]
+
+        window = (str(date_from), str(date_to))
+        events = []
+        synced = {}
+        for url in calendar_urls:
+            state = cache.get(url, {"ctag": None, "sync_token": None, "objects": {}, "window": None, "events": {}})
+            changed = self._sync_calendar(cal_client, url, state, logger)
+            if state["window"] != window:
+                # Events are parsed for the window, all resources are parsed again when it moves
+                changed = list(state["objects"].keys())
+                state["events"] = {}
+                state["window"] = window
+
+            # Only resources that changed are parsed, and kept only if they have events in the window
+            for href in changed:
+                state["events"].pop(href, None)
+                if href in state["objects"]:
+                    resource_events = self._parse(state["objects"][href][1], date_from, date_to)
+                    if resource_events:
+                        state["events"][href] = resource_events
+            for resource_events in state["events"].values():
+                events += resource_events
+            synced[url] = state
+
+        return synced, events
+
+    def _sync_calendar(self, cal_client, url, state, logger):
+        """
+        Brings cached resources of a calendar up to date. Returns hrefs of resources that changed or were removed.
+        """
+        ctag, sync_token = None, None
+        response = self._xml(cal_client.propfind(url, _PROPFIND_CALENDAR, depth=0))
+        for prop in response.iter(_DAV + "prop"):
+            ctag = self._text(prop.find(_CALENDARSERVER + "getctag"), ctag)
+            sync_token = self._text(prop.find(_DAV + "sync-token"), sync_token)
+
+        if ctag is not None and ctag == state["ctag"]:
+            logger.debug("Calendar {} didn't change".format(url))
+            return []
+
+        changed = None
+        if state["sync_token"] is not None:
+            try:
+                changed, sync_token = self._sync_collection(cal_client, url, state, logger)
+            except Exception as e:
+                logger.info("Sync of {} failed, fetching all resources: {}".format(url, e))
+        if changed is None:
+            changed = self._sync_full(cal_client, url, state)
+
+        state["ctag"] = ctag
+        state["sync_token"] = sync_token
+        return changed
+
+    def _sync_collection(self, cal_client, url, state, logger):
+        # RFC 6578 - lists resources changed or removed since the last sync
+        response = self._xml(cal_client.report(url, _REPORT_SYNC.format(self._escape(state["sync_token"])), depth=0))
+        sync_token = self._text(response.find(_DAV + "sync-token"), state["sync_token"])
+
+        fetch = []
+        removed = []
+        for item in response.findall(_DAV + "response"):
+            href = self._text(item.find(_DAV + "href"))
+            status = self._text(item.find(_DAV + "status"), "")
+            if href is None or self._is_same_path(href, url):
+                continue
+            if " 404 " in status:
+                if state["objects"].pop(href, None) is not None:
+                    removed.append(href)
+                continue
+            etag = self._text(item.find(".//" + _DAV + "getetag"))
+            if etag is None or state["objects"].get(href, (None,))[0] != etag:
+                fetch.append(href)
+
+        logger.debug("Calendar {}: {} changed, {} removed".format(url, len(fetch), len(removed)))
+        self._fetch(cal_client, url, fetch, state)
+        return fetch + removed, sync_token
+
+    def _sync_full(self, cal_client, url, state):
+        # Compares ETags of all resources with the cached ones
+        response = self._xml(cal_client.propfind(url, _PROPFIND_ETAGS, depth=1))
+        etags = {}
+        for item in response.findall(_DAV + "response"):
+            href = self._text(item.find(_DAV + "href"))
+            if href is None or self._is_same_path(href, url) or item.find(".//" + _DAV + "collection") is not None:
+                continue
+            etags[href] = self._text(item.find(".//" + _DAV + "getetag"))
+
+        removed = [href for href in state["objects"] if href not in etags]
+        for href in removed:
+            del state["objects"][href]
+        fetch = [href for href, etag in etags.items()
+                 if etag is None or state["objects"].get(href, (None,))[0] != etag]
+        self._fetch(cal_client, url, fetch, state)
+        return fetch + removed
+
+    def _fetch(self, cal_client, url, hrefs, state):
+        for i in range(0, len(hrefs), _MULTIGET_BATCH):
+            body = _REPORT_MULTIGET.format("".join(
+                "<D:href>{}</D:href>".format(self._escape(href)) for href in hrefs[i:i+_MULTIGET_BATCH]))
+            response = self._xml(cal_client.report(url, body, depth=1))
+            for item in response.findall(_DAV + "response"):
+                href = self._text(item.find(_DAV + "href"))
+                data = self._text(item.find(".//" + _CALDAV + "calendar-data"))
+                if href is None or data is None:
+                    continue
+                state["objects"][href] = (self._text(item.find(".//" + _DAV + "getetag")), data)
+
+    @staticmethod
+    def _xml(response):
+        if response.status not in (200, 207):
+            raise ConnectionError("CalDAV request failed with status {}".format(response.status))
+        raw = response.raw
+        if isinstance(raw, str):
+            raw = raw.encode("utf-8")
+        return ElementTree.fromstring(raw)
+
+    @staticmethod
+    def _text(element, default=None):
+        if element is None or element.text is None:
+            return default
+        return element.text.strip()
+
+    @staticmethod
+    def _escape(text):
+        return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+    @staticmethod
+    def _is_same_path(href, url):
+        return urllib.parse.unquote(href).rstrip("/") == \
+            urllib.parse.unquote(urllib.parse.urlparse(url).path).rstrip("/")
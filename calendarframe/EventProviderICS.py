@@ -1,25 +1,64 @@
+import contextlib
+import datetime
+import hashlib
+import io
+import json
 import logging
+import os
+import pickle
+import re
+import tempfile
+import urllib.error
+import urllib.request
 from dateutil import tz
 import icalevents.icalevents as icalevents
 from .IEventProvider import IEventProvider
+from .RecurrenceCache import RecurrenceCache
+
+# Date and time value at the end of DTSTART/DTEND line
+_DATE_VALUE = re.compile(r":(\d{4})(\d{2})(\d{2})(?:T(\d{2})(\d{2})(\d{2})Z?)?\s*$")
+_DURATION_VALUE = re.compile(r":([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?\s*$")
+# Properties making the event recurring, or changing its occurrence
+_RECURRENCE_PROPERTIES = {"RRULE", "RDATE", "EXRULE", "RECURRENCE-ID"}
+# Events are compared with the window by dates - margin covers time zone differences
+_WINDOW_MARGIN = datetime.timedelta(days=2)
 
 
 class EventProviderICS(IEventProvider):
-    def __init__(self, address=None, file=None, is_holiday_calendar=None, week_holidays=None):
+    def __init__(self, address=None, file=None, is_holiday_calendar=None, week_holidays=None, cache_dir=None,
+                 refresh_interval=None):
+        """
+        Events from ICS file or server
+        :param address: Address of ICS file
+        :param file: Path to local ICS file, used if address is not set
+        :param cache_dir: Directory for keeping downloaded files between runs.
+               Files are downloaded only if they changed on server, and parsed only if they changed at all.
+               Occurrences of recurring events are kept, so only days that entered the window are expanded.
+        :param refresh_interval: Minutes between loading events again in daemon mode,
+               None for config.daemon_refresh_interval
+        """
         IEventProvider.__init__(self, is_holiday_calendar, week_holidays)
+        self._refresh_interval = refresh_interval
 
         self._address = address
         self._file = file
+        self._cache_dir = cache_dir
+        self._recurrences = None
 
     def preload(self, date_from, date_to):
         logger = logging.getLogger("EventProviderICS")
 
-        logger.info("Downloading ICS...")
-        self._events = icalevents.events(url=self._address, file=self._file, start=date_from, end=date_to)
-        for event in self._events:
-            event.start = event.start.replace(tzinfo=tz.tzlocal())
-            event.end = event.end.replace(tzinfo=tz.tzlocal())
-        self._events.sort()
+        if self._address is not None and self._cache_dir is not None:
+            self._events = self._load_cached(date_from, date_to, logger)
+        else:
+            logger.info("Downloading ICS...")
+            self._events = self._parse(
+                date_from,
+                date_to,
+                url=self._address,
+                file=self._file,
+                recurrences=self._get_recurrences())
+        self._build_index(date_from, date_to)
 
         for event in self._events:
             logger.debug("{}-{}: {}; {}".format(
@@ -30,3 +69,304 @@ class EventProviderICS(IEventProvider):
             ))
 
         logger.info("Retrieved events from ICS file")
+
+    def get_source(self):
+        return self._address if self._address is not None else os.path.abspath(self._file)
+
+    @staticmethod
+    def _parse(date_from, date_to, url=None, file=None, recurrences=None):
+        """
+        :param recurrences: RecurrenceCache for expanding recurring events, None to expand them from scratch
+        """
+        # The feed is read line by line, and only events that can be in the window are kept for parsing
+        if url is not None:
+            request = urllib.request.Request(url.replace("webcal://", "http://", 1))
+            with urllib.request.urlopen(request) as response:
+                items = EventProviderICS._scan(
+                    io.TextIOWrapper(response, encoding="utf-8", errors="replace"),
+                    date_from,
+                    date_to)
+        else:
+            with open(file, "r", encoding="utf-8", errors="replace") as lines:
+                items = EventProviderICS._scan(lines, date_from, date_to)
+        if not items:
+            raise ConnectionError("Could not get data from {}".format(url or file))
+
+        calendars = EventProviderICS._split(items)
+        if recurrences is None or len(calendars) != 1:
+            # The parser takes one calendar at a time
+            events = []
+            for calendar in calendars:
+                events += icalevents.events(
+                    string_content=EventProviderICS._join(calendar),
+                    start=date_from,
+                    end=date_to)
+        else:
+            # Recurring events are expanded one by one, reusing occurrences expanded in previous runs.
+            # Every event gets all calendar properties and time zones, as they affect the expansion.
+            items = calendars[0]
+            context = [item for item in items if isinstance(item, str)]
+            recurring = {}
+            for item in items:
+                if not isinstance(item, str) and item[0] is not None:
+                    recurring.setdefault(item[0], []).append(item)
+
+            events = icalevents.events(
+                string_content=EventProviderICS._join(
+                    [item for item in items if isinstance(item, str) or item[0] is None]),
+                start=date_from,
+                end=date_to)
+            context_hash = hashlib.sha1("\r\n".join(context).encode()).hexdigest()
+            # Contents of the blocks cover RRULE, EXDATE, SEQUENCE, LAST-MODIFIED and modified instances
+            definitions = {
+                uid: hashlib.sha1(
+                    (context_hash + "".join("\r\n".join(lines) for _, lines in blocks)).encode()).hexdigest()
+                for uid, blocks in recurring.items()}
+
+            def get_content(uids):
+                # Blocks are kept in their places, before the end of the calendar
+                uids = set(uids)
+                return EventProviderICS._join([item for item in items if isinstance(item, str) or item[0] in uids])
+
+            events += recurrences.expand(definitions, date_from, date_to, get_content)
+            recurrences.save()
+
+        for event in events:
+            event.start = event.start.replace(tzinfo=tz.tzlocal())
+            event.end = event.end.replace(tzinfo=tz.tzlocal())
+        events.sort()
+        return events
+
+    def _get_recurrences(self):
+        if self._cache_dir is None:
+            return None
+        if self._recurrences is None:
+            self._recurrences = RecurrenceCache(os.path.join(
+                self._cache_dir,
+                "ics",
+                hashlib.sha1(self.get_source().encode()).hexdigest() + ".recurrences.pickle"))
+        return self._recurrences
+
+    def _load_cached(self, date_from, date_to, logger):
+        cache_dir = os.path.join(self._cache_dir, "ics")
+        os.makedirs(cache_dir, exist_ok=True)
+        key = hashlib.sha1(self._address.encode()).hexdigest()
+        meta_path = os.path.join(cache_dir, key + ".json")
+        body_path = os.path.join(cache_dir, key + ".ics")
+        events_path = os.path.join(cache_dir, key + ".pickle")
+
+        meta = {}
+        if os.path.exists(meta_path) and os.path.exists(body_path):
+            with open(meta_path, "r") as file:
+                meta = json.load(file)
+
+        request = urllib.request.Request(self._address.replace("webcal://", "http://", 1))
+        if meta.get("etag"):
+            request.add_header("If-None-Match", meta["etag"])
+        if meta.get("last_modified"):
+            request.add_header("If-Modified-Since", meta["last_modified"])
+
+        logger.info("Downloading ICS...")
+        try:
+            with urllib.request.urlopen(request) as response:
+                # Stream to a temporary file, to keep the cached one if download fails
+                sha = hashlib.sha256()
+                size = 0
+                descriptor, temporary_path = self._temporary_file(body_path)
+                try:
+                    with os.fdopen(descriptor, "wb") as file:
+                        for chunk in iter(lambda: response.read(65536), b""):
+                            sha.update(chunk)
+                            file.write(chunk)
+                            size += len(chunk)
+                    if size == 0:
+                        raise ConnectionError("Could not get data from {}".format(self._address))
+                    digest = sha.hexdigest()
+                    if digest == meta.get("sha256"):
+                        logger.info("ICS didn't change")
+                        os.unlink(temporary_path)
+                    else:
+                        os.replace(temporary_path, body_path)
+                        meta = {"sha256": digest}
+                except BaseException:
+                    os.unlink(temporary_path)
+                    raise
+                meta["etag"] = response.headers.get("ETag")
+                meta["last_modified"] = response.headers.get("Last-Modified")
+        except urllib.error.HTTPError as e:
+            if e.code != 304 or not meta:
+                raise
+            logger.info("ICS not modified on server")
+
+        window = [str(date_from), str(date_to)]
+        events = None
+        if meta.get("events_window") == window and os.path.exists(events_path):
+            try:
+                with open(events_path, "rb") as file:
+                    events = pickle.load(file)
+                logger.debug("Using previously parsed events")
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+                logger.warning("Couldn't load parsed events: {}".format(e))
+
+        if events is None:
+            events = self._parse(date_from, date_to, file=body_path, recurrences=self._get_recurrences())
+            with self._replacing(events_path) as file:
+                pickle.dump(events, file)
+            meta["events_window"] = window
+
+        with self._replacing(meta_path, "w") as file:
+            json.dump(meta, file)
+
+        return events
+
+    @staticmethod
+    def _temporary_file(path):
+        # Unique, as processes sharing cache directory (e.g. batch and server) can write the same file
+        return tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _replacing(path, mode="wb"):
+        """
+        Opens a temporary file, which replaces the file at path when it's closed without errors
+        """
+        descriptor, temporary_path = EventProviderICS._temporary_file(path)
+        try:
+            with os.fdopen(descriptor, mode) as file:
+                yield file
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    @staticmethod
+    def _scan(lines, date_from, date_to):
+        """
+        Reads ICS content, leaving out events that are not recurring and are entirely outside of the window.
+        Everything else (calendar properties, time zones, other components) is kept as it is.
+        :param lines: Iterable of lines, e.g. file or response
+        :return: List of kept items in the original order - lines outside of events,
+                 and events as (UID if the event is recurring or None, [lines])
+        """
+        window_from = EventProviderICS._to_date(date_from) - _WINDOW_MARGIN
+        window_to = EventProviderICS._to_date(date_to) + _WINDOW_MARGIN
+
+        items = []
+        event = None
+        for line in lines:
+            line = line.rstrip("\r\n")
+            if event is None:
+                if line.upper() == "BEGIN:VEVENT":
+                    event = [line]
+                elif line:
+                    items.append(line)
+                continue
+
+            event.append(line)
+            if line.upper() == "END:VEVENT":
+                in_window, uid = EventProviderICS._classify(event, window_from, window_to)
+                if in_window:
+                    items.append((uid, event))
+                event = None
+
+        if event is not None:
+            # Unterminated event, let the parser decide
+            items.append((None, event))
+        return items
+
+    @staticmethod
+    def _split(items):
+        """
+        Splits items returned by _scan into calendars, each from its BEGIN:VCALENDAR to END:VCALENDAR.
+        Items outside of calendars are left out, unterminated calendar is terminated.
+        """
+        calendars = []
+        calendar = None
+        for item in items:
+            is_line = isinstance(item, str)
+            if calendar is None:
+                if not is_line or item.upper() != "BEGIN:VCALENDAR":
+                    continue
+                calendar = []
+                calendars.append(calendar)
+            calendar.append(item)
+            if is_line and item.upper() == "END:VCALENDAR":
+                calendar = None
+        if calendar is not None:
+            calendar.append("END:VCALENDAR")
+        # Not a calendar at all, let the parser decide
+        return calendars or [items]
+
+    @staticmethod
+    def _join(items):
+        # Items of one calendar back to ICS content, encoded - older icalevents expects bytes
+        lines = []
+        for item in items:
+            if isinstance(item, str):
+                lines.append(item)
+            else:
+                lines += item[1]
+        return ("\r\n".join(lines) + "\r\n").encode("utf-8")
+
+    @staticmethod
+    def _classify(event, window_from, window_to):
+        """
+        Returns (True if event may be in the window, UID if event is recurring or None)
+        """
+        start = None
+        end = None
+        duration = None
+        uid = None
+        recurring = False
+        for line in EventProviderICS._unfold(event):
+            name = line.split(":", 1)[0].split(";", 1)[0].upper()
+            if name in _RECURRENCE_PROPERTIES:
+                recurring = True
+            elif name == "UID":
+                uid = line.split(":", 1)[1].strip() if ":" in line else None
+            elif name == "DTSTART":
+                start = EventProviderICS._parse_date(line)
+            elif name == "DTEND":
+                end = EventProviderICS._parse_date(line)
+            elif name == "DURATION":
+                match = _DURATION_VALUE.search(line)
+                if match is not None and match.group(1) != "-":
+                    weeks, days, hours, minutes, seconds = (int(value or 0) for value in match.groups()[1:])
+                    duration = datetime.timedelta(weeks=weeks, days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+        if recurring:
+            # Events without UID can't be matched with their modified instances, so they aren't cached
+            return True, uid or None
+        if start is None:
+            # Can't tell, keep it
+            return True, None
+        if end is None:
+            end = start + duration if duration is not None else start
+        return start <= window_to and end >= window_from, None
+
+    @staticmethod
+    def _unfold(lines):
+        # Long lines are continued in the following lines, starting with space or tab
+        unfolded = []
+        for line in lines:
+            if line[:1] in (" ", "\t") and unfolded:
+                unfolded[-1] += line[1:]
+            else:
+                unfolded.append(line)
+        return unfolded
+
+    @staticmethod
+    def _parse_date(line):
+        match = _DATE_VALUE.search(line)
+        if match is None:
+            return None
+        try:
+            return datetime.date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _to_date(value):
+        if isinstance(value, datetime.datetime):
+            return value.date()
+        return value
@@ -0,0 +1,174 @@
+import datetime
+import logging
+import os
+import struct
+import tempfile
+from dateutil import tz
+from .IEventProvider import IEventProvider
+
+_MAGIC = b"CALSNAP\0"
+_VERSION = 1
+
+# Magic, version, first and last day of events (ordinals), number of strings, number of events
+_HEADER = struct.Struct("<8sHIIII")
+_STRING_LENGTH = struct.Struct("<I")
+# Start and end (microseconds since 1970-01-01, local wall clock), flags, indexes of uid, summary, description, location
+_EVENT = struct.Struct("<qqBIIII")
+
+_FLAG_ALL_DAY = 1
+_FLAG_TRANSPARENT = 2
+_FLAG_RECURRING = 4
+_FLAG_PRIVATE = 8
+_FLAG_FLOATING = 16
+_FLAGS = [
+    (_FLAG_ALL_DAY, "all_day"),
+    (_FLAG_TRANSPARENT, "transparent"),
+    (_FLAG_RECURRING, "recurring"),
+    (_FLAG_PRIVATE, "private"),
+    (_FLAG_FLOATING, "floating"),
+]
+
+_NO_STRING = 0xFFFFFFFF
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class EventSnapshot:
+    """
+    Preloaded events saved in a compact binary file, so they can be drawn without the provider.
+    Strings are stored once, and events refer to them by index. Times are stored as local wall clock,
+    the same way providers give them.
+    """
+
+    @staticmethod
+    def save(path, events, date_from, date_to):
+        strings = []
+        indexes = {}
+
+        def intern(text):
+            if text is None:
+                return _NO_STRING
+            text = str(text)
+            if text not in indexes:
+                indexes[text] = len(strings)
+                strings.append(text)
+            return indexes[text]
+
+        records = []
+        for event in events:
+            flags = 0
+            for flag, name in _FLAGS:
+                if getattr(event, name, False):
+                    flags |= flag
+            records.append(_EVENT.pack(
+                EventSnapshot._to_timestamp(event.start),
+                EventSnapshot._to_timestamp(event.end),
+                flags,
+                intern(event.uid),
+                intern(event.summary),
+                intern(event.description),
+                intern(event.location)))
+
+        data = [_HEADER.pack(_MAGIC, _VERSION, date_from.toordinal(), date_to.toordinal(), len(strings), len(records))]
+        for text in strings:
+            encoded = text.encode("utf-8")
+            data.append(_STRING_LENGTH.pack(len(encoded)))
+            data.append(encoded)
+        data += records
+
+        # Write and rename, so interrupted run doesn't leave a broken file.
+        # Temporary file is unique, as the same snapshot can be saved by multiple processes (e.g. batch and daemon).
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(
+            dir=os.path.dirname(path),
+            prefix=os.path.basename(path) + ".",
+            suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(b"".join(data))
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    @staticmethod
+    def load(path):
+        """
+        Returns events, and first and last day they were loaded for
+        :raises: ValueError if the file isn't a snapshot, or was saved by a different version
+        """
+        from icalevents.icalparser import Event
+
+        with open(path, "rb") as file:
+            data = file.read()
+        if len(data) < _HEADER.size:
+            raise ValueError("Snapshot {} is truncated".format(path))
+        magic, version, date_from, date_to, string_count, event_count = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC:
+            raise ValueError("{} is not an event snapshot".format(path))
+        if version != _VERSION:
+            raise ValueError("Snapshot {} has unsupported version {}".format(path, version))
+
+        try:
+            offset = _HEADER.size
+            strings = []
+            for _ in range(string_count):
+                length, = _STRING_LENGTH.unpack_from(data, offset)
+                offset += _STRING_LENGTH.size
+                strings.append(data[offset:offset+length].decode("utf-8"))
+                offset += length
+
+            # Adding to an aware time keeps the wall clock, and gives time with local time zone
+            epoch = _EPOCH.replace(tzinfo=tz.tzlocal())
+            flag_values = [
+                {name: bool(flags & flag) for flag, name in _FLAGS}
+                for flags in range(2**len(_FLAGS))]
+            strings.append(None)
+            events = []
+            for start, end, flags, uid, summary, description, location in _EVENT.iter_unpack(
+                    data[offset:offset + event_count*_EVENT.size]):
+                event = Event()
+                event.__dict__.update(flag_values[flags & (len(flag_values) - 1)])
+                event.start = epoch + datetime.timedelta(microseconds=start)
+                event.end = epoch + datetime.timedelta(microseconds=end)
+                event.uid = strings[min(uid, string_count)]
+                event.summary = strings[min(summary, string_count)]
+                event.description = strings[min(description, string_count)]
+                event.location = strings[min(location, string_count)]
+                events.append(event)
+        except (struct.error, IndexError, UnicodeDecodeError) as e:
+            raise ValueError("Snapshot {} is damaged: {}".format(path, e))
+        if len(events) != event_count:
+            raise ValueError("Snapshot {} is truncated".format(path))
+
+        return events, datetime.date.fromordinal(date_from), datetime.date.fromordinal(date_to)
+
+    @staticmethod
+    def _to_timestamp(value):
+        if not isinstance(value, datetime.datetime):
+            value = datetime.datetime(value.year, value.month, value.day)
+        delta = value.replace(tzinfo=None) - _EPOCH
+        return (delta.days*86400 + delta.seconds)*1000000 + delta.microseconds
+
+
+class SnapshotEventProvider(IEventProvider):
+    def __init__(self, event_provider: IEventProvider, path):
+        """
+        Events of a provider saved in a snapshot, used in place of the provider when it can't load them
+        :param path: Snapshot file, see EventSnapshot
+        """
+        IEventProvider.__init__(self, event_provider._is_holiday_calendar, event_provider._week_holidays)
+        self._path = path
+        self._logger = logging.getLogger("SnapshotEventProvider")
+
+    def preload(self, date_from, date_to):
+        events, snapshot_from, snapshot_to = EventSnapshot.load(self._path)
+        if isinstance(date_from, datetime.datetime):
+            date_from = date_from.date()
+        if isinstance(date_to, datetime.datetime):
+            date_to = date_to.date()
+        if snapshot_from > date_from or snapshot_to < date_to:
+            self._logger.warning("Snapshot has events from {} to {}, days outside of it will be empty".format(
+                snapshot_from, snapshot_to))
+
+        self._events = events
+        self._build_index(date_from, date_to)
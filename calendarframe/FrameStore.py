@@ -0,0 +1,63 @@
+import hashlib
+import logging
+import os
+
+
+class FrameStore:
+    def __init__(self, directory):
+        """
+        Persists information about the last frame shown on the display
+        :param directory: Directory for the state files, created when needed
+        """
+        self._directory = directory
+        self._digest_path = os.path.join(directory, "last_frame.sha256")
+        # Planes as sent to the display, the red one inverted
+        self._planes_path = os.path.join(directory, "last_frame.planes")
+        self._logger = logging.getLogger("FrameStore")
+
+    @staticmethod
+    def digest(images):
+        """
+        Hash of rendered images (one per color)
+        """
+        sha = hashlib.sha256()
+        for image in images:
+            sha.update("{}:{}x{};".format(image.mode, image.width, image.height).encode())
+            sha.update(image.tobytes())
+        return sha.hexdigest()
+
+    def load_digest(self):
+        try:
+            with open(self._digest_path, "r") as file:
+                return file.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def save_digest(self, digest):
+        self._write(self._digest_path, digest.encode())
+        self._logger.debug("Saved frame digest: {}".format(digest))
+
+    def load_planes(self, plane_size, count=2):
+        """
+        Returns packed planes of the last frame, or None if they weren't saved or have different size
+        """
+        try:
+            with open(self._planes_path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        if len(data) != plane_size*count:
+            self._logger.warning("Saved frame has unexpected size, ignoring it")
+            return None
+        return [data[i*plane_size:(i+1)*plane_size] for i in range(count)]
+
+    def save_planes(self, planes):
+        self._write(self._planes_path, b"".join(bytes(plane) for plane in planes))
+
+    def _write(self, path, data):
+        # Write and rename, so interrupted run doesn't leave a broken file
+        os.makedirs(self._directory, exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
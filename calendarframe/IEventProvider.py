@@ -1,3 +1,4 @@
+import datetime
 from abc import ABC, abstractmethod
 
 
@@ -15,14 +16,49 @@ class IEventProvider(ABC):
 
         self._is_holiday_calendar = is_holiday_calendar
         self._week_holidays = week_holidays
+        self._refresh_interval = None
 
         self._events = None
+        self._index = None
+        self._index_from = None
+        self._index_to = None
 
     @abstractmethod
     def preload(self, date_from, date_to):
+        """
+        Loads events from date_from to date_to. Implementations should call _build_index when done.
+        """
         pass
 
+    def get_source(self):
+        """
+        Text identifying where events come from (e.g. address), the same between runs.
+        Events of providers without source are not saved in snapshots.
+        """
+        return None
+
+    def get_refresh_interval(self):
+        """
+        Minutes between loading events again in daemon mode, None for config.daemon_refresh_interval
+        """
+        return self._refresh_interval
+
+    def get_all_events(self):
+        """
+        All preloaded events, in the order provider keeps them
+        """
+        return list(self._events) if self._events is not None else []
+
+    def get_event_count(self):
+        """
+        Number of preloaded events
+        """
+        return len(self._events) if self._events is not None else 0
+
     def get_events(self, date):
+        if self._is_indexed(date):
+            return list(self._index.get(date, ((), ()))[0])
+
         events = []
 
         for event in self._events:
@@ -34,6 +70,9 @@ class IEventProvider(ABC):
         return events
 
     def get_all_day_events(self, date):
+        if self._is_indexed(date):
+            return list(self._index.get(date, ((), ()))[1])
+
         events = []
 
         for event in self._events:
@@ -49,6 +88,9 @@ class IEventProvider(ABC):
             return True
 
         if self._is_holiday_calendar:
+            if self._is_indexed(date):
+                return date in self._index
+
             for event in self._events:
                 if self._is_event_on_date(event, date):
                     return True
@@ -58,6 +100,40 @@ class IEventProvider(ABC):
 
         return False
 
+    def _build_index(self, date_from, date_to):
+        """
+        Buckets preloaded events by day, so per-day queries don't scan all events.
+        Days outside of date_from..date_to are not indexed and fall back to scanning.
+        """
+        if isinstance(date_from, datetime.datetime):
+            date_from = date_from.date()
+        if isinstance(date_to, datetime.datetime):
+            date_to = date_to.date()
+
+        # date -> (events, all day events), both in the order of self._events
+        index = {}
+        one_day = datetime.timedelta(days=1)
+        for event in self._events:
+            first = max(event.start.date(), date_from)
+            if event.all_day:
+                last = min(event.end.date() - one_day, date_to)
+            else:
+                last = min(event.end.date(), date_to)
+
+            date = first
+            while date <= last:
+                if date not in index:
+                    index[date] = ([], [])
+                index[date][1 if event.all_day else 0].append(event)
+                date += one_day
+
+        self._index = index
+        self._index_from = date_from
+        self._index_to = date_to
+
+    def _is_indexed(self, date):
+        return self._index is not None and self._index_from <= date <= self._index_to
+
     @staticmethod
     def _is_event_on_date(event, date):
         if event.all_day:
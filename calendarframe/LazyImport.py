@@ -0,0 +1,31 @@
+import importlib
+import importlib.util
+import sys
+import threading
+import time
+
+_import_times = {}  # module name -> seconds spent on the first import
+_lock = threading.Lock()
+
+
+def import_module(name, package=None):
+    """
+    Imports module, recording how long the first import took
+    """
+    absolute_name = importlib.util.resolve_name(name, package) if name.startswith(".") else name
+    if absolute_name in sys.modules:
+        return sys.modules[absolute_name]
+
+    with _lock:
+        start = time.perf_counter()
+        module = importlib.import_module(absolute_name)
+        _import_times.setdefault(absolute_name, time.perf_counter() - start)
+    return module
+
+
+def get_import_report():
+    """
+    List of (module name, seconds) for modules loaded through import_module, slowest first.
+    Times include modules imported by them.
+    """
+    return sorted(_import_times.items(), key=lambda item: item[1], reverse=True)
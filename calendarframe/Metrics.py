@@ -0,0 +1,154 @@
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+
+class Metrics:
+    def __init__(self, prefix="calendar"):
+        """
+        Durations of refresh phases and counters, for a single refresh.
+        Exported as JSON, or as a file for Prometheus node exporter's textfile collector.
+        :param prefix: Prefix of exported Prometheus metric names
+        """
+        self._prefix = prefix
+        self._phases = {}     # name -> {"wall": seconds, "cpu": seconds}, in the order of recording
+        self._providers = {}  # name -> {"wall": seconds, "cpu": seconds, "status": str}
+        self._counters = {}   # name -> value
+        self._timestamp = time.time()
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger("Metrics")
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Measures wall and CPU time of the code inside "with" block, adding it to the phase
+        """
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def add_phase(self, name, wall, cpu=None):
+        with self._lock:
+            phase = self._phases.setdefault(name, {"wall": 0.0, "cpu": 0.0})
+            phase["wall"] += wall
+            if cpu is not None:
+                phase["cpu"] += cpu
+
+    def add_provider(self, name, wall, cpu, status):
+        """
+        Records preload of an event provider
+        :param status: "succeeded", "failed", "timed_out", or "snapshot" if events were only loaded from a snapshot
+        """
+        with self._lock:
+            self._providers[name] = {"wall": wall, "cpu": cpu, "status": status}
+
+    def add(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set(self, name, value):
+        with self._lock:
+            self._counters[name] = value
+
+    def get_phase(self, name):
+        """
+        Returns (wall, cpu) time of the phase in seconds, or None if it wasn't recorded
+        """
+        with self._lock:
+            phase = self._phases.get(name)
+            return None if phase is None else (phase["wall"], phase["cpu"])
+
+    def get_report(self):
+        with self._lock:
+            return {
+                "timestamp": self._timestamp,
+                "phases": {name: dict(phase) for name, phase in self._phases.items()},
+                "providers": {name: dict(provider) for name, provider in self._providers.items()},
+                "counters": dict(self._counters),
+            }
+
+    def log(self):
+        report = self.get_report()
+        for name, phase in report["phases"].items():
+            self._logger.debug("{}: {:.3f}s (CPU {:.3f}s)".format(name, phase["wall"], phase["cpu"]))
+        for name, provider in report["providers"].items():
+            self._logger.debug("preload {}: {:.3f}s (CPU {:.3f}s), {}".format(
+                name, provider["wall"], provider["cpu"], provider["status"]))
+        for name, value in report["counters"].items():
+            self._logger.debug("{}: {}".format(name, value))
+
+    def save_json(self, path):
+        self._write(path, json.dumps(self.get_report(), indent=2))
+
+    def save_prometheus(self, path):
+        """
+        Saves metrics in Prometheus text format. Point node exporter's textfile collector to the directory.
+        """
+        report = self.get_report()
+        lines = []
+
+        def metric(name, help_text, samples):
+            name = "{}_{}".format(self._prefix, name)
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} gauge".format(name))
+            for labels, value in samples:
+                if labels:
+                    labels = "{" + ",".join('{}="{}"'.format(key, self._escape(label))
+                                            for key, label in labels.items()) + "}"
+                lines.append("{}{} {}".format(name, labels or "", repr(float(value))))
+
+        metric("last_refresh_timestamp_seconds", "Time of the refresh", [({}, report["timestamp"])])
+        metric(
+            "phase_seconds",
+            "Wall time of refresh phases",
+            [({"phase": name}, phase["wall"]) for name, phase in report["phases"].items()])
+        metric(
+            "phase_cpu_seconds",
+            "CPU time of refresh phases",
+            [({"phase": name}, phase["cpu"]) for name, phase in report["phases"].items()])
+        metric(
+            "provider_preload_seconds",
+            "Wall time of preloading events from a provider",
+            [({"provider": name, "status": provider["status"]}, provider["wall"])
+             for name, provider in report["providers"].items()])
+        metric(
+            "provider_preload_cpu_seconds",
+            "CPU time of preloading events from a provider",
+            [({"provider": name, "status": provider["status"]}, provider["cpu"])
+             for name, provider in report["providers"].items()])
+        for name, value in report["counters"].items():
+            metric(name, name.replace("_", " ").capitalize(), [({}, value)])
+
+        self._write(path, "\n".join(lines) + "\n")
+
+    @staticmethod
+    def _escape(text):
+        return str(text).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+    @staticmethod
+    def _write(path, text):
+        # Write and rename, so collectors never read a partial file
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Temporary file is unique, as several processes can export to the same path (e.g. batch profiles)
+        descriptor, temporary_path = tempfile.mkstemp(
+            dir=directory or ".",
+            prefix=os.path.basename(path) + ".",
+            suffix=".tmp")
+        try:
+            # Readable by collectors running as other users, as files created with open()
+            os.fchmod(descriptor, 0o644)
+            with os.fdopen(descriptor, "w") as file:
+                file.write(text)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
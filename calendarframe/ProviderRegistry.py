@@ -0,0 +1,28 @@
+from .LazyImport import import_module
+
+# Provider name -> (module, class name). Modules are imported when provider is first used.
+_providers = {
+    "ics": ("calendarframe.EventProviderICS", "EventProviderICS"),
+    "caldav": ("calendarframe.EventProviderCalDAV", "EventProviderCalDAV"),
+}
+
+
+def register_provider(name, module, class_name):
+    _providers[name] = (module, class_name)
+
+
+def get_provider_names():
+    return list(_providers.keys())
+
+
+def get_provider_class(name):
+    if name not in _providers:
+        raise ValueError("Unknown event provider \"{}\", expected one of: {}".format(
+            name,
+            ", ".join(_providers.keys())))
+    module, class_name = _providers[name]
+    return getattr(import_module(module), class_name)
+
+
+def create_provider(name, **kwargs):
+    return get_provider_class(name)(**kwargs)
@@ -0,0 +1,140 @@
+import copy
+import datetime
+import logging
+import os
+import pickle
+import icalevents.icalparser as icalparser
+
+# Occurrences are kept a bit outside of the window, as time zone of the calendar may differ from the event's one
+_KEEP_MARGIN = datetime.timedelta(days=2)
+
+
+class RecurrenceCache:
+    def __init__(self, path=None):
+        """
+        Keeps occurrences of recurring events, so when the window moves, only days that entered it are expanded.
+        Events are identified by UID, and expanded again from scratch when anything in their definition changes.
+        :param path: File for keeping occurrences between runs, None to keep them only in memory
+        """
+        self._path = path
+        self._entries = {}  # uid -> {"key", "from", "to", "events"}
+        self._used = set()
+        self._changed = False
+        self._logger = logging.getLogger("RecurrenceCache")
+
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, "rb") as file:
+                    self._entries = pickle.load(file)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+                self._logger.warning("Couldn't load cached occurrences: {}".format(e))
+
+    def expand(self, definitions, date_from, date_to, get_content):
+        """
+        Returns occurrences of recurring events from date_from to date_to, like icalparser.parse_events.
+        Returned events are copies, and can be modified.
+
+        :param definitions: UID -> value that changes when the event's definition changes
+               (e.g. hash of its components)
+        :param get_content: Function returning ICS content for list of UIDs - with all components of those events
+               (including modified instances), and time zones they use
+        """
+        events = {}
+        requests = {}  # (from, to) -> UIDs that need expanding
+        for uid, key in definitions.items():
+            self._used.add(uid)
+            entry = self._entries.get(uid)
+            if entry is None or entry["key"] != key or date_to < entry["from"] or date_from > entry["to"]:
+                events[uid] = []
+                requests.setdefault((date_from, date_to), []).append(uid)
+            else:
+                # Only days that weren't expanded yet
+                events[uid] = entry["events"]
+                if date_from < entry["from"]:
+                    requests.setdefault((date_from, entry["from"]), []).append(uid)
+                if date_to > entry["to"]:
+                    requests.setdefault((entry["to"], date_to), []).append(uid)
+
+        # Events needing the same days are expanded together
+        expanded = set()
+        for (range_from, range_to), uids in requests.items():
+            self._logger.debug("Expanding {} events from {} to {}".format(len(uids), range_from, range_to))
+            for event in icalparser.parse_events(get_content(uids), start=range_from, end=range_to):
+                if event.uid in events:
+                    events[event.uid] = events[event.uid] + [event]
+            expanded.update(uids)
+
+        low = self._day_start(date_from) - _KEEP_MARGIN
+        high = self._day_start(date_to) + _KEEP_MARGIN
+        for uid in expanded:
+            # Ranges share their ends, so occurrences on them were found twice
+            unique = {}
+            for event in events[uid]:
+                unique.setdefault((event.start, event.end, event.recurrence_id), event)
+            events[uid] = [
+                event for event in self._remove_replaced(list(unique.values()))
+                if low <= self._wall_clock(event.start) <= high]
+
+            self._entries[uid] = {"key": definitions[uid], "from": date_from, "to": date_to, "events": events[uid]}
+            self._changed = True
+
+        return [
+            copy.copy(event)
+            for uid in definitions
+            for event in events[uid]
+            if self._is_in_window(event, date_from, date_to)]
+
+    def save(self):
+        """
+        Saves occurrences, forgetting events that weren't expanded since the cache was loaded
+        """
+        for uid in list(self._entries.keys()):
+            if uid not in self._used:
+                del self._entries[uid]
+                self._changed = True
+        self._used = set()
+
+        if self._path is None or not self._changed:
+            return
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        with open(self._path + ".tmp", "wb") as file:
+            pickle.dump(self._entries, file)
+        os.replace(self._path + ".tmp", self._path)
+        self._changed = False
+
+    @staticmethod
+    def _remove_replaced(events):
+        # Occurrences replaced by a modified instance (RECURRENCE-ID) found in another range
+        replaced = set()
+        replaced_days = set()
+        for event in events:
+            if isinstance(event.recurrence_id, datetime.datetime):
+                replaced.add(event.recurrence_id)
+            elif event.recurrence_id:
+                # All day events are identified by date
+                replaced_days.add(RecurrenceCache._wall_clock(event.recurrence_id))
+        return [
+            event for event in events
+            if event.recurrence_id or
+            (event.start not in replaced and RecurrenceCache._wall_clock(event.start) not in replaced_days)]
+
+    @classmethod
+    def _is_in_window(cls, event, date_from, date_to):
+        # Same rules as icalparser - occurrences have to start in the window, modified instances overlap it.
+        # Window ends are compared with calendar's local time.
+        start = cls._wall_clock(event.start)
+        window_from = cls._day_start(date_from)
+        window_to = cls._day_start(date_to)
+        if event.recurrence_id:
+            return cls._wall_clock(event.end) >= window_from and start <= window_to
+        return window_from <= start <= window_to
+
+    @staticmethod
+    def _wall_clock(value):
+        if isinstance(value, datetime.datetime):
+            return value.replace(tzinfo=None)
+        return datetime.datetime(value.year, value.month, value.day)
+
+    @staticmethod
+    def _day_start(value):
+        return datetime.datetime(value.year, value.month, value.day)
@@ -0,0 +1,226 @@
+import datetime
+import hashlib
+import http.server
+import logging
+import threading
+import time
+import urllib.parse
+from dateutil import tz
+from .BatchRenderer import FORMAT_PNG, FORMAT_PLANES, PreloadedEventProvider, create_shared_providers, encode_png
+from .CalendarFrameDraw import CalendarFrameDraw, Config, EventProviderAggregate
+from .SunTable import SunTable
+
+_CONTENT_TYPES = {
+    FORMAT_PNG: "image/png",
+    FORMAT_PLANES: "application/octet-stream",
+}
+
+
+class RenderServer:
+    def __init__(self, profiles, config: Config = None, address=("", 8080)):
+        """
+        Serves calendars over HTTP, for displays that can't draw them:
+        /<profile>.png, and /<profile>.planes for monochrome profiles (packed planes, as sent to the display).
+        Frames are kept in memory until the date, events, or order of sunrise and sunset change. Each has an ETag,
+        so clients polling with If-None-Match get an empty response until the frame changes.
+        :param profiles: List of BatchProfile, output files are not used
+        :param config: Configuration of preloading and caches shared by all profiles.
+               Events are loaded again every daemon_refresh_interval minutes.
+        """
+        if config is None:
+            config = Config()
+        names = [profile.name for profile in profiles]
+        if len(set(names)) != len(names):
+            raise ValueError("Profile names should be unique")
+
+        self._config = config
+        self._profiles = {profile.name: profile for profile in profiles}
+        self._configs = {profile.name: profile.create_config(config.cache_dir) for profile in profiles}
+        # Drawing monochrome images replaces colors in the config
+        self._colors = {name: list(profile_config.colors) for name, profile_config in self._configs.items()}
+        self._sun = {
+            name: SunTable.shared(*profile_config.today_sunrise_coordinates, cache_dir=profile_config.cache_dir)
+            for name, profile_config in self._configs.items()}
+
+        self._providers, self._profile_keys = create_shared_providers(profiles, config.cache_dir)
+        self._event_provider = EventProviderAggregate(
+            list(self._providers.values()),
+            config.preload_workers,
+            config.preload_timeout,
+            config.preload_deadline)
+        self._events = None  # (date, digest, key -> PreloadedEventProvider), replaced as a whole
+        self._events_expire = 0
+        self._events_failed = None  # Date events couldn't be preloaded for, until _events_expire
+        self._events_lock = threading.Lock()
+
+        self._frames = {}  # name -> {"key", format -> (ETag, data)}
+        self._frame_locks = {name: threading.Lock() for name in self._profiles}
+        self._logger = logging.getLogger("RenderServer")
+
+        self._server = http.server.ThreadingHTTPServer(address, _RequestHandler)
+        self._server.daemon_threads = True
+        self._server.render_server = self
+
+    def get_address(self):
+        return self._server.server_address
+
+    def serve_forever(self):
+        self._logger.info("Serving {} profiles on {}:{}".format(len(self._profiles), *self.get_address()[:2]))
+        self._server.serve_forever()
+
+    def shutdown(self):
+        """
+        Stops serve_forever, has to be called from another thread
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def get_frame(self, name, output_format):
+        """
+        Returns (ETag, data) of the current frame of a profile, rendering it if needed.
+        Returns None if there's no such profile, or it isn't available in this format.
+        """
+        if name not in self._profiles or output_format not in _CONTENT_TYPES:
+            return None
+        if output_format == FORMAT_PLANES and not self._configs[name].monochrome:
+            return None
+
+        now = datetime.datetime.now(tz=tz.tzlocal())
+        date, digest, events = self._get_events(now.date())
+        sun = self._sun[name]
+        key = (date, digest, sun.get_local_sunrise_time(date) < now, sun.get_local_sunset_time(date) < now)
+
+        frame = self._frames.get(name)
+        if frame is None or frame["key"] != key:
+            # Only one request renders the frame, others wait for it
+            with self._frame_locks[name]:
+                frame = self._frames.get(name)
+                if frame is None or frame["key"] != key:
+                    frame = self._render(name, key, events, now)
+                    self._frames[name] = frame
+        return frame[output_format]
+
+    def _render(self, name, key, events, reference):
+        begin = time.perf_counter()
+        keys = self._profile_keys[name]
+        available = [events[provider_key] for provider_key in keys if provider_key in events]
+        if len(available) < len(keys):
+            self._logger.warning("Events from {} of {} providers of profile \"{}\" are missing".format(
+                len(keys) - len(available), len(keys), name))
+
+        config = self._configs[name]
+        calendar_draw = CalendarFrameDraw(available, config, reference)
+        calendar_draw.draw(preload=False)
+
+        frame = {"key": key, FORMAT_PNG: self._entry(encode_png(calendar_draw.get_images(), self._colors[name]))}
+        if config.monochrome:
+            planes = calendar_draw.get_packed_planes(self._profiles[name].panel_size)
+            frame[FORMAT_PLANES] = self._entry(b"".join(bytes(plane) for plane in planes))
+        self._logger.info("Rendered profile \"{}\" in {:.2f}s".format(name, time.perf_counter() - begin))
+        return frame
+
+    def _get_events(self, today):
+        if self._events_due(today):
+            # One request loads events again, others use the previous ones meanwhile - unless the date changed
+            events = self._events
+            if self._events_lock.acquire(blocking=events is None or events[0] != today):
+                try:
+                    if self._events_due(today):
+                        self._load_events(today)
+                finally:
+                    self._events_lock.release()
+
+        events = self._events
+        if events is None or events[0] != today:
+            raise RuntimeError("Couldn't preload events for {}, trying again later".format(today))
+        return events
+
+    def _events_due(self, today):
+        # Failed preload is tried again only when it expires, not for every request
+        if time.monotonic() >= self._events_expire:
+            return True
+        events = self._events
+        return (events is None or events[0] != today) and self._events_failed != today
+
+    def _load_events(self, today):
+        ranges = [CalendarFrameDraw.get_date_range(config, today) for config in self._configs.values()]
+        date_from = min(date_range[0] for date_range in ranges)
+        date_to = max(date_range[1] for date_range in ranges)
+        interval = (self._config.daemon_refresh_interval or 60)*60
+
+        self._logger.info("Preloading events from {} to {}...".format(date_from, date_to))
+        try:
+            result = self._event_provider.preload(date_from, date_to)
+        except RuntimeError:
+            self._events_expire = time.monotonic() + interval
+            if self._events is None or self._events[0] != today:
+                self._events_failed = today
+                raise
+            self._logger.exception("Preloading events failed, keeping the previous ones")
+            return
+
+        events = {
+            key: PreloadedEventProvider(provider, date_from, date_to)
+            for key, provider in self._providers.items() if provider in result.succeeded}
+        self._events = (today, self._digest(events), events)
+        self._events_failed = None
+        self._events_expire = time.monotonic() + interval
+
+    @staticmethod
+    def _digest(events):
+        # Frames are drawn again only if events changed, not after every preload
+        sha = hashlib.sha1()
+        for key in sorted(events.keys()):
+            sha.update(repr(key).encode())
+            for event in events[key].get_all_events():
+                sha.update(repr((event.uid, str(event.start), str(event.end), event.all_day, event.summary)).encode())
+        return sha.hexdigest()
+
+    @staticmethod
+    def _entry(data):
+        return '"{}"'.format(hashlib.sha256(data).hexdigest()[:32]), data
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "WaveshareEInkCalendar"
+
+    def do_GET(self):
+        path = urllib.parse.unquote(urllib.parse.urlparse(self.path).path)
+        name, _, output_format = path.lstrip("/").rpartition(".")
+        try:
+            frame = self.server.render_server.get_frame(name, output_format)
+        except Exception:
+            logging.getLogger("RenderServer").exception("Rendering profile \"{}\" failed".format(name))
+            self.send_error(500)
+            return
+        if frame is None:
+            self.send_error(404)
+            return
+
+        etag, data = frame
+        if self._matches(etag):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", _CONTENT_TYPES[output_format])
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _matches(self, etag):
+        # Weak comparison, as for GET: W/ prefix is ignored, and * matches any frame
+        for tag in self.headers.get("If-None-Match", "").split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag == "*" or tag == etag:
+                return True
+        return False
+
+    def log_message(self, format, *args):
+        logging.getLogger("RenderServer").debug("{} - {}".format(self.address_string(), format % args))
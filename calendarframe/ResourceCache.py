@@ -0,0 +1,84 @@
+import logging
+import threading
+from PIL import Image
+from PIL import ImageFont
+
+
+class ResourceCache:
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        """
+        Keeps loaded fonts and 1-bit icons, so they are loaded once for multiple renders
+        """
+        self._fonts = {}  # (path, size) -> FreeTypeFont
+        self._icons = {}  # path -> 1-bit image
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger("ResourceCache")
+
+    @classmethod
+    def shared(cls):
+        """
+        Process-wide instance
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = ResourceCache()
+            return cls._shared
+
+    def get_font(self, path, size):
+        key = (path, size)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self._hits += 1
+                return font
+            self._misses += 1
+            self._logger.debug("Loading font {} ({}px)".format(path, size))
+            font = ImageFont.truetype(path, size)
+            self._fonts[key] = font
+            return font
+
+    def get_icon(self, path):
+        """
+        Icon converted to 1-bit image. Returned image is shared, it shouldn't be modified.
+        """
+        with self._lock:
+            icon = self._icons.get(path)
+            if icon is not None:
+                self._hits += 1
+                return icon
+            self._misses += 1
+            self._logger.debug("Loading icon {}".format(path))
+            with Image.open(path) as image:
+                icon = image.convert("1")
+            self._icons[path] = icon
+            return icon
+
+    def warm_up(self, fonts=(), icons=()):
+        """
+        Loads resources in advance
+        :param fonts: List of (path, size) tuples
+        :param icons: List of icon paths
+        """
+        for path, size in fonts:
+            self.get_font(path, size)
+        for path in icons:
+            self.get_icon(path)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "fonts": len(self._fonts),
+                "icons": len(self._icons),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._fonts.clear()
+            self._icons.clear()
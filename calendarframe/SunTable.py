@@ -0,0 +1,154 @@
+import datetime
+import json
+import logging
+import os
+import threading
+from dateutil import tz
+
+# Version of the table format, and of the way it's computed
+_TABLE_VERSION = 1
+
+
+class SunTable:
+    _shared = {}  # (latitude, longitude, cache_dir) -> SunTable
+    _shared_lock = threading.Lock()
+
+    def __init__(self, latitude, longitude, cache_dir=None):
+        """
+        Sunrise and sunset times for given coordinates. Times are computed for a whole year at once,
+        and saved, so drawing only looks them up.
+        :param cache_dir: Directory for computed tables, None to keep them only in memory
+        """
+        self._latitude = latitude
+        self._longitude = longitude
+        self._cache_dir = cache_dir
+        self._years = {}  # year -> (sunrise timestamps, sunset timestamps), None if the sun doesn't rise/set
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger("SunTable")
+
+    @classmethod
+    def shared(cls, latitude, longitude, cache_dir=None):
+        """
+        Process-wide instance for the coordinates, so tables are loaded once for all renders
+        """
+        key = (latitude, longitude, cache_dir)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = SunTable(latitude, longitude, cache_dir)
+            return cls._shared[key]
+
+    def get_local_sunrise_time(self, date):
+        """
+        Returns sunrise time in local time zone
+        :raises: ValueError if the sun doesn't rise on that day
+        """
+        timestamp = self._get(date)[0]
+        if timestamp is None:
+            raise ValueError("The sun never rises on this location on {}".format(date))
+        return self._to_local(timestamp)
+
+    def get_local_sunset_time(self, date):
+        """
+        Returns sunset time in local time zone
+        :raises: ValueError if the sun doesn't set on that day
+        """
+        timestamp = self._get(date)[1]
+        if timestamp is None:
+            raise ValueError("The sun never sets on this location on {}".format(date))
+        return self._to_local(timestamp)
+
+    def get_sunrise_trend(self, date, days):
+        """
+        Returns -1 if sunrise is getting earlier, 1 if later, 0 if it doesn't change during next days
+        """
+        return self._trend(date, days, 0)
+
+    def get_sunset_trend(self, date, days):
+        """
+        Returns -1 if sunset is getting earlier, 1 if later, 0 if it doesn't change during next days
+        """
+        return self._trend(date, days, 1)
+
+    def _trend(self, date, days, column):
+        # Day over day differences of the local time of the day, summed until it differs from the first day.
+        # Local times include changes of the clock, as when times of following days were compared in the frame.
+        difference = 0
+        for i in range(1, days):
+            previous = self._get(date + datetime.timedelta(days=i-1))[column]
+            current = self._get(date + datetime.timedelta(days=i))[column]
+            if previous is None or current is None:
+                return 0
+            difference += self._wall_clock(current) - self._wall_clock(previous) - 24*60*60
+            if difference != 0:
+                return -1 if difference < 0 else 1
+        return 0
+
+    def _get(self, date):
+        table = self._years.get(date.year)
+        if table is None:
+            with self._lock:
+                table = self._years.get(date.year)
+                if table is None:
+                    table = self._load(date.year)
+                    self._years[date.year] = table
+        day = (datetime.date(date.year, date.month, date.day) - datetime.date(date.year, 1, 1)).days
+        return table[0][day], table[1][day]
+
+    def _load(self, year):
+        path = None
+        if self._cache_dir is not None:
+            path = os.path.join(
+                self._cache_dir,
+                "sun",
+                "{:.4f}_{:.4f}_{}.json".format(self._latitude, self._longitude, year))
+            try:
+                with open(path, "r") as file:
+                    data = json.load(file)
+                if data.get("version") == _TABLE_VERSION and \
+                        data.get("coordinates") == [self._latitude, self._longitude]:
+                    return data["sunrise"], data["sunset"]
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError) as e:
+                self._logger.warning("Couldn't load sunrise table: {}".format(e))
+
+        table = self._compute(year)
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w") as file:
+                json.dump({
+                    "version": _TABLE_VERSION,
+                    "coordinates": [self._latitude, self._longitude],
+                    "sunrise": table[0],
+                    "sunset": table[1],
+                }, file)
+            os.replace(path + ".tmp", path)
+        return table
+
+    def _compute(self, year):
+        # Day by day with suntime, as the frame computed them before - numpy isn't a dependency
+        # for a vectorized computation, and a year takes only milliseconds once it's saved
+        from suntime import Sun, SunTimeException
+
+        self._logger.debug("Computing sunrise and sunset times for {}".format(year))
+        sun = Sun(self._latitude, self._longitude)
+        sunrise = []
+        sunset = []
+        date = datetime.date(year, 1, 1)
+        while date.year == year:
+            for times, function in ((sunrise, sun.get_sunrise_time), (sunset, sun.get_sunset_time)):
+                try:
+                    times.append(int(function(date).timestamp()))
+                except SunTimeException:
+                    times.append(None)
+            date += datetime.timedelta(days=1)
+        return sunrise, sunset
+
+    @staticmethod
+    def _wall_clock(timestamp):
+        # Seconds since epoch as shown by local clock
+        return timestamp + int(SunTable._to_local(timestamp).utcoffset().total_seconds())
+
+    @staticmethod
+    def _to_local(timestamp):
+        return datetime.datetime.fromtimestamp(timestamp, tz=tz.tzutc()).astimezone(tz.tzlocal())
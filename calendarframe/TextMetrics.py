@@ -0,0 +1,81 @@
+import collections
+import threading
+
+
+class TextMetrics:
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_entries=4096):
+        """
+        Keeps sizes of measured texts, so the same strings (day numbers, times, event counts) are measured once
+        :param max_entries: Number of sizes kept, least recently used ones are dropped first
+        """
+        self._max_entries = max_entries
+        self._sizes = collections.OrderedDict()  # (font path, font size, text) -> (width, height)
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        """
+        Process-wide instance
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = TextMetrics()
+            return cls._shared
+
+    def get_size(self, font, text):
+        """
+        Returns size of text drawn with font, like font.getsize
+        """
+        key = (getattr(font, "path", id(font)), getattr(font, "size", None), text)
+        with self._lock:
+            size = self._sizes.get(key)
+            if size is not None:
+                self._hits += 1
+                self._sizes.move_to_end(key)
+                return size
+
+        size = font.getsize(text)
+        with self._lock:
+            self._misses += 1
+            self._sizes[key] = size
+            while len(self._sizes) > self._max_entries:
+                self._sizes.popitem(last=False)
+        return size
+
+    def fit_to_width(self, font, text, width, ellipsis="…"):
+        """
+        Returns text if it fits in width, otherwise its longest beginning that fits with ellipsis appended.
+        Returns empty string if not even ellipsis fits.
+        """
+        if self.get_size(font, text)[0] <= width:
+            return text
+
+        if self.get_size(font, ellipsis)[0] > width:
+            return ""
+
+        # Longer beginnings are wider, so the longest one that fits is found by bisection
+        low, high = 0, len(text) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.get_size(font, text[:middle].rstrip() + ellipsis)[0] <= width:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low].rstrip() + ellipsis
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "sizes": len(self._sizes),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._sizes.clear()
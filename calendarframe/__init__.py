@@ -1,5 +1,52 @@
-from .IEventProvider import IEventProvider
-from .EventProviderCalDAV import EventProviderCalDAV
-from .EventProviderICS import EventProviderICS
-from .CalendarFrameDraw import CalendarFrameDraw, Config
-from .DrawUtils import *
\ No newline at end of file
+import sys
+import types
+from .DrawUtils import *
+from .LazyImport import import_module, get_import_report
+from .ProviderRegistry import register_provider, get_provider_class, create_provider
+
+# Modules pulling heavy dependencies (PIL, caldav, icalevents) are imported on first use
+_lazy_attributes = {
+    "IEventProvider": ".IEventProvider",
+    "EventProviderCalDAV": ".EventProviderCalDAV",
+    "EventProviderICS": ".EventProviderICS",
+    "CalendarFrameDraw": ".CalendarFrameDraw",
+    "Config": ".CalendarFrameDraw",
+    "FrameStore": ".FrameStore",
+    "ResourceCache": ".ResourceCache",
+    "CellCache": ".CellCache",
+    "Metrics": ".Metrics",
+    "RecurrenceCache": ".RecurrenceCache",
+    "SunTable": ".SunTable",
+    "TextMetrics": ".TextMetrics",
+    "EventSnapshot": ".EventSnapshot",
+    "SnapshotEventProvider": ".EventSnapshot",
+    "BatchRenderer": ".BatchRenderer",
+    "BatchProfile": ".BatchRenderer",
+    "PreloadedEventProvider": ".BatchRenderer",
+    "RenderServer": ".RenderServer",
+}
+
+
+def __getattr__(name):
+    # Called only for names the package doesn't have yet, resolved names are kept in the package
+    if name not in _lazy_attributes:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(import_module(_lazy_attributes[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes))
+
+
+class _Package(types.ModuleType):
+    # Modules share names with their classes, and importing a submodule binds it to the package.
+    # Such bindings are skipped, so the name always gives the class, as when all modules were imported here.
+    def __setattr__(self, name, value):
+        if name in _lazy_attributes and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
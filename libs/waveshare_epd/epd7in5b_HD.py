@@ -29,20 +29,46 @@
 
 
 import logging
+import time
+from PIL import Image
 from . import epdconfig
 
 # Display resolution
 EPD_WIDTH       = 880
 EPD_HEIGHT      = 528
 
+# Bytes sent in a single SPI transfer, and SPI clock
+SPI_CHUNK_SIZE  = 4096
+SPI_SPEED_HZ    = 4000000
+
+# First RAM row used by the panel, rows are written with decrementing Y address
+RAM_Y_START     = 0x2AF
+
+# Dirty rows separated by at most this many clean rows are uploaded as one region
+REGION_MERGE_ROWS = 8
+
+# Lookup table for inverting whole buffers with bytes.translate
+_INVERT = bytes(0xFF - i for i in range(256))
+
 class EPD:
-    def __init__(self):
+    def __init__(self, spi_speed_hz=SPI_SPEED_HZ, spi_chunk_size=SPI_CHUNK_SIZE):
+        if spi_chunk_size < 1:
+            raise ValueError("SPI chunk size should be positive")
         self.reset_pin = epdconfig.RST_PIN
         self.dc_pin = epdconfig.DC_PIN
         self.busy_pin = epdconfig.BUSY_PIN
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.spi_speed_hz = spi_speed_hz
+        self.spi_chunk_size = spi_chunk_size
+        self.module_initialized = False
+        # RAM is filled with a pattern by init() and lost in sleep(), it holds a frame only after one was uploaded
+        self.ram_holds_frame = False
+        # Statistics, for performance metrics
+        self.bytes_sent = 0
+        self.busy_seconds = 0.0
+        self.busy_cpu_seconds = 0.0
 
     # Hardware reset
     def reset(self):
@@ -58,36 +84,56 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
+        self.bytes_sent += 1
 
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+        self.bytes_sent += 1
+
+    def send_data2(self, data):
+        # Block transfer - DC/CS are set once for the whole buffer
+        data = memoryview(data)
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        for i in range(0, len(data), self.spi_chunk_size):
+            epdconfig.spi_writebyte2(data[i:i+self.spi_chunk_size])
+        epdconfig.digital_write(self.cs_pin, 1)
+        self.bytes_sent += len(data)
         
     def ReadBusy(self):
         logging.debug("e-Paper busy")
+        begin, begin_cpu = time.monotonic(), time.thread_time()
         busy = epdconfig.digital_read(self.busy_pin)
         while(busy == 1):
             busy = epdconfig.digital_read(self.busy_pin)
         epdconfig.delay_ms(200)
+        self.busy_seconds += time.monotonic() - begin
+        self.busy_cpu_seconds += time.thread_time() - begin_cpu
             
-    def init(self):
-        if (epdconfig.module_init() != 0):
+    def init(self, keep_ram=False):
+        # With keep_ram, RAM isn't filled with a pattern, so the frame uploaded before (without deep sleep
+        # in between) can be updated with display_partial
+        if (epdconfig.module_init(self.spi_speed_hz) != 0):
             return -1
+        self.module_initialized = True
             
         self.reset()
         
         self.send_command(0x12); 		  #SWRESET
         self.ReadBusy();        #waiting for the electronic paper IC to release the idle signal
 
-        self.send_command(0x46);  # Auto Write RAM
-        self.send_data(0xF7);
-        self.ReadBusy();        #waiting for the electronic paper IC to release the idle signal
+        if not keep_ram:
+            self.send_command(0x46);  # Auto Write RAM
+            self.send_data(0xF7);
+            self.ReadBusy();        #waiting for the electronic paper IC to release the idle signal
 
-        self.send_command(0x47);  # Auto Write RAM
-        self.send_data(0xF7);
-        self.ReadBusy();        #waiting for the electronic paper IC to release the idle signal
+            self.send_command(0x47);  # Auto Write RAM
+            self.send_data(0xF7);
+            self.ReadBusy();        #waiting for the electronic paper IC to release the idle signal
+            self.ram_holds_frame = False
 
         self.send_command(0x0C);  # Soft start setting
         self.send_data(0xAE);
@@ -135,41 +181,37 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # logging.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
+        # Packs the image straight from PIL's 1-bit raw data, which already is
+        # MSB-first with 1 for white - the same layout the panel expects.
+        linewidth = int(self.width/8)
         image_monocolor = image.convert('1')
         imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
         logging.debug('imwidth = %d  imheight =  %d ',imwidth, imheight)
         if(imwidth == self.width and imheight == self.height):
             logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
         elif(imwidth == self.height and imheight == self.width):
             logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+            # newx = y, newy = height - x - 1
+            image_monocolor = image_monocolor.transpose(Image.ROTATE_90)
+        else:
+            return bytearray([0xFF] * (linewidth * self.height))
+        return bytearray(image_monocolor.tobytes("raw", "1"))
 
     def display(self, imageblack, imagered):
+        self.display_packed(bytes(imageblack), bytes(imagered).translate(_INVERT))
+
+    def display_packed(self, imageblack, imagered_inverted):
+        # Planes as they are written to RAM - red plane has 1 for red pixels.
+        # Any buffer is accepted (bytes, bytearray, memoryview), and streamed without copying.
         self.send_command(0x4F); 
         self.send_data(0xAf);
         
         self.send_command(0x24)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(imageblack[i]);
-        
+        self.send_data2(imageblack)
         
         self.send_command(0x26)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(~imagered[i]);
+        self.send_data2(imagered_inverted)
+        self.ram_holds_frame = True
         
         self.send_command(0x22);
         self.send_data(0xC7);    #Load LUT from MCU(0x32)
@@ -182,13 +224,11 @@ class EPD:
         self.send_data(0xAf);
         
         self.send_command(0x24)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xff);
-        
+        self.send_data2(b'\xff' * int(self.width * self.height / 8))
         
         self.send_command(0x26)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0x00);
+        self.send_data2(b'\x00' * int(self.width * self.height / 8))
+        self.ram_holds_frame = False
         
         self.send_command(0x22);
         self.send_data(0xC7);    #Load LUT from MCU(0x32)
@@ -196,11 +236,128 @@ class EPD:
         epdconfig.delay_ms(200);      #!!!The delay here is necessary, 200uS at least!!!     
         self.ReadBusy();
 
+    def set_window(self, x0, y0, x1, y1):
+        # Pixel coordinates, end exclusive; x has to be byte aligned
+        ram_y0 = RAM_Y_START - y0
+        ram_y1 = RAM_Y_START - (y1 - 1)
+        self.send_command(0x44)
+        self.send_data(x0 & 0xFF)
+        self.send_data(x0 >> 8)
+        self.send_data((x1 - 1) & 0xFF)
+        self.send_data((x1 - 1) >> 8)
+        self.send_command(0x45)
+        self.send_data(ram_y0 & 0xFF)
+        self.send_data(ram_y0 >> 8)
+        self.send_data(ram_y1 & 0xFF)
+        self.send_data(ram_y1 >> 8)
+
+    def set_cursor(self, x, y):
+        ram_y = RAM_Y_START - y
+        self.send_command(0x4E)
+        self.send_data(x & 0xFF)
+        self.send_data(x >> 8)
+        self.send_command(0x4F)
+        self.send_data(ram_y & 0xFF)
+        self.send_data(ram_y >> 8)
+
+    def dirty_regions(self, previous_black, previous_red, imageblack, imagered, merge_rows=REGION_MERGE_ROWS):
+        """
+        Finds rectangles (x0, y0, x1, y1), in pixels with exclusive end, that differ between frames.
+        Rectangles are byte aligned horizontally and sorted from top to bottom.
+        """
+        linewidth = int(self.width/8)
+        planes = [(bytes(previous_black), bytes(imageblack)), (bytes(previous_red), bytes(imagered))]
+
+        rows = []
+        for y in range(self.height):
+            begin = y * linewidth
+            end = begin + linewidth
+            diff = 0
+            for previous, current in planes:
+                if previous[begin:end] != current[begin:end]:
+                    diff |= int.from_bytes(previous[begin:end], 'big') ^ int.from_bytes(current[begin:end], 'big')
+            if diff:
+                # Highest set bit is the first changed byte, lowest set bit is the last one
+                first = linewidth - 1 - (diff.bit_length() - 1) // 8
+                last = linewidth - 1 - ((diff & -diff).bit_length() - 1) // 8
+                rows.append((y, first, last))
+
+        regions = []
+        for y, first, last in rows:
+            if regions and y - regions[-1][3] <= merge_rows:
+                x0, y0, x1, _ = regions[-1]
+                regions[-1] = [min(x0, first*8), y0, max(x1, (last+1)*8), y+1]
+            else:
+                regions.append([first*8, y, (last+1)*8, y+1])
+
+        return [tuple(region) for region in regions]
+
+    def display_partial(self, imageblack, imagered, previous_black, previous_red):
+        """
+        Uploads only regions that changed since previous frame, and refreshes the display.
+        Panel RAM has to hold the previous frame - after init() without keep_ram or after sleep() it doesn't,
+        so the whole frame is uploaded. Refresh itself (0x22/0xC7) always updates the whole panel.
+        Returns the list of uploaded regions.
+        """
+        return self.display_partial_packed(
+            bytes(imageblack),
+            bytes(imagered).translate(_INVERT),
+            previous_black,
+            bytes(previous_red).translate(_INVERT))
+
+    def display_partial_packed(self, imageblack, imagered_inverted, previous_black, previous_red_inverted):
+        """
+        display_partial for planes as they are written to RAM, see display_packed
+        """
+        if not self.ram_holds_frame:
+            logging.debug("RAM doesn't hold the previous frame, uploading whole frame")
+            self.display_packed(imageblack, imagered_inverted)
+            return [(0, 0, self.width, self.height)]
+
+        linewidth = int(self.width/8)
+        imageblack = memoryview(imageblack)
+        imagered_inverted = memoryview(imagered_inverted)
+
+        # Inverting both frames doesn't change the differences
+        regions = self.dirty_regions(previous_black, previous_red_inverted, imageblack, imagered_inverted)
+        if not regions:
+            logging.debug("Frame didn't change, skipping refresh")
+            return regions
+
+        ram_planes = [(0x24, imageblack), (0x26, imagered_inverted)]
+        for x0, y0, x1, y1 in regions:
+            logging.debug("Updating region %d,%d - %d,%d", x0, y0, x1, y1)
+            self.set_window(x0, y0, x1, y1)
+            for command, plane in ram_planes:
+                data = b''.join(
+                    plane[y*linewidth + x0//8:y*linewidth + x1//8]
+                    for y in range(y0, y1))
+                self.set_cursor(x0, y0)
+                self.send_command(command)
+                self.send_data2(data)
+
+        # Restore window and cursor set in init(), for display() and Clear()
+        self.set_window(0, 0, self.width, RAM_Y_START + 1)
+        self.set_cursor(0, 0)
+
+        self.send_command(0x22);
+        self.send_data(0xC7);    #Load LUT from MCU(0x32)
+        self.send_command(0x20);
+        epdconfig.delay_ms(200);      #!!!The delay here is necessary, 200uS at least!!!
+        self.ReadBusy();
+        return regions
+
     def sleep(self):
         self.send_command(0x10);  	#deep sleep
         self.send_data(0x01);
+        # Waking up needs a hardware reset, RAM isn't kept
+        self.ram_holds_frame = False
         
     def Dev_exit(self):
+        # Nothing to release if init() was never called
+        if not self.module_initialized:
+            return
         epdconfig.module_exit()
+        self.module_initialized = False
 ### END OF FILE ###
 
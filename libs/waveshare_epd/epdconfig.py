@@ -64,14 +64,14 @@ class RaspberryPi:
     def spi_writebyte2(self, data):
         self.SPI.writebytes2(data)
 
-    def module_init(self):
+    def module_init(self, spi_speed_hz=4000000):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
         self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.DC_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.CS_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.BUSY_PIN, self.GPIO.IN)
-        self.SPI.max_speed_hz = 4000000
+        self.SPI.max_speed_hz = spi_speed_hz
         self.SPI.mode = 0b00
         return 0
 
@@ -124,7 +124,12 @@ class JetsonNano:
     def spi_writebyte(self, data):
         self.SPI.SYSFS_software_spi_transfer(data[0])
 
-    def module_init(self):
+    def spi_writebyte2(self, data):
+        # Software SPI has no block transfer
+        for byte in data:
+            self.SPI.SYSFS_software_spi_transfer(byte)
+
+    def module_init(self, spi_speed_hz=None):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
         self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
@@ -145,7 +150,131 @@ class JetsonNano:
         self.GPIO.cleanup()
 
 
-if os.path.exists('/sys/bus/platform/drivers/gpiomem-bcm2835'):
+class Simulator:
+    # Pin definition
+    RST_PIN         = 17
+    DC_PIN          = 25
+    CS_PIN          = 8
+    BUSY_PIN        = 24
+
+    # Controller RAM size: 880 pixels (110 bytes) in X, 688 rows in Y
+    RAM_WIDTH       = 110
+    RAM_HEIGHT      = 688
+
+    def __init__(self):
+        # Select with EPD_SIMULATOR=1, for running the driver without a panel.
+        # Decodes commands sent over SPI and keeps contents of black (0x24) and red (0x26) RAM.
+        self.pins = {}
+        self.spi_bytes = 0
+        self.spi_speed_hz = None
+        self.refreshes = 0
+        self.ram = {
+            0x24: bytearray(self.RAM_WIDTH * self.RAM_HEIGHT),
+            0x26: bytearray(self.RAM_WIDTH * self.RAM_HEIGHT),
+        }
+        self._command = None
+        self._parameters = []
+        self._registers = {}
+        self._data_entry = 0x03
+        self._window = [0, self.RAM_WIDTH*8 - 1, 0, self.RAM_HEIGHT - 1]
+        self._cursor = [0, 0]
+        self._address = [0, 0]
+
+    def digital_write(self, pin, value):
+        self.pins[pin] = value
+
+    def digital_read(self, pin):
+        # Never busy
+        return 0
+
+    def delay_ms(self, delaytime):
+        pass
+
+    def spi_writebyte(self, data):
+        self.spi_writebyte2(data)
+
+    def spi_writebyte2(self, data):
+        self.spi_bytes += len(data)
+        if self.pins.get(self.DC_PIN, 0) == 0:
+            for command in data:
+                self._command = command
+                self._parameters = []
+                if command == 0x20:
+                    self.refreshes += 1
+                if command in self.ram:
+                    # The vendor sequence in display() sets the address once before both RAM writes,
+                    # so counters are reloaded from 0x4E/0x4F for every RAM write command
+                    self._address = list(self._cursor)
+        elif self._command in self.ram:
+            self._write_ram(self.ram[self._command], data)
+        else:
+            self._parameters.extend(data)
+            self._set_parameters(self._command, self._parameters)
+
+    def module_init(self, spi_speed_hz=4000000):
+        self.spi_speed_hz = spi_speed_hz
+        return 0
+
+    def module_exit(self):
+        logging.debug("spi end")
+
+    def get_ram(self, command, y_start, rows, y_decrement=True):
+        """
+        Returns rows of RAM as a packed buffer, starting from RAM row y_start.
+        """
+        buffer = bytearray()
+        for i in range(rows):
+            y = y_start - i if y_decrement else y_start + i
+            buffer += self.ram[command][y*self.RAM_WIDTH:(y+1)*self.RAM_WIDTH]
+        return buffer
+
+    def _set_parameters(self, command, parameters):
+        # Parameters are kept per command, so partial writes (e.g. 0x4F with one byte) keep the other bytes
+        registers = self._registers.setdefault(command, [0] * 4)
+        registers[:len(parameters)] = parameters
+
+        def word(i):
+            return registers[i] | (registers[i+1] << 8)
+
+        if command in (0x46, 0x47):
+            # Auto Write RAM fills red (0x46) or black (0x47) RAM with a regular pattern. Only losing the previous
+            # contents is simulated - RAM is filled with the value of the first step.
+            ram = self.ram[0x26 if command == 0x46 else 0x24]
+            ram[:] = (b'\xff' if registers[0] & 0x80 else b'\x00') * len(ram)
+        elif command == 0x10 and registers[0] & 0x03:
+            # Deep sleep - only losing contents of RAM is simulated
+            for ram in self.ram.values():
+                ram[:] = bytes(len(ram))
+        elif command == 0x11:
+            self._data_entry = registers[0]
+        elif command == 0x44:
+            self._window[0:2] = [word(0), word(2)]
+        elif command == 0x45:
+            self._window[2:4] = [word(0), word(2)]
+        elif command == 0x4E:
+            self._cursor[0] = word(0)
+        elif command == 0x4F:
+            self._cursor[1] = word(0)
+
+    def _write_ram(self, ram, data):
+        # Only X-first addressing is simulated, as used by the driver
+        x_step = 8 if self._data_entry & 0x01 else -8
+        y_step = 1 if self._data_entry & 0x02 else -1
+        x, y = self._address
+        for byte in data:
+            ram[y*self.RAM_WIDTH + x//8] = byte
+            x += x_step
+            if x_step > 0 and x > self._window[1] or x_step < 0 and x < self._window[1]:
+                x = self._window[0]
+                y += y_step
+                if y_step > 0 and y > self._window[3] or y_step < 0 and y < self._window[3]:
+                    y = self._window[2]
+        self._address = [x, y]
+
+
+if os.environ.get('EPD_SIMULATOR'):
+    implementation = Simulator()
+elif os.path.exists('/sys/bus/platform/drivers/gpiomem-bcm2835'):
     implementation = RaspberryPi()
 else:
     implementation = JetsonNano()
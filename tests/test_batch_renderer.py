@@ -0,0 +1,91 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from dateutil import tz
+from calendarframe.BatchRenderer import BatchProfile, BatchRenderer, FORMAT_PLANES
+from calendarframe.CalendarFrameDraw import Config
+from calendarframe.IEventProvider import IEventProvider
+from calendarframe.ProviderRegistry import register_provider
+
+REFERENCE = datetime.datetime(2021, 12, 22, 12, 0, tzinfo=tz.tzlocal())
+
+# Feed name -> number of preloads, counted by _StubProvider
+_PRELOADS = {}
+
+
+class _Event:
+    def __init__(self, summary, day):
+        self.summary = summary
+        self.uid = summary
+        self.description = None
+        self.location = None
+        self.start = datetime.datetime(2021, 12, day, 10)
+        self.end = datetime.datetime(2021, 12, day, 11)
+        self.all_day = False
+
+
+class _StubProvider(IEventProvider):
+    def __init__(self, feed, cache_dir=None):
+        IEventProvider.__init__(self)
+        self._feed = feed
+
+    def preload(self, date_from, date_to):
+        _PRELOADS[self._feed] = _PRELOADS.get(self._feed, 0) + 1
+        self._events = [_Event("Meeting", 20), _Event("Review", 22), _Event("Holiday party", 23)]
+        self._build_index(date_from, date_to)
+
+
+register_provider("batch-stub", __name__, "_StubProvider")
+
+
+class BatchRendererTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        _PRELOADS.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _profiles(self, directory):
+        providers = [("batch-stub", {"feed": "feed"})]
+        return [
+            BatchProfile("color", os.path.join(self._directory, directory, "color.png"), providers),
+            BatchProfile(
+                "mono",
+                os.path.join(self._directory, directory, "mono.planes"),
+                providers,
+                output_format=FORMAT_PLANES),
+        ]
+
+    def _render(self, profiles, workers=2):
+        config = Config()
+        config.cache_dir = os.path.join(self._directory, "cache")
+        return BatchRenderer(profiles, config, workers, REFERENCE).render()
+
+    def test_profiles_sharing_provider_match_single_renders(self):
+        profiles = self._profiles("batch")
+        rendered = self._render(profiles)
+        self.assertEqual(rendered, {profile.name: profile.output for profile in profiles})
+        # Provider shared by both profiles is preloaded once
+        self.assertEqual(_PRELOADS, {"feed": 1})
+
+        for profile, single in zip(profiles, self._profiles("single")):
+            with self.subTest(profile=profile.name):
+                self.assertEqual(self._render([single], workers=1), {single.name: single.output})
+                with open(profile.output, "rb") as file:
+                    data = file.read()
+                with open(single.output, "rb") as file:
+                    self.assertEqual(data, file.read())
+                self.assertTrue(data)
+
+        config = Config()
+        with open(profiles[1].output, "rb") as file:
+            self.assertEqual(len(file.read()), 2*config.size[0]*config.size[1]//8)
+        with open(profiles[0].output, "rb") as file:
+            self.assertTrue(file.read().startswith(b"\x89PNG"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import datetime
+import types
+import unittest
+from unittest import mock
+import main
+from calendarframe.CalendarFrameDraw import Config, PreloadResult
+from calendarframe.IEventProvider import IEventProvider
+
+
+class _Provider(IEventProvider):
+    def __init__(self, refresh_interval=None):
+        IEventProvider.__init__(self)
+        self._refresh_interval = refresh_interval
+
+    def preload(self, date_from, date_to):
+        self._events = []
+        self._build_index(date_from, date_to)
+
+
+class NextRefreshTest(unittest.TestCase):
+    def test_next_load_is_aligned_to_midnight(self):
+        now = datetime.datetime(2021, 12, 22, 10, 7, 30)
+        self.assertEqual(main.next_load(now, 15), datetime.datetime(2021, 12, 22, 10, 15))
+        self.assertEqual(main.next_load(now, 25), datetime.datetime(2021, 12, 22, 10, 25))
+        # Exactly at a multiple, the next one is returned
+        self.assertEqual(main.next_load(datetime.datetime(2021, 12, 22, 10, 15), 15),
+                         datetime.datetime(2021, 12, 22, 10, 30))
+
+    def test_next_load_is_not_after_midnight(self):
+        now = datetime.datetime(2021, 12, 22, 23, 50)
+        self.assertEqual(main.next_load(now, 7*60), datetime.datetime(2021, 12, 23))
+        self.assertEqual(main.next_load(now, 24*60), datetime.datetime(2021, 12, 23))
+        self.assertEqual(main.next_load(now, 0), datetime.datetime(2021, 12, 23))
+
+    def test_next_refresh_is_the_nearest_load_or_hour(self):
+        now = datetime.datetime(2021, 12, 22, 10, 7)
+        self.assertEqual(main.next_refresh(now, [24*60]), datetime.datetime(2021, 12, 22, 11))
+        self.assertEqual(main.next_refresh(now, [24*60, 20, 30]), datetime.datetime(2021, 12, 22, 10, 20))
+        self.assertEqual(main.next_refresh(now, []), datetime.datetime(2021, 12, 22, 11))
+
+
+class _Clock:
+    """
+    Stands in for datetime.datetime and threading.Event in main, time passes only while the daemon waits
+    """
+    def __init__(self, now, waits):
+        self.now = now
+        self._waits = waits
+
+    def is_set(self):
+        return self._waits == 0
+
+    def set(self):
+        self._waits = 0
+
+    def wait(self, seconds):
+        self.now += datetime.timedelta(seconds=seconds)
+        self._waits -= 1
+
+
+class DaemonTest(unittest.TestCase):
+    def test_providers_are_loaded_at_their_intervals(self):
+        config = Config()
+        config.daemon_refresh_interval = 20
+        frequent, daily = _Provider(), _Provider(24*60)
+        clock = _Clock(datetime.datetime(2021, 12, 22, 22, 50), 5)
+        preloaded = []
+
+        def render(event_providers, config, logger):
+            preloaded.append((clock.now.strftime("%H:%M"), [ep for ep in event_providers if ep in (frequent, daily)]))
+            result = PreloadResult()
+            result.succeeded = list(event_providers)
+            calendar_draw = mock.Mock()
+            calendar_draw.get_preload_result.return_value = result
+            return calendar_draw
+
+        fake_datetime = types.SimpleNamespace(
+            datetime=mock.Mock(now=lambda tz=None: clock.now),
+            timedelta=datetime.timedelta)
+        with mock.patch.object(main, "create_event_providers", return_value=[frequent, daily]), \
+                mock.patch.object(main, "render", side_effect=render), \
+                mock.patch.object(main, "show", return_value=False), \
+                mock.patch.object(main, "export_metrics"), \
+                mock.patch.object(main.signal, "signal"), \
+                mock.patch.object(main.threading, "Event", return_value=clock), \
+                mock.patch.object(main.calendarframe.CalendarFrameDraw, "warm_up"), \
+                mock.patch.object(main, "datetime", fake_datetime):
+            main.run_daemon(config, mock.Mock(), None, False, False, mock.Mock())
+
+        self.assertEqual(preloaded, [
+            ("22:50", [frequent, daily]),
+            ("23:00", [frequent]),
+            ("23:20", [frequent]),
+            ("23:40", [frequent]),
+            ("00:00", [frequent, daily])])
+
+    def _run_daemon(self, partial_refresh):
+        epd = mock.Mock()
+        clock = _Clock(datetime.datetime(2021, 12, 22, 22, 50), 2)
+        fake_datetime = types.SimpleNamespace(
+            datetime=mock.Mock(now=lambda tz=None: clock.now),
+            timedelta=datetime.timedelta)
+        with mock.patch.object(main, "create_event_providers", return_value=[_Provider()]), \
+                mock.patch.object(main, "render"), \
+                mock.patch.object(main, "show", return_value=True), \
+                mock.patch.object(main, "export_metrics"), \
+                mock.patch.object(main.signal, "signal"), \
+                mock.patch.object(main.threading, "Event", return_value=clock), \
+                mock.patch.object(main.calendarframe.CalendarFrameDraw, "warm_up"), \
+                mock.patch.object(main, "datetime", fake_datetime):
+            main.run_daemon(Config(), epd, None, False, partial_refresh, mock.Mock())
+        return epd.sleep.call_count
+
+    def test_display_sleeps_between_refreshes(self):
+        self.assertEqual(self._run_daemon(False), 2)
+
+    def test_display_is_kept_awake_for_partial_upload(self):
+        # Deep sleep would lose the frame in display RAM
+        self.assertEqual(self._run_daemon(True), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
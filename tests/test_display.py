@@ -0,0 +1,157 @@
+import logging
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ.setdefault("EPD_SIMULATOR", "1")
+
+from libs.waveshare_epd import epd7in5b_HD, epdconfig
+import main
+from calendarframe.FrameStore import FrameStore
+from calendarframe.Metrics import Metrics
+
+
+def _random_planes(rng, size):
+    return bytes(rng.getrandbits(8) for _ in range(size)), bytes(rng.getrandbits(8) for _ in range(size))
+
+
+@unittest.skipUnless(
+    isinstance(epdconfig.implementation, epdconfig.Simulator),
+    "needs simulated display (EPD_SIMULATOR=1)")
+class PartialUploadTest(unittest.TestCase):
+    def setUp(self):
+        self._simulator = epdconfig.implementation
+        self._epd = epd7in5b_HD.EPD()
+        self._epd.init()
+        self._plane_size = self._epd.width * self._epd.height // 8
+
+    def _assert_ram(self, black, red_inverted):
+        rows = self._epd.height
+        self.assertEqual(self._simulator.get_ram(0x24, epd7in5b_HD.RAM_Y_START, rows), black)
+        self.assertEqual(self._simulator.get_ram(0x26, epd7in5b_HD.RAM_Y_START, rows), red_inverted)
+
+    def test_changed_region_is_uploaded(self):
+        rng = random.Random(1)
+        black, red = _random_planes(rng, self._plane_size)
+        self._epd.display_packed(black, red)
+        self._assert_ram(black, red)
+
+        # Change one byte in the middle of both planes
+        changed_black = bytearray(black)
+        changed_black[self._plane_size // 2] ^= 0xFF
+        changed_red = bytearray(red)
+        changed_red[self._plane_size // 2 + 3] ^= 0x0F
+        sent = self._simulator.spi_bytes
+        regions = self._epd.display_partial_packed(changed_black, changed_red, black, red)
+        self.assertEqual(len(regions), 1)
+        self.assertLess(self._simulator.spi_bytes - sent, self._plane_size // 10)
+        self._assert_ram(bytes(changed_black), bytes(changed_red))
+
+    def test_whole_frame_is_uploaded_after_init(self):
+        rng = random.Random(2)
+        black, red = _random_planes(rng, self._plane_size)
+        self._epd.display_packed(black, red)
+
+        # init() overwrites RAM, so the previous frame is no longer there
+        self._epd.init()
+        changed_black = bytearray(black)
+        changed_black[0] ^= 0xFF
+        sent = self._simulator.spi_bytes
+        regions = self._epd.display_partial_packed(changed_black, red, black, red)
+        self.assertEqual(regions, [(0, 0, self._epd.width, self._epd.height)])
+        self.assertGreater(self._simulator.spi_bytes - sent, 2*self._plane_size)
+        self._assert_ram(bytes(changed_black), red)
+
+    def test_changed_region_is_uploaded_after_init_keeping_ram(self):
+        rng = random.Random(3)
+        black, red = _random_planes(rng, self._plane_size)
+        self._epd.display_packed(black, red)
+
+        self._epd.init(keep_ram=True)
+        self._assert_ram(black, red)
+        changed_black = bytearray(black)
+        changed_black[self._plane_size // 3] ^= 0xFF
+        sent = self._simulator.spi_bytes
+        regions = self._epd.display_partial_packed(changed_black, red, black, red)
+        self.assertEqual(len(regions), 1)
+        self.assertLess(self._simulator.spi_bytes - sent, self._plane_size // 10)
+        self._assert_ram(bytes(changed_black), red)
+
+    def test_whole_frame_is_uploaded_after_sleep(self):
+        rng = random.Random(4)
+        black, red = _random_planes(rng, self._plane_size)
+        self._epd.display_packed(black, red)
+
+        self._epd.sleep()
+        self._epd.init(keep_ram=True)
+        changed_black = bytearray(black)
+        changed_black[0] ^= 0xFF
+        regions = self._epd.display_partial_packed(changed_black, red, black, red)
+        self.assertEqual(regions, [(0, 0, self._epd.width, self._epd.height)])
+        self._assert_ram(bytes(changed_black), red)
+
+
+class _Frame:
+    """
+    Stands in for CalendarFrameDraw in main.show, with already packed planes
+    """
+    def __init__(self, black, red):
+        self._planes = (black, red)
+        self._metrics = Metrics()
+
+    def get_metrics(self):
+        return self._metrics
+
+    def get_images(self):
+        return []
+
+    def get_packed_planes(self, size):
+        return self._planes
+
+
+@unittest.skipUnless(
+    isinstance(epdconfig.implementation, epdconfig.Simulator),
+    "needs simulated display (EPD_SIMULATOR=1)")
+class ShowPartialTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._frame_store = FrameStore(self._directory)
+        self._epd = epd7in5b_HD.EPD()
+        self._plane_size = self._epd.width * self._epd.height // 8
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _show(self, black, red, partial_refresh):
+        frame = _Frame(black, red)
+        with mock.patch.object(main.time, "sleep"), \
+                mock.patch.object(main.calendarframe.FrameStore, "digest", return_value=os.urandom(8).hex()):
+            main.show(self._epd, frame, self._frame_store, False, partial_refresh, logging.getLogger("test"))
+        return frame.get_metrics().get_report()["counters"]["spi_bytes"]
+
+    def test_next_frame_is_uploaded_partially(self):
+        rng = random.Random(5)
+        black, red = _random_planes(rng, self._plane_size)
+        self.assertGreater(self._show(black, red, True), 2*self._plane_size)
+
+        changed_black = bytearray(black)
+        changed_black[self._plane_size // 2] ^= 0xFF
+        self.assertLess(self._show(bytes(changed_black), red, True), self._plane_size // 10)
+        rows = self._epd.height
+        self.assertEqual(
+            epdconfig.implementation.get_ram(0x24, epd7in5b_HD.RAM_Y_START, rows), bytes(changed_black))
+
+    def test_next_frame_is_uploaded_whole_without_partial(self):
+        rng = random.Random(6)
+        black, red = _random_planes(rng, self._plane_size)
+        self._show(black, red, False)
+        changed_black = bytearray(black)
+        changed_black[0] ^= 0xFF
+        self.assertGreater(self._show(bytes(changed_black), red, False), 2*self._plane_size)
+
+
+if __name__ == "__main__":
+    unittest.main()
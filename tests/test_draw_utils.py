@@ -0,0 +1,115 @@
+import math
+import random
+import unittest
+from PIL import Image, ImageDraw
+from calendarframe.CalendarFrameDraw import ClippedImageDraw
+from calendarframe.DrawUtils import draw_line_dashed, draw_rectangle_dashed
+
+
+def _draw_line_dashed_reference(draw, xy, fill=None, width=0, dash=4, space=4, phase=0):
+    # draw_line_dashed before dashes were stamped from masks, every dash drawn as a line
+    if type(xy[0]) is not tuple:
+        xy = [(xy[i], xy[i + 1]) for i in range(0, len(xy), 2)]
+
+    is_dash = True
+    phase = phase - int(phase)
+    leftover = int(phase * (dash + space))
+    if leftover == 0:
+        pass
+    elif leftover <= space:
+        is_dash = False
+    elif leftover > space:
+        leftover = leftover - space
+
+    for i in range(0, len(xy) - 1):
+        xy0 = xy[i + 0]
+        xy1 = xy[i + 1]
+
+        veclen = math.sqrt((xy1[0] - xy0[0]) ** 2 + (xy1[1] - xy0[1]) ** 2)
+        direction = ((xy1[0] - xy0[0]) / veclen, (xy1[1] - xy0[1]) / veclen)
+
+        drawnlen = 0
+        while drawnlen < veclen:
+            drawlen = dash if is_dash else space
+            if leftover > 0:
+                drawlen = min(leftover, drawlen)
+                leftover = leftover - drawlen
+            if drawlen + drawnlen > veclen:
+                leftover = drawlen + drawnlen - veclen
+                drawlen = veclen - drawnlen
+
+            fxy0 = (xy0[0] + direction[0] * drawnlen, xy0[1] + direction[1] * drawnlen)
+            fxy1 = (
+                xy0[0] + direction[0] * (drawnlen + drawlen - 1), xy0[1] + direction[1] * (drawnlen + drawlen - 1))
+
+            if is_dash:
+                draw.line([fxy0, fxy1], fill, width)
+            drawnlen = drawnlen + drawlen
+            if leftover == 0:
+                is_dash = not is_dash
+
+
+def _random_polyline(rng):
+    points = [(rng.randint(5, 75), rng.randint(5, 55))]
+    for _ in range(rng.randint(1, 5)):
+        x, y = points[-1]
+        kind = rng.random()
+        if kind < 0.4:
+            point = (rng.randint(0, 80), y)
+        elif kind < 0.8:
+            point = (x, rng.randint(0, 60))
+        elif kind < 0.9:
+            point = (rng.randint(0, 80), rng.randint(0, 60))
+        else:
+            point = (rng.uniform(0, 80), rng.uniform(0, 60))
+        if point != (x, y):
+            points.append(point)
+    return points
+
+
+class DashedLineTest(unittest.TestCase):
+    def _assert_same(self, draw_function, reference_function, xy, mode, **kwargs):
+        def drawn(function, clipped):
+            image = Image.new(mode, (80, 60), 0)
+            draw = ImageDraw.Draw(image)
+            if clipped:
+                draw = ClippedImageDraw(image, draw, (3, -2), (10, 5, 70, 50))
+            function(draw, xy, **kwargs)
+            return image.tobytes()
+
+        for clipped in (False, True):
+            self.assertEqual(
+                drawn(draw_function, clipped),
+                drawn(reference_function, clipped),
+                "{} {} clipped={}".format(xy, kwargs, clipped))
+
+    def test_lines_match_reference(self):
+        rng = random.Random(7)
+        for _ in range(300):
+            xy = _random_polyline(rng)
+            if len(xy) < 2:
+                continue
+            kwargs = {
+                "fill": 1 if rng.random() < 0.5 else 200,
+                "width": rng.choice((0, 1, 2, 3)),
+                "dash": rng.randint(1, 6),
+                "space": rng.randint(1, 6),
+                "phase": rng.choice((0, 0.25, 0.5, 0.8, 1.5)),
+            }
+            mode = "1" if kwargs["fill"] == 1 else "L"
+            self._assert_same(draw_line_dashed, _draw_line_dashed_reference, xy, mode, **kwargs)
+
+    def test_rectangles_match_reference(self):
+        def reference(draw, xy, outline=None, width=0, dash=4, space=4, phase=0):
+            _draw_line_dashed_reference(draw, [
+                (xy[0], xy[1]), (xy[2], xy[1]), (xy[2], xy[3]), (xy[0], xy[3]), (xy[0], xy[1]),
+            ], outline, width, dash, space, phase)
+
+        for xy in ([0, 0, 40, 30], [5, 7, 6, 50], [2, 3, 70, 55], [12, 9, 30, 58]):
+            for width, dash, space in ((1, 3, 3), (2, 3, 3), (2, 4, 2), (0, 1, 1)):
+                self._assert_same(
+                    draw_rectangle_dashed, reference, xy, "1", outline=1, width=width, dash=dash, space=space)
+
+
+if __name__ == "__main__":
+    unittest.main()
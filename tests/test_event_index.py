@@ -0,0 +1,92 @@
+import datetime
+import random
+import unittest
+from calendarframe.BatchRenderer import PreloadedEventProvider
+from calendarframe.IEventProvider import IEventProvider
+
+
+class _Event:
+    def __init__(self, start, end, all_day):
+        self.start = start
+        self.end = end
+        self.all_day = all_day
+
+
+class _ListEventProvider(IEventProvider):
+    def __init__(self, events, is_holiday_calendar=False):
+        IEventProvider.__init__(self, is_holiday_calendar)
+        self._events = events
+
+    def preload(self, date_from, date_to):
+        self._build_index(date_from, date_to)
+
+
+def _random_events(rng, count, first_day):
+    events = []
+    for _ in range(count):
+        day = first_day + datetime.timedelta(days=rng.randint(0, 60))
+        if rng.random() < 0.3:
+            start = datetime.datetime(day.year, day.month, day.day)
+            events.append(_Event(start, start + datetime.timedelta(days=rng.choice((1, 1, 2, 5))), True))
+        else:
+            start = datetime.datetime(day.year, day.month, day.day, rng.randint(0, 23), rng.choice((0, 30)))
+            events.append(_Event(start, start + datetime.timedelta(hours=rng.choice((1, 2, 20, 50))), False))
+    return events
+
+
+class BuildIndexTest(unittest.TestCase):
+    def test_index_matches_scanning(self):
+        rng = random.Random(3)
+        first_day = datetime.date(2021, 11, 1)
+        date_from = datetime.date(2021, 11, 20)
+        date_to = datetime.date(2021, 12, 20)
+
+        for is_holiday_calendar in (False, True):
+            events = _random_events(rng, 300, first_day)
+            indexed = _ListEventProvider(events, is_holiday_calendar)
+            indexed.preload(date_from, date_to)
+            # Without index, every query scans the events with _is_event_on_date
+            scanned = _ListEventProvider(events, is_holiday_calendar)
+
+            date = first_day - datetime.timedelta(days=3)
+            while date < first_day + datetime.timedelta(days=70):
+                with self.subTest(date=date, is_holiday_calendar=is_holiday_calendar):
+                    self.assertEqual(indexed.get_events(date), scanned.get_events(date))
+                    self.assertEqual(indexed.get_all_day_events(date), scanned.get_all_day_events(date))
+                    self.assertEqual(indexed.is_holiday(date), scanned.is_holiday(date))
+                date += datetime.timedelta(days=1)
+
+    def test_index_accepts_datetimes(self):
+        events = [_Event(datetime.datetime(2021, 12, 1, 10), datetime.datetime(2021, 12, 1, 11), False)]
+        provider = _ListEventProvider(events)
+        provider.preload(datetime.datetime(2021, 11, 29, 12), datetime.datetime(2021, 12, 5, 12))
+        self.assertEqual(provider.get_events(datetime.date(2021, 12, 1)), events)
+        self.assertEqual(provider.get_events(datetime.date(2021, 12, 2)), [])
+
+
+class PreloadedEventProviderTest(unittest.TestCase):
+    def test_copy_keeps_events_of_preload(self):
+        rng = random.Random(5)
+        date_from = datetime.date(2021, 11, 20)
+        date_to = datetime.date(2021, 12, 20)
+        events = _random_events(rng, 100, datetime.date(2021, 11, 1))
+        provider = _ListEventProvider(list(events), True)
+        provider.preload(date_from, date_to)
+
+        preloaded = PreloadedEventProvider(provider, date_from, date_to)
+        # Next preload of the provider doesn't change the copy
+        provider._events.clear()
+        provider.preload(date_from, date_to)
+
+        self.assertEqual(preloaded.get_all_events(), events)
+        scanned = _ListEventProvider(events, True)
+        date = date_from
+        while date <= date_to:
+            self.assertEqual(preloaded.get_events(date), scanned.get_events(date))
+            self.assertEqual(preloaded.get_all_day_events(date), scanned.get_all_day_events(date))
+            self.assertEqual(preloaded.is_holiday(date), scanned.is_holiday(date))
+            date += datetime.timedelta(days=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
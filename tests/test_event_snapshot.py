@@ -0,0 +1,115 @@
+import datetime
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import unittest
+from dateutil import tz
+from icalevents.icalparser import Event
+from calendarframe.EventSnapshot import EventSnapshot
+
+DATE_FROM = datetime.date(2021, 11, 29)
+DATE_TO = datetime.date(2022, 1, 3)
+
+
+def _event(summary, start, end, all_day=False, **attributes):
+    event = Event()
+    event.summary = summary
+    event.uid = attributes.pop("uid", summary + "@test")
+    event.description = attributes.pop("description", None)
+    event.location = attributes.pop("location", None)
+    event.start = start
+    event.end = end
+    event.all_day = all_day
+    event.__dict__.update(attributes)
+    return event
+
+
+def _describe(event):
+    return (
+        event.summary, event.uid, event.description, event.location, event.start, event.end,
+        event.all_day, event.transparent, event.recurring, event.private, event.floating)
+
+
+class EventSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._path = os.path.join(self._directory, "snapshots", "events.snapshot")
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _events(self):
+        local = tz.tzlocal()
+        return [
+            _event(
+                "Meeting", datetime.datetime(2021, 12, 10, 10, 30, tzinfo=local),
+                datetime.datetime(2021, 12, 10, 11, 45, 30, 250, tzinfo=local),
+                description="Agenda\nwith ünïcödé", location="Room 1", recurring=True, transparent=True),
+            _event(
+                "Holiday", datetime.datetime(2021, 12, 24, tzinfo=local), datetime.datetime(2021, 12, 27, tzinfo=local),
+                all_day=True, private=True, floating=True),
+            # Strings shared between events are stored once
+            _event("Meeting", datetime.datetime(2021, 12, 17, 10, 30, tzinfo=local),
+                   datetime.datetime(2021, 12, 17, 11, 30, tzinfo=local), uid="Meeting@test", location="Room 1"),
+            _event("", datetime.datetime(1969, 12, 31, 23, tzinfo=local), datetime.datetime(2100, 1, 1, tzinfo=local)),
+        ]
+
+    def test_events_are_the_same_after_loading(self):
+        events = self._events()
+        EventSnapshot.save(self._path, events, DATE_FROM, DATE_TO)
+        loaded, date_from, date_to = EventSnapshot.load(self._path)
+
+        self.assertEqual((date_from, date_to), (DATE_FROM, DATE_TO))
+        self.assertEqual([_describe(event) for event in loaded], [_describe(event) for event in events])
+        self.assertTrue(all(event.start.tzinfo is not None for event in loaded))
+        self.assertEqual(os.listdir(os.path.dirname(self._path)), ["events.snapshot"])
+
+    def test_empty_snapshot(self):
+        EventSnapshot.save(self._path, [], DATE_FROM, DATE_TO)
+        self.assertEqual(EventSnapshot.load(self._path), ([], DATE_FROM, DATE_TO))
+
+    def test_damaged_file_raises_value_error(self):
+        EventSnapshot.save(self._path, self._events(), DATE_FROM, DATE_TO)
+        with open(self._path, "rb") as file:
+            data = file.read()
+
+        damaged = {
+            "empty": b"",
+            "truncated header": data[:10],
+            "other file": b"BEGIN:VCALENDAR\r\n" + data[17:],
+            "other version": data[:8] + struct.pack("<H", 99) + data[10:],
+            "truncated strings": data[:40],
+            "truncated events": data[:-10],
+            "string not in utf-8": data.replace("ünïcödé".encode("utf-8"), b"\xff" * len("ünïcödé".encode("utf-8"))),
+        }
+        for name, content in damaged.items():
+            with self.subTest(name):
+                with open(self._path, "wb") as file:
+                    file.write(content)
+                with self.assertRaises(ValueError):
+                    EventSnapshot.load(self._path)
+
+    def test_concurrent_saves(self):
+        errors = []
+
+        def save():
+            try:
+                for _ in range(20):
+                    EventSnapshot.save(self._path, self._events(), DATE_FROM, DATE_TO)
+            except OSError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=save) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(EventSnapshot.load(self._path)[0]), 4)
+        self.assertEqual(os.listdir(os.path.dirname(self._path)), ["events.snapshot"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import datetime
+import glob
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+from dateutil import tz
+from PIL import Image, ImageChops
+from calendarframe.CalendarFrameDraw import CalendarFrameDraw, Config
+from calendarframe.CellCache import CellCache
+from calendarframe.EventProviderICS import EventProviderICS
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+# Frames drawn before caching of cells, tiles and dashes, with resource/test.ics in Europe/Warsaw
+REFERENCE = datetime.datetime(2021, 12, 22, 12, 0)
+REFERENCE_TZ = "Europe/Warsaw"
+
+
+class FramePixelsTest(unittest.TestCase):
+    def setUp(self):
+        self._tz = os.environ.get("TZ")
+        os.environ["TZ"] = REFERENCE_TZ
+        time.tzset()
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        if self._tz is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = self._tz
+        time.tzset()
+        shutil.rmtree(self._directory)
+
+    def _draw(self, monochrome, workers=1):
+        config = Config()
+        config.monochrome = monochrome
+        config.cache_dir = self._directory
+        config.metrics_json = None
+        config.event_snapshots = False
+        config.calendar_render_workers = workers
+        calendar_draw = CalendarFrameDraw(
+            [EventProviderICS(file="resource/test.ics")],
+            config,
+            REFERENCE.replace(tzinfo=tz.tzlocal()))
+        return calendar_draw.draw(), config
+
+    def _assert_same(self, images, config, names):
+        # Tasklist is left out - reference frames listed tasks from the current date, not from the reference one
+        boxes = [
+            (config.calendar_position, config.calendar_size),
+            (config.today_position, config.today_size),
+        ]
+        for image, name in zip(images, names):
+            expected = Image.open(os.path.join(DATA_DIR, name)).convert("RGB")
+            for (x, y), (width, height) in boxes:
+                box = (x, y, x + width, y + height)
+                difference = ImageChops.difference(expected.crop(box), image.convert("RGB").crop(box))
+                self.assertIsNone(difference.getbbox(), "{} differs in {}".format(name, box))
+
+    def _check(self, workers=1):
+        for monochrome, names in [(True, ["frame_black.png", "frame_red.png"]), (False, ["frame_color.png"])]:
+            with self.subTest(monochrome=monochrome, cache="fresh"):
+                tiles = []
+                draw_tiles = CalendarFrameDraw._draw_calendar_tiles
+
+                def draw_tiles_recorded(calendar_draw, *args):
+                    tiles.append(draw_tiles(calendar_draw, *args))
+                    return tiles[-1]
+
+                with mock.patch.object(CalendarFrameDraw, "_draw_calendar_tiles", draw_tiles_recorded):
+                    images, config = self._draw(monochrome, workers)
+                # With more workers, all cells are drawn by them
+                self.assertEqual(len(tiles), 1 if workers > 1 else 0)
+                self.assertTrue(all(tiles))
+                self._assert_same(images, config, names)
+
+            with self.subTest(monochrome=monochrome, cache="warm"):
+                # All cells are taken from the file saved by the previous draw
+                found = []
+                get = CellCache.get
+
+                def get_recorded(cell_cache, key):
+                    images = get(cell_cache, key)
+                    found.append(images is not None)
+                    return images
+
+                with mock.patch.object(CellCache, "get", get_recorded):
+                    images, config = self._draw(monochrome, workers)
+                self.assertTrue(found)
+                self.assertTrue(all(found))
+                self._assert_same(images, config, names)
+
+        # Monochrome and colored cells are drawn with different settings, and kept in different files
+        self.assertEqual(len(glob.glob(os.path.join(self._directory, "calendar_cells.*.pickle"))), 2)
+
+    def test_frame_is_the_same_as_reference(self):
+        self._check()
+
+    def test_frame_drawn_by_tile_workers_is_the_same_as_reference(self):
+        self._check(workers=3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from PIL import Image, ImageDraw
+import main
+from calendarframe.CalendarFrameDraw import Config
+from calendarframe.FrameStore import FrameStore
+from calendarframe.Metrics import Metrics
+
+
+class _CalendarDraw:
+    def __init__(self, images):
+        self._images = images
+        self._metrics = Metrics()
+
+    def get_images(self):
+        return self._images
+
+    def get_packed_planes(self, panel_size=None):
+        return [memoryview(image.tobytes("raw", "1")) for image in self._images]
+
+    def get_metrics(self):
+        return self._metrics
+
+
+class _EPD:
+    width = 16
+    height = 8
+
+    def __init__(self):
+        self.frames = []
+        self.bytes_sent = 0
+        self.busy_seconds = 0.0
+        self.busy_cpu_seconds = 0.0
+
+    def init(self, keep_ram=False):
+        pass
+
+    def display_packed(self, black, red):
+        self.frames.append(("full", bytes(black), bytes(red)))
+        self.busy_seconds += 2.0
+        self.busy_cpu_seconds += 0.25
+
+    def display_partial_packed(self, black, red, previous_black, previous_red):
+        self.frames.append(("partial", bytes(black), bytes(red)))
+
+
+def _images(dot):
+    images = [Image.new("1", (_EPD.width, _EPD.height), 255) for _ in range(2)]
+    ImageDraw.Draw(images[0]).point(dot, fill=0)
+    return images
+
+
+class FrameStoreTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._store = FrameStore(os.path.join(self._directory, "state"))
+        self._logger = mock.Mock()
+        sleep = mock.patch("time.sleep")
+        sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_digest_depends_on_pixels(self):
+        self.assertEqual(FrameStore.digest(_images((1, 1))), FrameStore.digest(_images((1, 1))))
+        self.assertNotEqual(FrameStore.digest(_images((1, 1))), FrameStore.digest(_images((2, 1))))
+
+    def test_unchanged_frame_is_not_shown(self):
+        epd = _EPD()
+        self.assertTrue(main.show(epd, _CalendarDraw(_images((1, 1))), self._store, False, False, self._logger))
+        self.assertFalse(main.show(epd, _CalendarDraw(_images((1, 1))), self._store, False, False, self._logger))
+        self.assertEqual(len(epd.frames), 1)
+
+        # Changed or forced frames are shown
+        self.assertTrue(main.show(epd, _CalendarDraw(_images((3, 1))), self._store, False, False, self._logger))
+        self.assertTrue(main.show(epd, _CalendarDraw(_images((3, 1))), self._store, True, False, self._logger))
+        self.assertEqual(len(epd.frames), 3)
+
+    def test_busy_time_is_recorded_by_driver(self):
+        calendar_draw = _CalendarDraw(_images((1, 1)))
+        main.show(_EPD(), calendar_draw, self._store, False, False, self._logger)
+        self.assertEqual(calendar_draw.get_metrics().get_phase("busy"), (2.0, 0.25))
+
+    def test_metrics_are_saved_in_cache_dir(self):
+        config = Config()
+        config.cache_dir = self._directory
+        main.export_metrics(Metrics(), config, self._logger)
+        self.assertTrue(os.path.exists(os.path.join(self._directory, "metrics.json")))
+
+    def test_metrics_saved_at_the_same_time_are_complete(self):
+        path = os.path.join(self._directory, "metrics.json")
+        errors = []
+
+        def save(i):
+            metrics = Metrics()
+            metrics.set("events", i)
+            try:
+                for _ in range(20):
+                    metrics.save_json(path)
+            except OSError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=save, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        with open(path, "r") as file:
+            self.assertIn(json.load(file)["counters"]["events"], range(8))
+        self.assertEqual(os.listdir(self._directory), ["metrics.json"])
+
+    def test_planes_of_other_size_are_ignored(self):
+        self._store.save_planes([b"\x01\x02", b"\x03\x04"])
+        self.assertEqual(self._store.load_planes(2), [b"\x01\x02", b"\x03\x04"])
+        self.assertIsNone(self._store.load_planes(3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import datetime
+import http.server
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from calendarframe.EventProviderICS import EventProviderICS
+
+FEED = "\r\n".join([
+    "BEGIN:VCALENDAR",
+    "VERSION:2.0",
+    "PRODID:-//WaveshareEInkCalendar//Test//EN",
+    "BEGIN:VEVENT",
+    "UID:first@test",
+    "DTSTAMP:20211201T000000Z",
+    "SUMMARY:First",
+    "DTSTART:20211210T100000",
+    "DTEND:20211210T110000",
+    "END:VEVENT",
+    "BEGIN:VEVENT",
+    "UID:second@test",
+    "DTSTAMP:20211201T000000Z",
+    "SUMMARY:Second",
+    "DTSTART;VALUE=DATE:20211215",
+    "DTEND;VALUE=DATE:20211216",
+    "END:VEVENT",
+    "END:VCALENDAR",
+    ""]).encode()
+ETAG = '"feed-1"'
+LAST_MODIFIED = "Wed, 01 Dec 2021 00:00:00 GMT"
+
+
+class _FeedHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if server.conditional and self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/calendar")
+        self.send_header("Content-Length", str(len(FEED)))
+        if server.conditional:
+            self.send_header("ETag", ETAG)
+            self.send_header("Last-Modified", LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write(FEED)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ConditionalGetTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _FeedHandler)
+        self._server.requests = []
+        self._server.conditional = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self._address = "http://127.0.0.1:{}/feed.ics".format(self._server.server_address[1])
+
+    def tearDown(self):
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self._directory)
+
+    def _preload(self, date_from=datetime.date(2021, 12, 1), date_to=datetime.date(2021, 12, 31)):
+        """
+        Preloads events with a new provider, as in a new run. Returns summaries and number of parsed feeds.
+        """
+        provider = EventProviderICS(address=self._address, cache_dir=self._directory)
+        with mock.patch.object(EventProviderICS, "_parse", wraps=EventProviderICS._parse) as parse:
+            provider.preload(date_from, date_to)
+        return sorted(set(event.summary for event in provider.get_all_events())), parse.call_count
+
+    def test_not_modified_feed_is_not_parsed(self):
+        summaries, parsed = self._preload()
+        self.assertEqual(summaries, ["First", "Second"])
+        self.assertEqual(parsed, 1)
+        self.assertNotIn("If-None-Match", self._server.requests[0])
+
+        summaries, parsed = self._preload()
+        self.assertEqual(self._server.requests[1].get("If-None-Match"), ETAG)
+        self.assertEqual(self._server.requests[1].get("If-Modified-Since"), LAST_MODIFIED)
+        self.assertEqual(summaries, ["First", "Second"])
+        self.assertEqual(parsed, 0)
+
+    def test_unchanged_body_is_not_parsed(self):
+        # Server without ETag and Last-Modified sends the whole feed every time
+        self._server.conditional = False
+        self._preload()
+        summaries, parsed = self._preload()
+        self.assertEqual(len(self._server.requests), 2)
+        self.assertNotIn("If-None-Match", self._server.requests[1])
+        self.assertEqual(summaries, ["First", "Second"])
+        self.assertEqual(parsed, 0)
+
+    def test_events_of_other_window_are_not_reused(self):
+        self._preload()
+        summaries, parsed = self._preload(datetime.date(2021, 12, 12), datetime.date(2021, 12, 31))
+        self.assertEqual(parsed, 1)
+        self.assertEqual(summaries, ["Second"])
+
+        # Window of the last run is cached
+        summaries, parsed = self._preload(datetime.date(2021, 12, 12), datetime.date(2021, 12, 31))
+        self.assertEqual(parsed, 0)
+        self.assertEqual(summaries, ["Second"])
+
+    def test_interrupted_write_keeps_cached_events(self):
+        self._preload()
+        cache_dir = os.path.join(self._directory, "ics")
+        files = sorted(os.listdir(cache_dir))
+
+        def interrupted_dump(events, file):
+            file.write(pickle.dumps(events)[:10])
+            raise KeyboardInterrupt()
+
+        with mock.patch.object(pickle, "dump", interrupted_dump):
+            with self.assertRaises(KeyboardInterrupt):
+                self._preload(datetime.date(2021, 12, 12), datetime.date(2021, 12, 31))
+        # No temporary files are left, and events of the previous window are still complete
+        self.assertEqual(sorted(os.listdir(cache_dir)), files)
+        summaries, parsed = self._preload()
+        self.assertEqual(summaries, ["First", "Second"])
+        self.assertEqual(parsed, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+import calendarframe
+
+
+class LazyImportTest(unittest.TestCase):
+    def test_package_attributes_give_classes(self):
+        from calendarframe import CalendarFrameDraw, EventSnapshot
+        self.assertIsInstance(CalendarFrameDraw, type)
+        self.assertIsInstance(EventSnapshot, type)
+        self.assertIs(calendarframe.CalendarFrameDraw, CalendarFrameDraw)
+        self.assertEqual(calendarframe.Config.__module__, "calendarframe.CalendarFrameDraw")
+
+    def test_submodule_import_keeps_classes(self):
+        from calendarframe.CalendarFrameDraw import Config
+        import calendarframe.EventSnapshot
+        self.assertIsInstance(calendarframe.CalendarFrameDraw, type)
+        self.assertIsInstance(calendarframe.EventSnapshot, type)
+        self.assertIs(calendarframe.Config, Config)
+
+    def test_dir_lists_lazy_names(self):
+        self.assertIn("RenderServer", dir(calendarframe))
+        self.assertIn("import_module", dir(calendarframe))
+
+
+if __name__ == "__main__":
+    unittest.main()
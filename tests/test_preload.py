@@ -0,0 +1,223 @@
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from dateutil import tz
+from calendarframe.CalendarFrameDraw import CalendarFrameDraw, Config, EventProviderAggregate
+from calendarframe.IEventProvider import IEventProvider
+
+DATE_FROM = datetime.date(2021, 12, 1)
+DATE_TO = datetime.date(2021, 12, 31)
+
+
+class _Event:
+    def __init__(self, summary, day):
+        self.summary = summary
+        self.uid = summary
+        self.description = None
+        self.location = None
+        self.start = datetime.datetime(2021, 12, day, 10)
+        self.end = datetime.datetime(2021, 12, day, 11)
+        self.all_day = False
+
+
+class _StubProvider(IEventProvider):
+    def __init__(self, events=(), delay=0.0, error=None, gate=None, source=None):
+        """
+        :param gate: threading.Event the preload waits for
+        """
+        IEventProvider.__init__(self)
+        self._stub_events = list(events)
+        self._delay = delay
+        self._error = error
+        self._gate = gate
+        self._source = source
+        self.preloads = 0
+
+    def preload(self, date_from, date_to):
+        self.preloads += 1
+        if self._gate is not None:
+            self._gate.wait()
+        time.sleep(self._delay)
+        if self._error is not None:
+            raise self._error
+        self._events = list(self._stub_events)
+        self._build_index(date_from, date_to)
+
+    def get_source(self):
+        return self._source
+
+
+class PreloadTest(unittest.TestCase):
+    def test_providers_are_preloaded_concurrently(self):
+        providers = [_StubProvider([_Event("event {}".format(i), 10)], delay=0.3) for i in range(3)]
+        aggregate = EventProviderAggregate(providers, workers=3)
+
+        begin = time.monotonic()
+        result = aggregate.preload(DATE_FROM, DATE_TO)
+        self.assertLess(time.monotonic() - begin, 0.8)
+        self.assertTrue(result.is_success())
+        self.assertCountEqual(result.succeeded, providers)
+        self.assertEqual(len(aggregate.get_events(datetime.date(2021, 12, 10))), 3)
+
+    def test_failed_provider_is_left_out(self):
+        good = _StubProvider([_Event("good", 10)])
+        bad = _StubProvider(error=ConnectionError("server is down"))
+        aggregate = EventProviderAggregate([bad, good])
+
+        result = aggregate.preload(DATE_FROM, DATE_TO)
+        self.assertFalse(result.is_success())
+        self.assertEqual(result.succeeded, [good])
+        self.assertIsInstance(result.failed[bad], ConnectionError)
+        self.assertEqual([event.summary for event in aggregate.get_events(datetime.date(2021, 12, 10))], ["good"])
+
+    def test_raises_only_when_all_providers_fail(self):
+        aggregate = EventProviderAggregate([_StubProvider(error=ValueError()), _StubProvider(error=OSError())])
+        with self.assertRaises(RuntimeError):
+            aggregate.preload(DATE_FROM, DATE_TO)
+
+    def test_provider_timeout(self):
+        gate = threading.Event()
+        self.addCleanup(gate.set)
+        slow = _StubProvider([_Event("slow", 10)], gate=gate)
+        fast = _StubProvider([_Event("fast", 11)])
+        aggregate = EventProviderAggregate([slow, fast], workers=1, timeout=0.2)
+
+        begin = time.monotonic()
+        result = aggregate.preload(DATE_FROM, DATE_TO)
+        # The single worker is replaced, so the fast provider is preloaded after the slow one times out
+        self.assertLess(time.monotonic() - begin, 1.0)
+        self.assertEqual(result.timed_out, [slow])
+        self.assertEqual(result.succeeded, [fast])
+        self.assertEqual(aggregate.get_events(datetime.date(2021, 12, 10)), [])
+
+    def test_deadline(self):
+        gates = [threading.Event(), threading.Event()]
+        for gate in gates:
+            self.addCleanup(gate.set)
+        providers = [_StubProvider(gate=gates[0]), _StubProvider(gate=gates[1]), _StubProvider()]
+        aggregate = EventProviderAggregate(providers, workers=2, deadline=0.3)
+
+        begin = time.monotonic()
+        with self.assertRaises(RuntimeError):
+            aggregate.preload(DATE_FROM, DATE_TO)
+        self.assertLess(time.monotonic() - begin, 1.0)
+
+        # Provider that wasn't started before the deadline isn't preloaded later
+        gates[0].set()
+        time.sleep(0.2)
+        self.assertEqual(providers[2].preloads, 0)
+
+    def test_running_provider_is_not_preloaded_again(self):
+        gate = threading.Event()
+        self.addCleanup(gate.set)
+        slow = _StubProvider([_Event("slow", 10)], gate=gate)
+        fast = _StubProvider([_Event("fast", 11)])
+        aggregate = EventProviderAggregate([slow, fast], timeout=0.2)
+        result = aggregate.preload(DATE_FROM, DATE_TO)
+        self.assertEqual(result.timed_out, [slow])
+
+        # Thread preloading the slow provider is still running, so it's skipped without waiting
+        begin = time.monotonic()
+        result = EventProviderAggregate([slow, fast], timeout=0.2).preload(DATE_FROM, DATE_TO)
+        self.assertLess(time.monotonic() - begin, 0.15)
+        self.assertEqual(result.timed_out, [slow])
+        self.assertEqual(slow.preloads, 1)
+
+        # Once it finishes, it's preloaded again
+        gate.set()
+        for _ in range(100):
+            if slow.get_event_count() > 0:
+                break
+            time.sleep(0.01)
+        time.sleep(0.05)
+        aggregate = EventProviderAggregate([slow, fast], timeout=0.2)
+        result = aggregate.preload(DATE_FROM, DATE_TO)
+        self.assertTrue(result.is_success())
+        self.assertEqual(slow.preloads, 2)
+        self.assertEqual(len(aggregate.get_events(datetime.date(2021, 12, 10))), 1)
+
+
+class SnapshotFallbackTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._snapshot_dir = os.path.join(self._directory, "snapshots")
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _save_snapshot(self, source="feed"):
+        provider = _StubProvider([_Event("saved", 10)], source=source)
+        result = EventProviderAggregate([provider], snapshot_dir=self._snapshot_dir).preload(DATE_FROM, DATE_TO)
+        self.assertTrue(result.is_success())
+
+    @staticmethod
+    def _summaries(aggregate):
+        return [event.summary for event in aggregate.get_events(datetime.date(2021, 12, 10))]
+
+    def test_failed_provider_is_replaced_with_snapshot(self):
+        self._save_snapshot()
+        bad = _StubProvider(error=ConnectionError("server is down"), source="feed")
+        aggregate = EventProviderAggregate([bad], snapshot_dir=self._snapshot_dir)
+
+        result = aggregate.preload(DATE_FROM, DATE_TO)
+        self.assertIn(bad, result.failed)
+        self.assertEqual(result.from_snapshot, [bad])
+        self.assertEqual(self._summaries(aggregate), ["saved"])
+
+    def test_timed_out_provider_is_replaced_with_snapshot(self):
+        self._save_snapshot()
+        gate = threading.Event()
+        self.addCleanup(gate.set)
+        slow = _StubProvider([_Event("slow", 10)], gate=gate, source="feed")
+        aggregate = EventProviderAggregate([slow], timeout=0.2, snapshot_dir=self._snapshot_dir)
+
+        result = aggregate.preload(DATE_FROM, DATE_TO)
+        self.assertEqual(result.timed_out, [slow])
+        self.assertEqual(result.from_snapshot, [slow])
+        self.assertEqual(self._summaries(aggregate), ["saved"])
+
+    def test_provider_without_snapshot_is_left_out(self):
+        self._save_snapshot()
+        good = _StubProvider([_Event("good", 10)], source="other feed")
+        bad = _StubProvider(error=ConnectionError(), source="new feed")
+        without_source = _StubProvider(error=ConnectionError())
+        aggregate = EventProviderAggregate([bad, without_source, good], snapshot_dir=self._snapshot_dir)
+
+        result = aggregate.preload(DATE_FROM, DATE_TO)
+        self.assertEqual(result.from_snapshot, [])
+        self.assertCountEqual(result.failed.keys(), [bad, without_source])
+        self.assertEqual(self._summaries(aggregate), ["good"])
+
+    def test_offline_uses_only_snapshots(self):
+        self._save_snapshot()
+        provider = _StubProvider([_Event("online", 10)], source="feed")
+        missing = _StubProvider([_Event("online", 10)], source="new feed")
+        aggregate = EventProviderAggregate([provider, missing], snapshot_dir=self._snapshot_dir, offline=True)
+
+        result = aggregate.preload(DATE_FROM, DATE_TO)
+        self.assertEqual(provider.preloads + missing.preloads, 0)
+        self.assertEqual(result.from_snapshot, [provider])
+        self.assertEqual(list(result.failed.keys()), [missing])
+        self.assertEqual(self._summaries(aggregate), ["saved"])
+
+    def test_provider_replaced_with_snapshot_is_not_counted_as_failed(self):
+        config = Config()
+        config.cache_dir = self._directory
+        self._save_snapshot()
+        bad = _StubProvider(error=ConnectionError("server is down"), source="feed")
+
+        calendar_draw = CalendarFrameDraw(
+            [bad], config, datetime.datetime(2021, 12, 22, 12, tzinfo=tz.tzlocal()))
+        calendar_draw.draw()
+        report = calendar_draw.get_metrics().get_report()
+        self.assertEqual(report["counters"]["providers_failed"], 0)
+        self.assertEqual(report["counters"]["providers_from_snapshot"], 1)
+        self.assertEqual([provider["status"] for provider in report["providers"].values()], ["snapshot"])
+
+
+if __name__ == "__main__":
+    unittest.main()
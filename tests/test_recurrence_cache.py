@@ -0,0 +1,180 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import icalevents.icalevents as icalevents
+import icalevents.icalparser as icalparser
+from calendarframe.EventProviderICS import EventProviderICS
+from calendarframe.RecurrenceCache import RecurrenceCache
+
+FEED = "\r\n".join([
+    "BEGIN:VCALENDAR",
+    "VERSION:2.0",
+    "PRODID:-//WaveshareEInkCalendar//Test//EN",
+    "BEGIN:VTIMEZONE",
+    "TZID:Europe/Warsaw",
+    "BEGIN:STANDARD",
+    "DTSTART:19701025T030000",
+    "RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU",
+    "TZOFFSETFROM:+0200",
+    "TZOFFSETTO:+0100",
+    "END:STANDARD",
+    "BEGIN:DAYLIGHT",
+    "DTSTART:19700329T020000",
+    "RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU",
+    "TZOFFSETFROM:+0100",
+    "TZOFFSETTO:+0200",
+    "END:DAYLIGHT",
+    "END:VTIMEZONE",
+    # Single event
+    "BEGIN:VEVENT",
+    "UID:single@test",
+    "DTSTAMP:20211201T000000Z",
+    "SUMMARY:Single",
+    "DTSTART:20211210T100000",
+    "DTEND:20211210T110000",
+    "END:VEVENT",
+    # Weekly, with an excluded and a moved occurrence
+    "BEGIN:VEVENT",
+    "UID:weekly@test",
+    "DTSTAMP:20211201T000000Z",
+    "SUMMARY:Weekly",
+    "DTSTART;TZID=Europe/Warsaw:20211101T090000",
+    "DTEND;TZID=Europe/Warsaw:20211101T100000",
+    "RRULE:FREQ=WEEKLY;BYDAY=MO,TH",
+    "EXDATE;TZID=Europe/Warsaw:20211213T090000",
+    "END:VEVENT",
+    "BEGIN:VEVENT",
+    "UID:weekly@test",
+    "DTSTAMP:20211201T000000Z",
+    "SUMMARY:Weekly moved",
+    "RECURRENCE-ID;TZID=Europe/Warsaw:20211223T090000",
+    "DTSTART;TZID=Europe/Warsaw:20211224T120000",
+    "DTEND;TZID=Europe/Warsaw:20211224T130000",
+    "END:VEVENT",
+    # Daily, all day, ending in January
+    "BEGIN:VEVENT",
+    "UID:daily@test",
+    "DTSTAMP:20211201T000000Z",
+    "SUMMARY:Daily",
+    "DTSTART;VALUE=DATE:20211120",
+    "DTEND;VALUE=DATE:20211121",
+    "RRULE:FREQ=DAILY;UNTIL=20220110",
+    "END:VEVENT",
+    "END:VCALENDAR",
+    ""])
+
+# Windows of consecutive runs: moving by a day, by weeks, back, and to days that don't overlap the cached ones
+WINDOWS = [
+    (datetime.date(2021, 11, 29), datetime.date(2021, 12, 27)),
+    (datetime.date(2021, 11, 29), datetime.date(2021, 12, 28)),
+    (datetime.date(2021, 12, 6), datetime.date(2022, 1, 3)),
+    (datetime.date(2021, 12, 20), datetime.date(2022, 1, 17)),
+    (datetime.date(2021, 11, 15), datetime.date(2021, 12, 13)),
+    (datetime.date(2022, 2, 7), datetime.date(2022, 3, 7)),
+    (datetime.date(2021, 12, 6), datetime.date(2022, 1, 3)),
+]
+
+
+def _describe(events):
+    return sorted(
+        (event.uid, str(event.start), str(event.end), event.summary, event.all_day)
+        for event in events)
+
+
+class RecurrenceCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._feed = os.path.join(self._directory, "feed.ics")
+        with open(self._feed, "w", encoding="utf-8") as file:
+            file.write(FEED)
+        self._cache_path = os.path.join(self._directory, "cache", "recurrences.pickle")
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_shifted_windows_match_expanding_from_scratch(self):
+        for date_from, date_to in WINDOWS:
+            with self.subTest(date_from=date_from, date_to=date_to):
+                # New cache for each window, loaded from the file, as in a new run
+                cached = EventProviderICS._parse(
+                    date_from,
+                    date_to,
+                    file=self._feed,
+                    recurrences=RecurrenceCache(self._cache_path))
+                expected = EventProviderICS._parse(date_from, date_to, file=self._feed)
+                self.assertEqual(_describe(cached), _describe(expected))
+                self.assertTrue(expected)
+
+    def test_only_entered_days_are_expanded(self):
+        EventProviderICS._parse(*WINDOWS[0], file=self._feed, recurrences=RecurrenceCache(self._cache_path))
+
+        with mock.patch.object(icalparser, "parse_events", wraps=icalparser.parse_events) as parse_events:
+            EventProviderICS._parse(*WINDOWS[2], file=self._feed, recurrences=RecurrenceCache(self._cache_path))
+        ranges = [(call.kwargs["start"], call.kwargs["end"]) for call in parse_events.call_args_list]
+        # Recurring events are expanded together, only for days after the previous window
+        self.assertEqual(ranges, [(WINDOWS[0][1], WINDOWS[2][1])])
+
+    def test_changed_definition_is_expanded_again(self):
+        recurrences = RecurrenceCache()
+        EventProviderICS._parse(*WINDOWS[0], file=self._feed, recurrences=recurrences)
+        with open(self._feed, "w", encoding="utf-8") as file:
+            file.write(FEED.replace("BYDAY=MO,TH", "BYDAY=TU"))
+
+        events = EventProviderICS._parse(*WINDOWS[0], file=self._feed, recurrences=recurrences)
+        weekly = [event for event in events if event.summary == "Weekly"]
+        self.assertTrue(weekly)
+        self.assertTrue(all(event.start.weekday() == 1 for event in weekly))
+
+
+class FeedContentTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._feed = os.path.join(self._directory, "feed.ics")
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _parse(self, content, recurrences):
+        with open(self._feed, "w", encoding="utf-8") as file:
+            file.write(content)
+        return EventProviderICS._parse(*WINDOWS[0], file=self._feed, recurrences=recurrences)
+
+    def test_content_is_passed_as_bytes(self):
+        # Older icalevents (before 0.3) decodes the content itself
+        contents = []
+
+        def recorded(function):
+            def wrapper(content=None, **kwargs):
+                contents.append(content if content is not None else kwargs["string_content"])
+                return function(content, **kwargs) if content is not None else function(**kwargs)
+            return wrapper
+
+        with mock.patch.object(icalevents, "events", recorded(icalevents.events)), \
+                mock.patch.object(icalparser, "parse_events", recorded(icalparser.parse_events)):
+            self._parse(FEED, RecurrenceCache())
+        self.assertEqual(len(contents), 2)
+        self.assertTrue(all(isinstance(content, bytes) for content in contents))
+
+    def test_every_calendar_of_the_feed_is_parsed(self):
+        # Second calendar, with its own time zone and events
+        calendars = FEED + FEED.replace("@test", "@other").replace("Single", "Other single")
+        for recurrences in (None, RecurrenceCache()):
+            with self.subTest(recurrences=recurrences):
+                events = self._parse(calendars, recurrences)
+                expected = EventProviderICS._parse(*WINDOWS[0], file=self._write_feed(FEED))
+                self.assertEqual(len(events), 2*len(expected))
+                self.assertIn("Other single", [event.summary for event in events])
+                self.assertIn("weekly@other", [event.uid for event in events])
+
+    def _write_feed(self, content):
+        path = os.path.join(self._directory, "single.ics")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        return path
+
+
+if __name__ == "__main__":
+    unittest.main()
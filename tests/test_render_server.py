@@ -0,0 +1,158 @@
+import datetime
+import http.client
+import importlib
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from calendarframe.BatchRenderer import BatchProfile, FORMAT_PLANES
+from calendarframe.CalendarFrameDraw import Config
+from calendarframe.IEventProvider import IEventProvider
+from calendarframe.ProviderRegistry import register_provider
+from calendarframe.RenderServer import RenderServer
+
+# Feed name -> {"events", "error", "preloads"}, read by _StubProvider
+_FEEDS = {}
+
+
+class _Event:
+    def __init__(self, summary, day):
+        self.summary = summary
+        self.uid = summary
+        self.description = None
+        self.location = None
+        self.start = datetime.datetime.combine(day, datetime.time(10))
+        self.end = datetime.datetime.combine(day, datetime.time(11))
+        self.all_day = False
+
+
+class _StubProvider(IEventProvider):
+    def __init__(self, feed, cache_dir=None):
+        IEventProvider.__init__(self)
+        self._feed = feed
+
+    def preload(self, date_from, date_to):
+        feed = _FEEDS[self._feed]
+        feed["preloads"] += 1
+        if feed["error"] is not None:
+            raise feed["error"]
+        self._events = list(feed["events"])
+        self._build_index(date_from, date_to)
+
+
+register_provider("render-server-stub", __name__, "_StubProvider")
+# The package gives the class under the module's name
+render_server_module = importlib.import_module("calendarframe.RenderServer")
+
+
+class RenderServerTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        _FEEDS.clear()
+        _FEEDS["feed"] = {"events": [_Event("Meeting", datetime.date.today())], "error": None, "preloads": 0}
+        providers = [("render-server-stub", {"feed": "feed"})]
+        profiles = [
+            BatchProfile("color", None, providers),
+            BatchProfile("mono", None, providers, output_format=FORMAT_PLANES),
+        ]
+        config = Config()
+        config.cache_dir = self._directory
+        self._server = RenderServer(profiles, config, ("127.0.0.1", 0))
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+        # Profile names of rendered frames
+        self._rendered = []
+        render = RenderServer._render
+
+        def render_recorded(server, name, *args):
+            self._rendered.append(name)
+            return render(server, name, *args)
+
+        patcher = mock.patch.object(RenderServer, "_render", render_recorded)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self._server.shutdown()
+        shutil.rmtree(self._directory)
+
+    def _get(self, path, headers=None):
+        connection = http.client.HTTPConnection(*self._server.get_address()[:2])
+        try:
+            connection.request("GET", path, headers=headers or {})
+            response = connection.getresponse()
+            return response.status, response.getheader("ETag"), response.read()
+        finally:
+            connection.close()
+
+    def _expire_events(self):
+        """
+        Moves monotonic time of the server after the refresh interval
+        """
+        monotonic = time.monotonic
+        patcher = mock.patch.object(
+            render_server_module.time, "monotonic", lambda: monotonic() + 2*60*Config().daemon_refresh_interval)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unchanged_frame_is_not_sent_again(self):
+        status, etag, data = self._get("/color.png")
+        self.assertEqual(status, 200)
+        self.assertTrue(data.startswith(b"\x89PNG"))
+
+        for if_none_match in [etag, "W/" + etag, "*", '"other", ' + etag]:
+            with self.subTest(if_none_match=if_none_match):
+                status, returned_etag, data = self._get("/color.png", {"If-None-Match": if_none_match})
+                self.assertEqual(status, 304)
+                self.assertEqual(returned_etag, etag)
+                self.assertEqual(data, b"")
+
+        status, _, data = self._get("/color.png", {"If-None-Match": '"other"'})
+        self.assertEqual(status, 200)
+        self.assertTrue(data.startswith(b"\x89PNG"))
+        self.assertEqual(self._rendered, ["color"])
+
+    def test_frame_is_rendered_again_only_when_events_change(self):
+        _, etag, _ = self._get("/color.png")
+        self._expire_events()
+        # Events are loaded again, but didn't change
+        _, same_etag, _ = self._get("/color.png")
+        self.assertEqual(_FEEDS["feed"]["preloads"], 2)
+        self.assertEqual(same_etag, etag)
+        self.assertEqual(self._rendered, ["color"])
+
+        _FEEDS["feed"]["events"] = [_Event("Moved meeting", datetime.date.today())]
+        self._expire_events()
+        status, changed_etag, _ = self._get("/color.png", {"If-None-Match": etag})
+        self.assertEqual(status, 200)
+        self.assertNotEqual(changed_etag, etag)
+        self.assertEqual(self._rendered, ["color", "color"])
+
+    def test_planes_only_for_monochrome_profiles(self):
+        self.assertEqual(self._get("/color.planes")[0], 404)
+        self.assertEqual(self._get("/unknown.png")[0], 404)
+
+        status, _, data = self._get("/mono.planes")
+        self.assertEqual(status, 200)
+        config = Config()
+        self.assertEqual(len(data), 2*config.size[0]*config.size[1]//8)
+        # Both formats come from one render
+        self.assertEqual(self._get("/mono.png")[0], 200)
+        self.assertEqual(self._rendered, ["mono"])
+
+    def test_failed_preload_is_not_repeated_for_every_request(self):
+        _FEEDS["feed"]["error"] = ConnectionError("server is down")
+        self.assertEqual(self._get("/color.png")[0], 500)
+        self.assertEqual(self._get("/color.png")[0], 500)
+        self.assertEqual(_FEEDS["feed"]["preloads"], 1)
+
+        _FEEDS["feed"]["error"] = None
+        self._expire_events()
+        self.assertEqual(self._get("/color.png")[0], 200)
+        self.assertEqual(_FEEDS["feed"]["preloads"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import datetime
+import unittest
+from unittest import mock
+from dateutil import tz
+from PIL import Image, ImageFont
+from calendarframe.CalendarFrameDraw import CalendarFrameDraw, Config
+from calendarframe.EventProviderICS import EventProviderICS
+from calendarframe.ResourceCache import ResourceCache
+
+REFERENCE = datetime.datetime(2021, 12, 22, 12, 0, tzinfo=tz.tzlocal())
+
+
+class ResourceCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._config = Config()
+        self._config.cache_dir = None
+        self._config.metrics_json = None
+        self._config.event_snapshots = False
+
+    def _draw(self, resources):
+        calendar_draw = CalendarFrameDraw(
+            [EventProviderICS(file="resource/test.ics")],
+            self._config,
+            REFERENCE,
+            resources=resources)
+        calendar_draw.draw()
+        return calendar_draw
+
+    def _opened(self, function):
+        """
+        Calls function, returns paths of fonts and images opened meanwhile
+        """
+        opened = []
+        truetype, open_image = ImageFont.truetype, Image.open
+
+        def truetype_recorded(font, *args, **kwargs):
+            opened.append(font)
+            return truetype(font, *args, **kwargs)
+
+        def open_recorded(path, *args, **kwargs):
+            opened.append(path)
+            return open_image(path, *args, **kwargs)
+
+        with mock.patch.object(ImageFont, "truetype", truetype_recorded), \
+                mock.patch.object(Image, "open", open_recorded):
+            function()
+        return opened
+
+    def test_fonts_are_loaded_once(self):
+        resources = ResourceCache()
+        font = resources.get_font(self._config.today_font, 24)
+        self.assertIs(resources.get_font(self._config.today_font, 24), font)
+        self.assertIsNot(resources.get_font(self._config.today_font, 25), font)
+        self.assertEqual(resources.get_stats(), {"hits": 1, "misses": 2, "fonts": 2, "icons": 0})
+
+    def test_icons_are_loaded_once(self):
+        resources = ResourceCache()
+        icon = resources.get_icon(self._config.today_sunrise_icon)
+        self.assertEqual(icon.mode, "1")
+        self.assertIs(resources.get_icon(self._config.today_sunrise_icon), icon)
+        self.assertEqual(resources.get_stats(), {"hits": 1, "misses": 1, "fonts": 0, "icons": 1})
+
+    def test_warm_up_loads_resources_of_the_frame(self):
+        resources = ResourceCache()
+        opened = self._opened(CalendarFrameDraw([], self._config, REFERENCE, resources=resources).warm_up)
+        self.assertIn(self._config.calendar_font_date_bold, opened)
+        self.assertIn(self._config.today_sunrise_icon, opened)
+        self.assertIn(self._config.tasklist_event_long_icon_through, opened)
+        stats = resources.get_stats()
+
+        # Drawing needs nothing more
+        self.assertEqual(self._opened(lambda: self._draw(resources)), [])
+        self.assertEqual(resources.get_stats()["misses"], stats["misses"])
+        self.assertGreater(resources.get_stats()["hits"], stats["hits"])
+
+    def test_second_render_opens_no_files(self):
+        resources = ResourceCache()
+        frames = []
+        self.assertTrue(self._opened(lambda: frames.append(self._draw(resources))))
+        self.assertEqual(self._opened(lambda: frames.append(self._draw(resources))), [])
+        self.assertEqual(
+            [image.tobytes() for image in frames[1].get_images()],
+            [image.tobytes() for image in frames[0].get_images()])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from dateutil import tz
+from suntime import Sun
+from calendarframe.SunTable import SunTable
+
+COORDINATES = (50.05432853424836, 19.93845258591673)
+
+
+def _trend_by_suntime(function, date, days):
+    # Direction of sunrise/sunset as the frame computed it with suntime, from local times of following days
+    first = function(date, local_time_zone=tz.tzlocal())
+    for i in range(days):
+        test = function(first + datetime.timedelta(days=i), local_time_zone=tz.tzlocal()) - datetime.timedelta(days=i)
+        if test < first:
+            return -1
+        elif test > first:
+            return 1
+    return 0
+
+
+class SunTableTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_times_match_suntime(self):
+        table = SunTable(*COORDINATES)
+        sun = Sun(*COORDINATES)
+        for date in (datetime.date(2021, 1, 1), datetime.date(2021, 6, 21), datetime.date(2021, 12, 31)):
+            self.assertEqual(table.get_local_sunrise_time(date), sun.get_local_sunrise_time(date).replace(
+                microsecond=0, tzinfo=tz.tzlocal()))
+            self.assertEqual(table.get_local_sunset_time(date), sun.get_local_sunset_time(date).replace(
+                microsecond=0, tzinfo=tz.tzlocal()))
+
+    def test_saved_table_is_not_computed_again(self):
+        date = datetime.date(2021, 12, 22)
+        with mock.patch.object(SunTable, "_compute", autospec=True, side_effect=SunTable._compute) as compute:
+            sunrise = SunTable(*COORDINATES, cache_dir=self._directory).get_local_sunrise_time(date)
+            self.assertEqual(SunTable(*COORDINATES, cache_dir=self._directory).get_local_sunrise_time(date), sunrise)
+        self.assertEqual(compute.call_count, 1)
+
+    def test_shared_table_is_computed_once(self):
+        first = SunTable.shared(*COORDINATES, cache_dir=self._directory)
+        self.assertIs(SunTable.shared(*COORDINATES, cache_dir=self._directory), first)
+        self.assertIsNot(SunTable.shared(COORDINATES[0], 0.0, cache_dir=self._directory), first)
+
+        date = datetime.date(2030, 3, 1)
+        with mock.patch.object(SunTable, "_compute", autospec=True, side_effect=SunTable._compute) as compute:
+            threads = [threading.Thread(target=first.get_local_sunset_time, args=(date,)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(compute.call_count, 1)
+
+    def test_trend_includes_change_of_the_clock(self):
+        previous_tz = os.environ.get("TZ")
+        os.environ["TZ"] = "Europe/Warsaw"
+        time.tzset()
+        try:
+            table = SunTable(*COORDINATES)
+            sun = Sun(*COORDINATES)
+            # Clock moves forward on 2021-03-28, and back on 2021-10-31
+            for first in (datetime.date(2021, 3, 20), datetime.date(2021, 10, 23)):
+                for date in (first + datetime.timedelta(days=i) for i in range(10)):
+                    with self.subTest(date=date):
+                        self.assertEqual(
+                            table.get_sunrise_trend(date, 5),
+                            _trend_by_suntime(sun.get_local_sunrise_time, date, 5))
+                        self.assertEqual(
+                            table.get_sunset_trend(date, 5),
+                            _trend_by_suntime(sun.get_local_sunset_time, date, 5))
+            # Sunrises get earlier in March, but the day before the change it's an hour later
+            self.assertEqual(table.get_sunrise_trend(datetime.date(2021, 3, 26), 5), -1)
+            self.assertEqual(table.get_sunrise_trend(datetime.date(2021, 3, 27), 5), 1)
+        finally:
+            if previous_tz is None:
+                del os.environ["TZ"]
+            else:
+                os.environ["TZ"] = previous_tz
+            time.tzset()
+
+
+if __name__ == "__main__":
+    unittest.main()
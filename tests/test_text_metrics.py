@@ -0,0 +1,68 @@
+import random
+import unittest
+from calendarframe.TextMetrics import TextMetrics
+
+
+class _Font:
+    path = "fake.ttf"
+    size = 10
+
+    def __init__(self):
+        self.measured = 0
+
+    def getsize(self, text):
+        # Characters have different widths, like in a proportional font
+        self.measured += 1
+        return sum(3 + ord(character) % 7 for character in text), self.size
+
+
+def _fit_by_scanning(font, text, width, ellipsis="…"):
+    if font.getsize(text)[0] <= width:
+        return text
+    for length in range(len(text) - 1, -1, -1):
+        fitted = text[:length].rstrip() + ellipsis
+        if font.getsize(fitted)[0] <= width:
+            return fitted
+    return ""
+
+
+class TextMetricsTest(unittest.TestCase):
+    def test_fit_to_width_matches_scanning(self):
+        rng = random.Random(11)
+        font = _Font()
+        metrics = TextMetrics()
+        for _ in range(500):
+            text = "".join(rng.choice("abcdefghij klmnopWM") for _ in range(rng.randint(0, 30)))
+            width = rng.randint(0, 200)
+            with self.subTest(text=text, width=width):
+                self.assertEqual(metrics.fit_to_width(font, text, width), _fit_by_scanning(font, text, width))
+
+    def test_fit_to_width(self):
+        font = _Font()
+        metrics = TextMetrics()
+        self.assertEqual(metrics.fit_to_width(font, "abc", 100), "abc")
+        fitted = metrics.fit_to_width(font, "Meeting with the team", 80)
+        self.assertTrue(fitted.endswith("…"))
+        self.assertLessEqual(font.getsize(fitted)[0], 80)
+        # Spaces before the ellipsis are dropped
+        self.assertEqual(metrics.fit_to_width(font, "ab cd", font.getsize("ab …")[0]), "ab…")
+        self.assertEqual(metrics.fit_to_width(font, "abc", 1), "")
+
+    def test_sizes_are_measured_once(self):
+        font = _Font()
+        metrics = TextMetrics(max_entries=2)
+        sizes = [metrics.get_size(font, text) for text in ("a", "b", "a", "a")]
+        self.assertEqual(font.measured, 2)
+        self.assertEqual(sizes, [font.getsize(text) for text in ("a", "b", "a", "a")])
+        self.assertEqual(metrics.get_stats(), {"hits": 2, "misses": 2, "sizes": 2})
+
+        # Least recently used size is dropped
+        metrics.get_size(font, "c")
+        metrics.get_size(font, "a")
+        self.assertEqual(metrics.get_stats()["misses"], 3)
+        metrics.get_size(font, "b")
+        self.assertEqual(metrics.get_stats()["misses"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()